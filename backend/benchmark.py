@@ -0,0 +1,388 @@
+"""
+End-to-end Sync Benchmark
+Measures pull -> SQLite -> push throughput against the in-process mock servers
+
+Starts mock_server (San Beda) and mock_yahshua_server on free local ports,
+runs PullService.pull_data and PushService.push_data against a temporary
+database and reports records per second, request latency percentiles, time
+spent in Database calls, peak memory and the number of connections the
+servers accepted. Results can be saved as a baseline and compared later.
+
+Usage:
+    python benchmark.py --employees 200 --days 7 --latency 0.05
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json
+"""
+
+import argparse
+import contextlib
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer
+
+import requests
+
+import mock_server
+import mock_yahshua_server
+from database import Database
+from services.pull_service import PullService
+from services.push_service import PushService
+from services.transport import close_transport
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Metrics compared against a baseline: name -> True if higher is better
+COMPARED_METRICS = {
+    'pull_records_per_sec': True,
+    'push_records_per_sec': True,
+    'end_to_end_records_per_sec': True,
+    'request_latency_p50_ms': False,
+    'request_latency_p95_ms': False,
+    'db_seconds': False,
+    'peak_python_mb': False,
+    'connections_opened': False
+}
+
+
+class CountingServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that counts accepted connections"""
+
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+        self._count_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class LatencyRecorder:
+    """Collects client-side request durations"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+@contextlib.contextmanager
+def record_requests(recorder):
+    """Time every requests.Session.send while active"""
+    original_send = requests.Session.send
+
+    def timed_send(session, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original_send(session, request, **kwargs)
+        finally:
+            recorder.add(time.perf_counter() - started)
+
+    requests.Session.send = timed_send
+    try:
+        yield
+    finally:
+        requests.Session.send = original_send
+
+
+def time_async_requests(pull_service, recorder):
+    """Time the async engine's requests and page fetches"""
+    def wrap(obj, name):
+        original = getattr(obj, name)
+
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                recorder.add(time.perf_counter() - started)
+
+        setattr(obj, name, timed)
+
+    wrap(pull_service.engine, 'request')
+    wrap(pull_service, 'fetch_page')
+
+
+def time_database_calls(database):
+    """
+    Wrap the public Database methods of one instance to accumulate their time
+
+    Returns:
+        dict: {'seconds': float, 'calls': int}, updated as calls happen
+    """
+    totals = {'seconds': 0.0, 'calls': 0}
+    lock = threading.Lock()
+
+    for name, method in inspect.getmembers(database, inspect.ismethod):
+        if name.startswith('_') or name == 'get_connection':
+            continue
+
+        def make_timed(original):
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    with lock:
+                        totals['seconds'] += time.perf_counter() - started
+                        totals['calls'] += 1
+            return timed
+
+        setattr(database, name, make_timed(method))
+
+    return totals
+
+
+def start_server(handler):
+    server = CountingServer(('localhost', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_benchmark(employees=100, days=3, latency=0.05, engine='threaded', max_in_flight=4, compression='none'):
+    """
+    Run one pull + push cycle against fresh mock servers and a temp database
+
+    Returns:
+        dict: Metrics (see COMPARED_METRICS) plus run parameters and counts
+    """
+    mock_server.MOCK_EMPLOYEES = [
+        {"code": f"EMP{i:05d}", "name": f"Employee {i:05d}"} for i in range(1, employees + 1)
+    ]
+    mock_server.LATENCY_MIN = mock_server.LATENCY_MAX = latency
+    mock_yahshua_server.LATENCY_MIN = mock_yahshua_server.LATENCY_MAX = latency
+    mock_yahshua_server.reset_state()
+
+    san_beda = start_server(mock_server.MockSanBedaHandler)
+    yahshua = start_server(mock_yahshua_server.MockYahshuaHandler)
+
+    db_dir = tempfile.mkdtemp(prefix='sanbeda-bench-')
+    database = Database(os.path.join(db_dir, 'benchmark.db'))
+    database.update_api_config(
+        pull_host=f"localhost:{san_beda.server_address[1]}",
+        pull_username='system',
+        pull_password='test123',
+        push_url=f"http://localhost:{yahshua.server_address[1]}/api",
+        push_username='benchmark',
+        push_password='benchmark',
+        push_max_in_flight=max_in_flight,
+        push_compression=compression
+    )
+    db_totals = time_database_calls(database)
+
+    recorder = LatencyRecorder()
+    sync_engine = None
+    if engine == 'async':
+        from services.async_engine import AsyncSyncEngine, AsyncPullService, AsyncPushService
+        sync_engine = AsyncSyncEngine()
+        pull_service = AsyncPullService(database, sync_engine)
+        push_service = AsyncPushService(database, sync_engine)
+        time_async_requests(pull_service, recorder)
+    else:
+        pull_service = PullService(database)
+        push_service = PushService(database)
+
+    date_to = datetime.now() - timedelta(days=2)
+    date_from = date_to - timedelta(days=days - 1)
+
+    tracemalloc.start()
+    try:
+        # The mock servers print every request
+        with record_requests(recorder), contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            pull_ok, pull_message, pull_stats = pull_service.pull_data(
+                date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d"), force=True
+            )
+            pulled_at = time.perf_counter()
+            push_ok, push_message, push_stats = push_service.push_data()
+            finished = time.perf_counter()
+        _, peak_python = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        if sync_engine:
+            sync_engine.stop()
+        close_transport()
+        san_beda.shutdown()
+        yahshua.shutdown()
+        # Benchmark database and its generated client key
+        pull_service.auth_service.forget_client_key_secret()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    pull_seconds = pulled_at - started
+    push_seconds = finished - pulled_at
+    records_pulled = pull_stats.get('processed', 0)
+    records_pushed = push_stats.get('success', 0)
+
+    def per_sec(count, seconds):
+        return round(count / seconds, 1) if seconds > 0 else None
+
+    def ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+    return {
+        'params': {
+            'employees': employees,
+            'days': days,
+            'latency': latency,
+            'engine': engine,
+            'max_in_flight': max_in_flight,
+            'compression': compression
+        },
+        'pull_ok': pull_ok,
+        'pull_message': pull_message,
+        'push_ok': push_ok,
+        'push_message': push_message,
+        'records_pulled': records_pulled,
+        'records_pushed': records_pushed,
+        'pull_seconds': round(pull_seconds, 3),
+        'push_seconds': round(push_seconds, 3),
+        'pull_records_per_sec': per_sec(records_pulled, pull_seconds),
+        'push_records_per_sec': per_sec(records_pushed, push_seconds),
+        'end_to_end_records_per_sec': per_sec(records_pushed, finished - started),
+        'requests': len(recorder.samples),
+        'request_latency_p50_ms': ms(recorder.percentile(50)),
+        'request_latency_p95_ms': ms(recorder.percentile(95)),
+        'db_seconds': round(db_totals['seconds'], 3),
+        'db_calls': db_totals['calls'],
+        'peak_python_mb': round(peak_python / (1024 * 1024), 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'connections_opened': san_beda.connections + yahshua.connections
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """
+    Compare metrics with a baseline result
+
+    Returns:
+        tuple: (rows: list of (metric, baseline, current, change %, regressed), regressions: int)
+    """
+    rows = []
+    regressions = 0
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old = baseline.get(metric)
+        new = result.get(metric)
+        if old in (None, 0) or new is None:
+            rows.append((metric, old, new, None, False))
+            continue
+        change = (new - old) / old * 100
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        regressions += regressed
+        rows.append((metric, old, new, round(change, 1), regressed))
+    return rows, regressions
+
+
+def print_report(result, comparison=None):
+    params = result['params']
+    print("=" * 60)
+    print(f"Sync benchmark: {params['employees']} employees x {params['days']} days, "
+          f"{params['latency'] * 1000:.0f} ms latency, {params['engine']} engine")
+    print("=" * 60)
+    print(f"Pull: {result['records_pulled']} records in {result['pull_seconds']}s "
+          f"({result['pull_records_per_sec']} rec/s) - {result['pull_message']}")
+    print(f"Push: {result['records_pushed']} logs in {result['push_seconds']}s "
+          f"({result['push_records_per_sec']} rec/s) - {result['push_message']}")
+    print(f"End to end: {result['end_to_end_records_per_sec']} rec/s")
+    print(f"Requests: {result['requests']} (p50 {result['request_latency_p50_ms']} ms, "
+          f"p95 {result['request_latency_p95_ms']} ms), connections opened: {result['connections_opened']}")
+    print(f"Database: {result['db_seconds']}s in {result['db_calls']} calls")
+    print(f"Memory: peak Python {result['peak_python_mb']} MB, peak RSS {result['peak_rss_mb']} MB")
+
+    if comparison:
+        print("-" * 60)
+        print(f"{'metric':32} {'baseline':>10} {'current':>10} {'change':>8}")
+        for metric, old, new, change, regressed in comparison:
+            change_str = f"{change:+.1f}%" if change is not None else "n/a"
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{metric:32} {str(old):>10} {str(new):>10} {change_str:>8}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pull/push throughput benchmark")
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help="Mock server latency per request (seconds)")
+    parser.add_argument('--engine', choices=['threaded', 'async'], default='threaded')
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--compression', choices=['none', 'gzip'], default='none')
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="Write this run's result as a baseline JSON")
+    parser.add_argument('--tolerance', type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument('--json', action='store_true', help="Print the result as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    result = run_benchmark(
+        employees=args.employees,
+        days=args.days,
+        latency=args.latency,
+        engine=args.engine,
+        max_in_flight=args.max_in_flight,
+        compression=args.compression
+    )
+
+    comparison = None
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != result['params']:
+            print(f"Warning: baseline was recorded with different parameters: {baseline.get('params')}")
+        comparison, regressions = compare_to_baseline(result, baseline, args.tolerance)
+        result['regressions'] = regressions
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, comparison)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
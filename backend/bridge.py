@@ -10,7 +10,8 @@ import os
 import sys
 import tempfile
 from datetime import datetime
-import threading
+
+from services.job_coordinator import JobCoordinator
 
 logger = logging.getLogger(__name__)
 
@@ -35,11 +36,14 @@ class Bridge(QObject):
         self.pull_service = pull_service
         self.push_service = push_service
         self.scheduler = scheduler
+        # Manual and scheduled syncs share one coordinator (one pull and one push at a time)
+        self.coordinator = scheduler.coordinator if scheduler else JobCoordinator()
         logger.info("Bridge initialized")
 
     def set_scheduler(self, scheduler):
         """Set the scheduler reference (called after scheduler is created)"""
         self.scheduler = scheduler
+        self.coordinator = scheduler.coordinator
 
     # ==================== TIMESHEET METHODS ====================
 
@@ -67,7 +71,7 @@ class Bridge(QObject):
     def getUnsyncedTimesheets(self, limit=100):
         """Get unsynced timesheets"""
         try:
-            timesheets = self.database.get_unsynced_timesheets(limit)
+            timesheets = self.database.get_unsynced_timesheets(limit, include_deferred=True)
             return json.dumps({"success": True, "data": timesheets})
         except Exception as e:
             logger.error(f"Error getting unsynced timesheets: {e}")
@@ -77,12 +81,13 @@ class Bridge(QObject):
     def retryFailedTimesheet(self, timesheet_id):
         """Retry syncing a failed timesheet"""
         try:
-            # Clear error message to retry
+            # Clear error message and retry deferral so the next push picks it up
             conn = self.database.get_connection()
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE timesheet
-                SET sync_error_message = NULL
+                SET sync_error_message = NULL,
+                    next_retry_at = NULL
                 WHERE id = ?
             """, (timesheet_id,))
             conn.commit()
@@ -92,6 +97,66 @@ class Bridge(QObject):
             logger.error(f"Error retrying timesheet: {e}")
             return json.dumps({"success": False, "error": str(e)})
 
+    @pyqtSlot(int, int, result=str)
+    def getDeadLetters(self, limit=1000, offset=0):
+        """Get timesheets YAHSHUA rejected permanently (not pushed until requeued)"""
+        try:
+            timesheets, total = self.database.get_dead_letter_timesheets(limit, offset)
+            return json.dumps({"success": True, "data": timesheets, "total": total})
+        except Exception as e:
+            logger.error(f"Error getting dead letters: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    @pyqtSlot(str, bool, result=str)
+    def requeueDeadLetters(self, ids_json, all_records=False):
+        """
+        Put dead-lettered timesheets back in the push queue
+
+        Args:
+            ids_json: JSON list of timesheet ids (an empty list changes nothing)
+            all_records: Apply to every dead letter instead (ids_json is ignored)
+        """
+        try:
+            if all_records:
+                ids = None
+            else:
+                ids = json.loads(ids_json) if ids_json else []
+                if not isinstance(ids, list):
+                    raise Exception("Expected a JSON list of timesheet ids")
+                if not ids:
+                    return json.dumps({"success": True, "count": 0})
+            count = self.database.requeue_dead_letters(ids)
+            logger.info(f"Requeued {count} dead-lettered timesheets")
+            return json.dumps({"success": True, "count": count})
+        except Exception as e:
+            logger.error(f"Error requeuing dead letters: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    @pyqtSlot(str, bool, result=str)
+    def discardDeadLetters(self, ids_json, all_records=False):
+        """
+        Discard dead-lettered timesheets for good
+
+        Args:
+            ids_json: JSON list of timesheet ids (an empty list changes nothing)
+            all_records: Apply to every dead letter instead (ids_json is ignored)
+        """
+        try:
+            if all_records:
+                ids = None
+            else:
+                ids = json.loads(ids_json) if ids_json else []
+                if not isinstance(ids, list):
+                    raise Exception("Expected a JSON list of timesheet ids")
+                if not ids:
+                    return json.dumps({"success": True, "count": 0})
+            count = self.database.discard_dead_letters(ids)
+            logger.info(f"Discarded {count} dead-lettered timesheets")
+            return json.dumps({"success": True, "count": count})
+        except Exception as e:
+            logger.error(f"Error discarding dead letters: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
     @pyqtSlot(str, str, bool, result=str)
     def clearTimesheets(self, date_from, date_to, only_synced=True):
         """Clear timesheet records within a date range"""
@@ -116,6 +181,9 @@ class Bridge(QObject):
             conn.commit()
             conn.close()
 
+            # Removed days must be fully re-ingested on the next pull
+            self.database.delete_day_fingerprints(date_from, date_to)
+
             filter_text = "synced " if only_synced else ""
             logger.info(f"Cleared {deleted_count} {filter_text}timesheet records from {date_from} to {date_to}")
             return json.dumps({
@@ -141,9 +209,13 @@ class Bridge(QObject):
 
     # ==================== SYNC METHODS ====================
 
-    @pyqtSlot(str, str, result=str)
-    def startPullSync(self, date_from, date_to):
-        """Manually trigger pull sync from San Beda with date range (runs in background thread)"""
+    @pyqtSlot(str, str, bool, result=str)
+    def startPullSync(self, date_from, date_to, force=False):
+        """
+        Manually trigger pull sync from San Beda with date range (runs in background thread)
+
+        force re-ingests closed days even when unchanged since the last pull.
+        """
         # Check if pull is configured
         token = self.database.get_login_token()
         if not token:
@@ -152,31 +224,105 @@ class Bridge(QObject):
                 "error": "Pull not configured. Go to Configuration and click Reconnect."
             })
 
-        logger.info(f"Manual pull sync triggered from UI: {date_from} to {date_to}")
+        logger.info(f"Manual pull sync triggered from UI: {date_from} to {date_to} (force={force})")
 
-        # Start pull in background thread
-        def run_pull():
-            try:
-                # Progress callback to emit updates to frontend
-                def on_progress(progress_dict):
-                    logger.info(f"Pull progress: {progress_dict}")
-                    self.syncProgressUpdated.emit(json.dumps(progress_dict))
+        job = self._start_pull_thread(date_from, date_to, force=force)
 
-                success, message, stats = self.pull_service.pull_data(
-                    date_from, date_to, progress_callback=on_progress
-                )
+        # Return immediately - results will come via signals
+        return json.dumps({"success": True, "message": self._job_message("Pull", job), "job": job.as_dict()})
 
-                result = {
-                    "success": success,
-                    "message": message,
-                    "stats": stats
+    @pyqtSlot(result=str)
+    def getResumablePull(self):
+        """Get the most recent interrupted pull that can be resumed (run is null if none)"""
+        try:
+            run = self.pull_service.get_resumable_run()
+            if run:
+                run = {
+                    "run_id": run['run_id'],
+                    "date_from": run['date_from'],
+                    "date_to": run['date_to'],
+                    "last_page": run['last_page'],
+                    "total": run['total'],
+                    "page_size": run['page_size'],
+                    "updated_at": str(run['updated_at'])
                 }
+            return json.dumps({"success": True, "run": run})
+        except Exception as e:
+            logger.error(f"Error getting resumable pull: {e}")
+            return json.dumps({"success": False, "error": str(e)})
 
-                # Emit signal to update UI
-                self.syncCompleted.emit(json.dumps({
-                    "type": "pull",
-                    "result": result
-                }))
+    @pyqtSlot(result=str)
+    def resumePullSync(self):
+        """Resume the most recent interrupted pull from its checkpoint (runs in background thread)"""
+        try:
+            run = self.pull_service.get_resumable_run()
+            if not run:
+                return json.dumps({"success": False, "error": "No interrupted pull to resume"})
+
+            logger.info(
+                f"Resuming pull {run['run_id']} from page {run['last_page'] + 1}: "
+                f"{run['date_from']} to {run['date_to']}"
+            )
+            job = self._start_pull_thread(run['date_from'], run['date_to'])
+
+            return json.dumps({
+                "success": True,
+                "message": f"Pull resumed from page {run['last_page'] + 1}" if job.status == 'running'
+                else self._job_message("Pull", job),
+                "job": job.as_dict()
+            })
+        except Exception as e:
+            logger.error(f"Error resuming pull: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    def _job_message(self, label, job):
+        if job.status == 'running':
+            return f"{label} sync started"
+        return f"{label} sync already running, this request will run right after it"
+
+    def _start_pull_thread(self, date_from, date_to, force=False):
+        """
+        Run a pull in a background thread, reporting through the sync signals
+
+        Returns:
+            JobHandle: The pull job (queued behind a running pull if there is one)
+        """
+        # Progress callback to emit updates to frontend
+        def on_progress(progress_dict):
+            logger.info(f"Pull progress: {progress_dict}")
+            self.syncProgressUpdated.emit(json.dumps(progress_dict))
+
+        def on_done(success, message, stats):
+            if success and self.scheduler:
+                self.scheduler.notify_pull_completed(stats)
+
+            result = {
+                "success": success,
+                "message": message,
+                "stats": stats
+            }
+
+            # Emit signal to update UI
+            self.syncCompleted.emit(json.dumps({
+                "type": "pull",
+                "result": result
+            }))
+            return success, message, stats
+
+        if hasattr(self.pull_service, 'submit_pull'):
+            # Async engine: the job finishes from the pull's completion callback
+            def submit_pull(cancel_token=None):
+                return self.pull_service.submit_pull(
+                    date_from, date_to, progress_callback=on_progress, force=force, cancel_token=cancel_token,
+                    on_done=on_done
+                )
+            return self.coordinator.submit('pull', submit_pull, trigger='manual', background=False)
+
+        def run_pull(cancel_token=None):
+            try:
+                return on_done(*self.pull_service.pull_data(
+                    date_from, date_to, progress_callback=on_progress, force=force, cancel_token=cancel_token
+                ))
 
             except Exception as e:
                 logger.error(f"Error in pull sync thread: {e}")
@@ -184,39 +330,38 @@ class Bridge(QObject):
                     "type": "pull",
                     "result": {"success": False, "error": str(e)}
                 }))
+                return False, str(e), {}
 
-        thread = threading.Thread(target=run_pull, daemon=True)
-        thread.start()
-
-        # Return immediately - results will come via signals
-        return json.dumps({"success": True, "message": "Pull sync started"})
+        return self.coordinator.submit('pull', run_pull, trigger='manual')
 
     @pyqtSlot(result=str)
     def startPushSync(self):
         """Manually trigger push sync to cloud payroll (runs in background thread)"""
         logger.info("Manual push sync triggered from UI")
 
-        # Start push in background thread
-        def run_push():
-            try:
-                # Progress callback to emit updates to frontend
-                def on_progress(progress_dict):
-                    logger.info(f"Emitting progress: {progress_dict}")
-                    self.syncProgressUpdated.emit(json.dumps(progress_dict))
+        # Progress callback to emit updates to frontend
+        def on_progress(progress_dict):
+            logger.info(f"Emitting progress: {progress_dict}")
+            self.syncProgressUpdated.emit(json.dumps(progress_dict))
 
-                success, message, stats = self.push_service.push_data(progress_callback=on_progress)
+        def on_done(success, message, stats):
+            result = {
+                "success": success,
+                "message": message,
+                "stats": stats
+            }
 
-                result = {
-                    "success": success,
-                    "message": message,
-                    "stats": stats
-                }
+            # Emit signal to update UI
+            self.syncCompleted.emit(json.dumps({
+                "type": "push",
+                "result": result
+            }))
+            return success, message, stats
 
-                # Emit signal to update UI
-                self.syncCompleted.emit(json.dumps({
-                    "type": "push",
-                    "result": result
-                }))
+        # Start push in background thread
+        def run_push(cancel_token=None):
+            try:
+                return on_done(*self.push_service.push_data(progress_callback=on_progress, cancel_token=cancel_token))
 
             except Exception as e:
                 logger.error(f"Error in push sync thread: {e}")
@@ -224,12 +369,67 @@ class Bridge(QObject):
                     "type": "push",
                     "result": {"success": False, "error": str(e)}
                 }))
-
-        thread = threading.Thread(target=run_push, daemon=True)
-        thread.start()
+                return False, str(e), {}
+
+        # One push at a time: a push already running gets one follow-up run
+        if hasattr(self.push_service, 'submit_push'):
+            # Async engine: the job finishes from the push's completion callback
+            def submit_push(cancel_token=None):
+                return self.push_service.submit_push(
+                    progress_callback=on_progress, cancel_token=cancel_token, on_done=on_done
+                )
+            job = self.coordinator.submit('push', submit_push, trigger='manual', background=False)
+        else:
+            job = self.coordinator.submit('push', run_push, trigger='manual')
 
         # Return immediately - results will come via signals
-        return json.dumps({"success": True, "message": "Push sync started"})
+        return json.dumps({"success": True, "message": self._job_message("Push", job), "job": job.as_dict()})
+
+    @pyqtSlot(result=str)
+    def getSyncJobs(self):
+        """Get running, queued and recent pull/push jobs"""
+        try:
+            status = self.scheduler.get_job_status() if self.scheduler else self.coordinator.get_status()
+            return json.dumps({"success": True, "data": status}, default=str)
+        except Exception as e:
+            logger.error(f"Error getting sync jobs: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    @pyqtSlot(str, result=str)
+    def getSyncJob(self, job_id):
+        """Get the status and result of one pull/push job by id"""
+        try:
+            job = self.coordinator.get_job(job_id)
+            if not job:
+                return json.dumps({"success": False, "error": "Job not found"})
+            return json.dumps({"success": True, "data": job.as_dict()}, default=str)
+        except Exception as e:
+            logger.error(f"Error getting sync job: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    @pyqtSlot(str, result=str)
+    def cancelSyncJob(self, job_id):
+        """
+        Cancel a pull/push job by id
+
+        A queued job is dropped; a running one stops after the page or
+        batches in flight and keeps what it committed. Poll getSyncJob for
+        the final state ('cancelled' once it has stopped).
+        """
+        try:
+            job = self.coordinator.cancel(job_id)
+            if not job:
+                return json.dumps({"success": False, "error": "Job not found"})
+            if job.done and job.status != 'cancelled':
+                message = f"{job.kind.capitalize()} sync already finished"
+            elif job.done:
+                message = f"{job.kind.capitalize()} sync cancelled"
+            else:
+                message = f"{job.kind.capitalize()} sync stopping after the current step"
+            return json.dumps({"success": True, "message": message, "data": job.as_dict()}, default=str)
+        except Exception as e:
+            logger.error(f"Error cancelling sync job: {e}")
+            return json.dumps({"success": False, "error": str(e)})
 
     @pyqtSlot(result=str)
     def getSyncLogs(self):
@@ -260,6 +460,7 @@ class Bridge(QObject):
                 # Push login state - include token existence and user info
                 config['push_token_exists'] = bool(config.get('push_token'))
                 config['push_token'] = '***' if config.get('push_token') else None
+                config.pop('client_key_secret', None)
                 # Format datetime for display
                 if config.get('push_token_created_at'):
                     try:
@@ -285,7 +486,17 @@ class Bridge(QObject):
                 'pull_host', 'pull_username', 'pull_password',
                 'push_url', 'push_auth_type', 'push_credentials',
                 'push_username', 'push_password',
-                'pull_interval_minutes', 'push_interval_minutes'
+                'pull_interval_minutes', 'push_interval_minutes',
+                'sync_engine', 'push_max_in_flight', 'push_max_payload_kb',
+                'push_permanent_error_codes', 'push_compression',
+                'pull_rate_limit', 'pull_rate_burst', 'push_rate_limit', 'push_rate_burst',
+                'push_on_pull', 'push_backlog_threshold', 'push_debounce_seconds',
+                'http_connect_timeout', 'http_read_timeout',
+                'pull_token_lifetime_minutes', 'push_token_lifetime_minutes',
+                'connectivity_checks', 'adaptive_intervals',
+                'pull_interval_min_minutes', 'pull_interval_max_minutes',
+                'push_interval_min_minutes', 'push_interval_max_minutes',
+                'maintenance_enabled', 'maintenance_time', 'maintenance_window_minutes'
             ]
 
             for field in allowed_fields:
@@ -357,7 +568,7 @@ class Bridge(QObject):
         """Logout from YAHSHUA Payroll (clear token)"""
         try:
             logger.info("Logging out from YAHSHUA")
-            self.database.update_push_token(None)
+            self.push_service.invalidate_token()
 
             # Log the logout
             self.database.log_config_change("YAHSHUA logout")
@@ -399,6 +610,30 @@ class Bridge(QObject):
             logger.error(f"Error triggering cleanup: {e}")
             return json.dumps({"success": False, "error": str(e)})
 
+    @pyqtSlot(result=str)
+    def triggerMaintenance(self):
+        """Manually trigger database maintenance (ANALYZE, vacuum, checkpoint, quick_check)"""
+        try:
+            if self.scheduler:
+                self.scheduler.trigger_maintenance_now()
+                return json.dumps({"success": True, "message": "Database maintenance triggered"})
+            else:
+                return json.dumps({"success": False, "error": "Scheduler not initialized"})
+        except Exception as e:
+            logger.error(f"Error triggering maintenance: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
+    @pyqtSlot(result=str)
+    def getConnectivityStatus(self):
+        """Get the reachability of the San Beda and YAHSHUA hosts and any deferred syncs"""
+        try:
+            if not self.scheduler:
+                return json.dumps({"success": False, "error": "Scheduler not initialized"})
+            return json.dumps({"success": True, "data": self.scheduler.get_connectivity_status()})
+        except Exception as e:
+            logger.error(f"Error getting connectivity status: {e}")
+            return json.dumps({"success": False, "error": str(e)})
+
     def emit_sync_status(self, status_dict):
         """Emit sync status update to JavaScript"""
         self.syncStatusUpdated.emit(json.dumps(status_dict))
@@ -7,7 +7,7 @@ import sqlite3
 import json
 import sys
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import logging
 
@@ -144,6 +144,66 @@ class Database:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_sync_logs_status ON sync_logs(status)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_sync_logs_started ON sync_logs(started_at)")
 
+            # Day fingerprints (skip re-ingesting unchanged closed days on re-pull)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS day_fingerprints (
+                    source TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    record_count INTEGER DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (source, date)
+                )
+            """)
+
+            # Pull checkpoints (resume interrupted multi-page pulls)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pull_checkpoints (
+                    run_id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    date_from TEXT NOT NULL,
+                    date_to TEXT NOT NULL,
+                    page_size INTEGER NOT NULL,
+                    last_page INTEGER DEFAULT 0,
+                    total INTEGER,
+                    status TEXT NOT NULL DEFAULT 'running' CHECK(status IN ('running', 'completed', 'expired')),
+                    created_at DATETIME NOT NULL,
+                    updated_at DATETIME NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_pull_checkpoints_status ON pull_checkpoints(status)")
+
+            # Push ledger: one row per batch sent to YAHSHUA, keyed by the random
+            # Idempotency-Key it was sent with; the fingerprint of its log entries
+            # tells whether the same batch can still be replayed under that key
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS push_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    fingerprint TEXT NOT NULL,
+                    sync_ids TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'sent' CHECK(status IN ('sent', 'committed', 'failed', 'in_doubt', 'superseded')),
+                    attempts INTEGER DEFAULT 0,
+                    records_synced INTEGER,
+                    records_failed INTEGER,
+                    last_error TEXT,
+                    created_at DATETIME NOT NULL,
+                    updated_at DATETIME NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_push_ledger_status ON push_ledger(status)")
+
+            # Scheduler state per recurring job, so schedules survive restarts
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_state (
+                    job_key TEXT PRIMARY KEY,
+                    last_run DATETIME,
+                    next_run DATETIME,
+                    updated_at DATETIME NOT NULL
+                )
+            """)
+
             # API configuration table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS api_config (
@@ -215,6 +275,153 @@ class Database:
             except:
                 pass
 
+            # Push retry scheduling: attempts so far and when a failed record may be pushed again
+            try:
+                cursor.execute("ALTER TABLE timesheet ADD COLUMN push_attempts INTEGER DEFAULT 0")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE timesheet ADD COLUMN next_retry_at DATETIME")
+            except:
+                pass
+            # Times YAHSHUA rejected the record itself (logs_not_sync), which decides dead-lettering
+            try:
+                cursor.execute("ALTER TABLE timesheet ADD COLUMN push_rejections INTEGER DEFAULT 0")
+            except:
+                pass
+            # Dead letter: set when YAHSHUA permanently rejects a record (excluded from pushes)
+            try:
+                cursor.execute("ALTER TABLE timesheet ADD COLUMN dead_lettered_at DATETIME")
+            except:
+                pass
+
+            # Sync engine selection ('threaded' or 'async'), read at startup
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN sync_engine TEXT DEFAULT 'threaded'")
+            except:
+                pass
+
+            # Maximum YAHSHUA batches in flight during a push (1 = sequential)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_max_in_flight INTEGER DEFAULT 4")
+            except:
+                pass
+
+            # Comma-separated YAHSHUA error codes that dead-letter a rejected record
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_permanent_error_codes TEXT")
+            except:
+                pass
+
+            # Request body compression for pushes ('none' or 'gzip')
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_compression TEXT DEFAULT 'none'")
+            except:
+                pass
+
+            # Push batch size learned by the adaptive batcher, and its payload ceiling
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_batch_size INTEGER")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_max_payload_kb INTEGER DEFAULT 256")
+            except:
+                pass
+
+            # HTTP timeouts in seconds (read timeout NULL = per-request default)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN http_connect_timeout REAL DEFAULT 5")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN http_read_timeout REAL")
+            except:
+                pass
+
+            # Adaptive sync intervals: push follows the backlog, pull the
+            # hourly attendance activity, within these bounds (minutes).
+            # Opt-in, so upgraded installs keep their configured intervals
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN adaptive_intervals INTEGER DEFAULT 0")
+            except:
+                pass
+            for column, default in (('pull_interval_min_minutes', 5), ('pull_interval_max_minutes', 60),
+                                    ('push_interval_min_minutes', 2), ('push_interval_max_minutes', 60)):
+                try:
+                    cursor.execute(f"ALTER TABLE api_config ADD COLUMN {column} INTEGER DEFAULT {default}")
+                except:
+                    pass
+
+            # Defer scheduled syncs while an upstream host is unreachable
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN connectivity_checks INTEGER DEFAULT 1")
+            except:
+                pass
+
+            # Nightly database maintenance (ANALYZE, vacuum, checkpoint, quick_check)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN maintenance_enabled INTEGER DEFAULT 1")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN maintenance_time TEXT DEFAULT '03:00'")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN maintenance_window_minutes INTEGER DEFAULT 120")
+            except:
+                pass
+
+            # Token lifetimes in minutes; tokens are refreshed shortly before
+            # they end (NULL = keep a token until the server rejects it)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN pull_token_lifetime_minutes INTEGER")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_token_lifetime_minutes INTEGER")
+            except:
+                pass
+
+            # Key for the encrypted client RSA key cache (see AuthService)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN client_key_secret TEXT")
+            except:
+                pass
+
+            # Event-driven push: push soon after a pull inserts rows or the backlog grows
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_on_pull INTEGER DEFAULT 1")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_backlog_threshold INTEGER DEFAULT 200")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_debounce_seconds INTEGER DEFAULT 10")
+            except:
+                pass
+
+            # Client-side rate limits per upstream host (requests/second, 0 = unlimited)
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN pull_rate_limit REAL DEFAULT 5")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN pull_rate_burst INTEGER DEFAULT 10")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_rate_limit REAL DEFAULT 5")
+            except:
+                pass
+            try:
+                cursor.execute("ALTER TABLE api_config ADD COLUMN push_rate_burst INTEGER DEFAULT 10")
+            except:
+                pass
+
             # Migration: Update sync_logs table to allow 'other' sync_type
             # Check if we need to migrate by trying to insert and rollback
             try:
@@ -252,6 +459,39 @@ class Database:
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_sync_logs_started ON sync_logs(started_at)")
                 logger.info("sync_logs table migration completed")
 
+            # Migration: key push_ledger rows by idempotency key instead of fingerprint
+            cursor.execute("PRAGMA table_info(push_ledger)")
+            if 'idempotency_key' not in [col['name'] for col in cursor.fetchall()]:
+                logger.info("Migrating push_ledger table to per-batch idempotency keys")
+                cursor.execute("ALTER TABLE push_ledger RENAME TO push_ledger_old")
+                cursor.execute("""
+                    CREATE TABLE push_ledger (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        idempotency_key TEXT NOT NULL UNIQUE,
+                        fingerprint TEXT NOT NULL,
+                        sync_ids TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'sent' CHECK(status IN ('sent', 'committed', 'failed', 'in_doubt', 'superseded')),
+                        attempts INTEGER DEFAULT 0,
+                        records_synced INTEGER,
+                        records_failed INTEGER,
+                        last_error TEXT,
+                        created_at DATETIME NOT NULL,
+                        updated_at DATETIME NOT NULL
+                    )
+                """)
+                # Earlier rows were sent with their fingerprint as the key
+                cursor.execute("""
+                    INSERT INTO push_ledger (id, idempotency_key, fingerprint, sync_ids, payload, status, attempts,
+                        records_synced, records_failed, last_error, created_at, updated_at)
+                    SELECT id, fingerprint, fingerprint, sync_ids, payload, status, attempts,
+                        records_synced, records_failed, last_error, created_at, updated_at
+                    FROM push_ledger_old
+                """)
+                cursor.execute("DROP TABLE push_ledger_old")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_push_ledger_status ON push_ledger(status)")
+                logger.info("push_ledger table migration completed")
+
             # Insert default config if not exists
             cursor.execute("SELECT COUNT(*) as count FROM api_config WHERE id = 1")
             if cursor.fetchone()['count'] == 0:
@@ -292,11 +532,111 @@ class Database:
         finally:
             conn.close()
 
-    def get_unsynced_timesheets(self, limit=100):
-        """Get timesheet entries that need to be pushed to backend"""
+    def ingest_attendance(self, entries):
+        """
+        Bulk-insert normalized attendance records in one transaction
+
+        Creates missing employees (looked up by employee_code) and inserts the
+        IN/OUT timesheet entries, ignoring sync_ids that already exist.
+
+        Args:
+            entries: List of NormalizedAttendance from services.normalize
+
+        Returns:
+            dict: {'entries': IN/OUT entries written or already present,
+                   'inserted': new timesheet rows,
+                   'employees_created': new employee rows}
+        """
+        result = {'entries': 0, 'inserted': 0, 'employees_created': 0}
+        if not entries:
+            return result
+
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
+            # Resolve employee ids for every code on the page
+            names = {}
+            for entry in entries:
+                names.setdefault(entry.employee_code, entry.employee_name)
+
+            employee_ids = self._get_employee_ids_by_code(cursor, list(names))
+
+            missing = [code for code in names if code not in employee_ids]
+            if missing:
+                employee_rows = []
+                for code in missing:
+                    # Use backend_id as integer if possible, otherwise None
+                    try:
+                        backend_id = int(code)
+                    except ValueError:
+                        backend_id = None
+                    employee_rows.append((backend_id, names[code], code, None))
+
+                cursor.executemany("""
+                    INSERT INTO employee (backend_id, name, employee_code, employee_number)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(backend_id) DO UPDATE SET
+                        name = excluded.name,
+                        employee_code = excluded.employee_code,
+                        employee_number = excluded.employee_number
+                """, employee_rows)
+                result['employees_created'] = len(missing)
+                employee_ids.update(self._get_employee_ids_by_code(cursor, missing))
+                logger.info(f"Created {len(missing)} employees")
+
+            # Build IN/OUT timesheet rows
+            rows = []
+            for entry in entries:
+                employee_id = employee_ids[entry.employee_code]
+                if entry.sync_id_in:
+                    rows.append((entry.sync_id_in, employee_id, 'in', entry.date, entry.sign_in))
+                if entry.sync_id_out:
+                    rows.append((entry.sync_id_out, employee_id, 'out', entry.date, entry.sign_out))
+
+            changes_before = conn.total_changes
+            cursor.executemany("""
+                INSERT OR IGNORE INTO timesheet (sync_id, employee_id, log_type, date, time, photo_path, status)
+                VALUES (?, ?, ?, ?, ?, NULL, 'success')
+            """, rows)
+            conn.commit()
+
+            result['entries'] = len(rows)
+            result['inserted'] = conn.total_changes - changes_before
+            return result
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error ingesting attendance: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def _get_employee_ids_by_code(self, cursor, codes):
+        """Map employee codes to local employee ids (chunked IN queries)"""
+        ids = {}
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            cursor.execute(
+                f"SELECT id, employee_code FROM employee WHERE employee_code IN ({placeholders})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                ids.setdefault(row['employee_code'], row['id'])
+        return ids
+
+    def get_unsynced_timesheets(self, limit=100, include_deferred=False):
+        """
+        Get timesheet entries that need to be pushed to backend
+
+        Dead-lettered and discarded records are never returned. Records
+        deferred after a failed push are left out until their next_retry_at
+        unless include_deferred is set. Records with fewer failed attempts
+        come first.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            retry_before = datetime.max if include_deferred else datetime.now()
             cursor.execute("""
                 SELECT t.*, e.backend_id as employee_backend_id, e.name as employee_name,
                        e.employee_code as employee_code
@@ -304,13 +644,56 @@ class Database:
                 JOIN employee e ON t.employee_id = e.id
                 WHERE t.backend_timesheet_id IS NULL
                 AND t.status = 'success'
-                ORDER BY t.created_at ASC
+                AND t.dead_lettered_at IS NULL
+                AND (t.next_retry_at IS NULL OR t.next_retry_at <= ?)
+                ORDER BY COALESCE(t.push_attempts, 0) ASC, t.created_at ASC
                 LIMIT ?
-            """, (limit,))
+            """, (retry_before, limit))
             return [dict(row) for row in cursor.fetchall()]
         finally:
             conn.close()
 
+    def count_unsynced_timesheets(self):
+        """Count timesheet entries get_unsynced_timesheets would return now (no limit)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) FROM timesheet
+                WHERE backend_timesheet_id IS NULL
+                AND status = 'success'
+                AND dead_lettered_at IS NULL
+                AND (next_retry_at IS NULL OR next_retry_at <= ?)
+            """, (datetime.now(),))
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    def get_hourly_activity(self, days=14):
+        """
+        Count attendance logs per hour of day over the last `days` days
+
+        Returns:
+            list: 24 counts, index = hour of day
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+            cursor.execute("""
+                SELECT CAST(substr(time, 1, 2) AS INTEGER) AS hour, COUNT(*)
+                FROM timesheet
+                WHERE date >= ?
+                GROUP BY hour
+            """, (since,))
+            counts = [0] * 24
+            for hour, count in cursor.fetchall():
+                if hour is not None and 0 <= hour < 24:
+                    counts[hour] = count
+            return counts
+        finally:
+            conn.close()
+
     def mark_timesheet_synced(self, timesheet_id, backend_timesheet_id):
         """Mark a timesheet entry as successfully synced"""
         conn = self.get_connection()
@@ -320,7 +703,8 @@ class Database:
                 UPDATE timesheet
                 SET backend_timesheet_id = ?,
                     synced_at = ?,
-                    sync_error_message = NULL
+                    sync_error_message = NULL,
+                    next_retry_at = NULL
                 WHERE id = ?
             """, (backend_timesheet_id, datetime.now(), timesheet_id))
             conn.commit()
@@ -331,16 +715,24 @@ class Database:
         finally:
             conn.close()
 
-    def mark_timesheet_sync_failed(self, timesheet_id, error_message):
-        """Mark a timesheet sync as failed"""
+    def mark_timesheet_sync_failed(self, timesheet_id, error_message, next_retry_at=None, rejected=False):
+        """
+        Mark a timesheet sync as failed, counting the attempt and deferring it until next_retry_at
+
+        rejected is set when YAHSHUA turned down the record itself (rather
+        than the whole batch failing), which is also counted in push_rejections.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("""
                 UPDATE timesheet
-                SET sync_error_message = ?
+                SET sync_error_message = ?,
+                    push_attempts = COALESCE(push_attempts, 0) + 1,
+                    push_rejections = COALESCE(push_rejections, 0) + ?,
+                    next_retry_at = ?
                 WHERE id = ?
-            """, (error_message, timesheet_id))
+            """, (error_message, 1 if rejected else 0, next_retry_at, timesheet_id))
             conn.commit()
         except Exception as e:
             conn.rollback()
@@ -349,6 +741,117 @@ class Database:
         finally:
             conn.close()
 
+    def mark_timesheet_dead_lettered(self, timesheet_id, error_message):
+        """Move a permanently rejected timesheet to the dead letter state"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE timesheet
+                SET sync_error_message = ?,
+                    push_attempts = COALESCE(push_attempts, 0) + 1,
+                    push_rejections = COALESCE(push_rejections, 0) + 1,
+                    next_retry_at = NULL,
+                    dead_lettered_at = ?
+                WHERE id = ?
+            """, (error_message, datetime.now(), timesheet_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error dead-lettering timesheet: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_dead_letter_timesheets(self, limit=1000, offset=0):
+        """
+        Get dead-lettered timesheet entries, newest first
+
+        Returns:
+            tuple: (rows: list of dict, total: int)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) FROM timesheet
+                WHERE dead_lettered_at IS NOT NULL AND status = 'success'
+            """)
+            total = cursor.fetchone()[0]
+
+            cursor.execute("""
+                SELECT t.*, e.name as employee_name, e.employee_code
+                FROM timesheet t
+                JOIN employee e ON t.employee_id = e.id
+                WHERE t.dead_lettered_at IS NOT NULL AND t.status = 'success'
+                ORDER BY t.dead_lettered_at DESC, t.id DESC
+                LIMIT ? OFFSET ?
+            """, (limit, offset))
+            return [dict(row) for row in cursor.fetchall()], total
+        finally:
+            conn.close()
+
+    def requeue_dead_letters(self, timesheet_ids=None):
+        """
+        Return dead-lettered timesheets to the push queue with fresh attempt and rejection counts
+
+        Args:
+            timesheet_ids: Ids to requeue, or None for all dead letters
+
+        Returns:
+            int: Number of records requeued
+        """
+        return self._update_dead_letters("""
+            UPDATE timesheet
+            SET dead_lettered_at = NULL,
+                next_retry_at = NULL,
+                push_attempts = 0,
+                push_rejections = 0,
+                sync_error_message = NULL
+            WHERE dead_lettered_at IS NOT NULL AND status = 'success'
+        """, timesheet_ids)
+
+    def discard_dead_letters(self, timesheet_ids=None):
+        """
+        Discard dead-lettered timesheets for good (kept, but never pushed)
+
+        Args:
+            timesheet_ids: Ids to discard, or None for all dead letters
+
+        Returns:
+            int: Number of records discarded
+        """
+        return self._update_dead_letters("""
+            UPDATE timesheet
+            SET status = 'discarded'
+            WHERE dead_lettered_at IS NOT NULL AND status = 'success'
+        """, timesheet_ids)
+
+    def _update_dead_letters(self, query, timesheet_ids=None):
+        """Run a dead-letter UPDATE for all dead letters or only the given ids"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if timesheet_ids is None:
+                cursor.execute(query)
+                count = cursor.rowcount
+            else:
+                count = 0
+                ids = list(timesheet_ids)
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f"{query} AND id IN ({placeholders})", chunk)
+                    count += cursor.rowcount
+            conn.commit()
+            return count
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error updating dead letters: {e}")
+            raise
+        finally:
+            conn.close()
+
     def get_timesheet_stats(self):
         """Get statistics about timesheet entries"""
         conn = self.get_connection()
@@ -358,8 +861,11 @@ class Database:
                 SELECT
                     COUNT(*) as total,
                     SUM(CASE WHEN backend_timesheet_id IS NOT NULL THEN 1 ELSE 0 END) as synced,
-                    SUM(CASE WHEN backend_timesheet_id IS NULL THEN 1 ELSE 0 END) as pending,
-                    SUM(CASE WHEN sync_error_message IS NOT NULL THEN 1 ELSE 0 END) as errors
+                    SUM(CASE WHEN backend_timesheet_id IS NULL AND dead_lettered_at IS NULL
+                             AND status = 'success' THEN 1 ELSE 0 END) as pending,
+                    SUM(CASE WHEN sync_error_message IS NOT NULL THEN 1 ELSE 0 END) as errors,
+                    SUM(CASE WHEN dead_lettered_at IS NOT NULL AND status = 'success' THEN 1 ELSE 0 END) as dead_lettered,
+                    SUM(CASE WHEN status = 'discarded' THEN 1 ELSE 0 END) as discarded
                 FROM timesheet
             """)
             return dict(cursor.fetchone())
@@ -382,6 +888,315 @@ class Database:
         finally:
             conn.close()
 
+    # ==================== DAY FINGERPRINT METHODS ====================
+
+    def get_day_fingerprints(self, source, date_from, date_to):
+        """Get stored day fingerprints for a source as {date: fingerprint}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT date, fingerprint FROM day_fingerprints
+                WHERE source = ? AND date >= ? AND date <= ?
+            """, (source, date_from, date_to))
+            return {row['date']: row['fingerprint'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def save_day_fingerprint(self, source, date, fingerprint, record_count):
+        """Store the fingerprint of a fully ingested day"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO day_fingerprints (source, date, fingerprint, record_count, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(source, date) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    record_count = excluded.record_count,
+                    updated_at = excluded.updated_at
+            """, (source, date, fingerprint, record_count, datetime.now()))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error saving day fingerprint: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def delete_day_fingerprints(self, date_from=None, date_to=None, source=None):
+        """
+        Delete day fingerprints so those days are fully re-ingested on next pull
+
+        Must be called whenever local timesheet rows for a day are removed.
+        Both dates are inclusive; omitted bounds are open.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            clauses = []
+            values = []
+            if date_from:
+                clauses.append("date >= ?")
+                values.append(date_from)
+            if date_to:
+                clauses.append("date <= ?")
+                values.append(date_to)
+            if source:
+                clauses.append("source = ?")
+                values.append(source)
+
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            cursor.execute(f"DELETE FROM day_fingerprints {where}", values)
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error deleting day fingerprints: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # ==================== PULL CHECKPOINT METHODS ====================
+
+    def create_pull_checkpoint(self, run_id, source, date_from, date_to, page_size):
+        """Create a checkpoint for a new pull run"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            now = datetime.now()
+            cursor.execute("""
+                INSERT INTO pull_checkpoints (run_id, source, date_from, date_to, page_size,
+                    last_page, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 0, 'running', ?, ?)
+            """, (run_id, source, date_from, date_to, page_size, now, now))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error creating pull checkpoint: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def update_pull_checkpoint(self, run_id, last_page=None, total=None, status=None):
+        """Record progress (last committed page, total) or final status of a pull run"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            fields = {'updated_at': datetime.now()}
+            if last_page is not None:
+                fields['last_page'] = last_page
+            if total is not None:
+                fields['total'] = total
+            if status is not None:
+                fields['status'] = status
+
+            set_clauses = ', '.join(f"{key} = ?" for key in fields)
+            cursor.execute(
+                f"UPDATE pull_checkpoints SET {set_clauses} WHERE run_id = ?",
+                list(fields.values()) + [run_id]
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error updating pull checkpoint: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_running_pull_checkpoints(self, source=None):
+        """Get unfinished pull checkpoints, most recently updated first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if source:
+                cursor.execute("""
+                    SELECT * FROM pull_checkpoints
+                    WHERE status = 'running' AND source = ?
+                    ORDER BY updated_at DESC
+                """, (source,))
+            else:
+                cursor.execute("""
+                    SELECT * FROM pull_checkpoints
+                    WHERE status = 'running'
+                    ORDER BY updated_at DESC
+                """)
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def prune_pull_checkpoints(self, days=7):
+        """Delete finished checkpoints older than the given number of days"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                DELETE FROM pull_checkpoints
+                WHERE status != 'running'
+                AND updated_at < datetime('now', 'localtime', ?)
+            """, (f"-{int(days)} days",))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error pruning pull checkpoints: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # ==================== SCHEDULE STATE METHODS ====================
+
+    def get_schedule_state(self):
+        """Get stored scheduler state as {job_key: {'last_run', 'next_run'}}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT job_key, last_run, next_run FROM schedule_state")
+            return {row['job_key']: {'last_run': row['last_run'], 'next_run': row['next_run']}
+                    for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def save_schedule_state(self, job_key, next_run, last_run=None):
+        """Store a job's next run time, and its last run time if given"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO schedule_state (job_key, last_run, next_run, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(job_key) DO UPDATE SET
+                    last_run = COALESCE(excluded.last_run, schedule_state.last_run),
+                    next_run = excluded.next_run,
+                    updated_at = excluded.updated_at
+            """, (job_key, last_run, next_run, datetime.now()))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error saving schedule state: {e}")
+            raise
+        finally:
+            conn.close()
+
+    # ==================== PUSH LEDGER METHODS ====================
+
+    def create_push_batch(self, idempotency_key, fingerprint, log_list):
+        """Record a new batch about to be sent under a new idempotency key"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            now = datetime.now()
+            cursor.execute("""
+                INSERT INTO push_ledger (idempotency_key, fingerprint, sync_ids, payload, status, attempts,
+                    created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'sent', 1, ?, ?)
+            """, (
+                idempotency_key,
+                fingerprint,
+                json.dumps([entry.get('sync_id') for entry in log_list]),
+                json.dumps(log_list),
+                now, now
+            ))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error recording push batch: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def record_push_batch_resent(self, idempotency_key):
+        """
+        Count another send of an open ('sent' or 'in_doubt') batch under its key
+
+        Returns:
+            bool: False if the batch is no longer open (it got a definite
+                  outcome), in which case it must not be sent under this key
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE push_ledger
+                SET status = 'sent', attempts = attempts + 1, updated_at = ?
+                WHERE idempotency_key = ? AND status IN ('sent', 'in_doubt')
+            """, (datetime.now(), idempotency_key))
+            conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error recording push batch: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def record_push_batch_outcome(self, idempotency_key, status, records_synced=None, records_failed=None,
+                                  error=None):
+        """
+        Record how a sent batch ended ('committed', 'failed', 'in_doubt' or 'superseded')
+
+        Only open batches are updated: a committed, failed or superseded
+        batch keeps its outcome.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE push_ledger
+                SET status = ?, records_synced = ?, records_failed = ?, last_error = ?, updated_at = ?
+                WHERE idempotency_key = ? AND status IN ('sent', 'in_doubt')
+            """, (status, records_synced, records_failed, error, datetime.now(), idempotency_key))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error recording push batch outcome: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def get_open_push_batches(self):
+        """
+        Get batches whose outcome is unknown: in doubt after a timeout, or
+        still 'sent' because the app stopped before the answer was recorded
+
+        Returns:
+            list: Ledger rows with payload decoded to the original log_list
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT * FROM push_ledger
+                WHERE status IN ('sent', 'in_doubt')
+                ORDER BY created_at ASC
+            """)
+            rows = []
+            for row in cursor.fetchall():
+                row = dict(row)
+                row['payload'] = json.loads(row['payload'])
+                rows.append(row)
+            return rows
+        finally:
+            conn.close()
+
+    def prune_push_ledger(self, days=30):
+        """Delete ledger rows not updated for the given number of days"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                DELETE FROM push_ledger
+                WHERE updated_at < datetime('now', 'localtime', ?)
+            """, (f"-{int(days)} days",))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error pruning push ledger: {e}")
+            raise
+        finally:
+            conn.close()
+
     # ==================== EMPLOYEE METHODS ====================
 
     def add_or_update_employee(self, backend_id, name, employee_code=None, employee_number=None):
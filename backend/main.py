@@ -316,8 +316,8 @@ class IntegrationApp:
             self.app.processEvents()
 
             # Initialize services
-            self.pull_service = PullService(self.database)
-            self.push_service = PushService(self.database)
+            self.sync_engine = None
+            self.create_services()
 
             # Initialize bridge
             self.bridge = Bridge(self.database, self.pull_service, self.push_service)
@@ -353,6 +353,25 @@ class IntegrationApp:
             self.splash.close()
             raise
 
+    def create_services(self):
+        """Create pull/push services for the configured sync engine"""
+        config = self.database.get_api_config() or {}
+
+        if config.get('sync_engine') == 'async':
+            try:
+                from services.async_engine import AsyncSyncEngine, AsyncPullService, AsyncPushService
+
+                self.sync_engine = AsyncSyncEngine()
+                self.pull_service = AsyncPullService(self.database, self.sync_engine)
+                self.push_service = AsyncPushService(self.database, self.sync_engine)
+                logger.info("Using async sync engine")
+                return
+            except ImportError as e:
+                logger.warning(f"Async sync engine unavailable ({e}), using threaded services")
+
+        self.pull_service = PullService(self.database)
+        self.push_service = PushService(self.database)
+
     def start_http_server(self):
         """Start local HTTP server for serving frontend files"""
         def run_server():
@@ -3,7 +3,7 @@ Mock San Beda Server for Testing
 Simulates the on-premise timekeeping API responses
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import json
 import random
 import time
@@ -26,6 +26,9 @@ VALID_TOKEN = None
 
 
 class MockSanBedaHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real server
+    protocol_version = 'HTTP/1.1'
+
     def log_message(self, format, *args):
         print(f"[MockServer] {format % args}")
 
@@ -35,18 +38,23 @@ class MockSanBedaHandler(BaseHTTPRequestHandler):
         print(f"[MockServer] Simulating {delay:.1f}s latency...")
         time.sleep(delay)
 
-    def send_json(self, data, status=200):
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
 
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Subject-Token')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_GET(self):
@@ -102,29 +110,22 @@ class MockSanBedaHandler(BaseHTTPRequestHandler):
             random_key = hashlib.md5(str(datetime.now()).encode()).hexdigest()[:16]
             print(f"[MockServer] Step 1: Sending challenge with randomKey={random_key}")
 
-            self.send_response(401)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            self.send_json({
                 "randomKey": random_key,
                 "realm": "BRMS",
                 "encryptType": "MD5"
-            }).encode())
+            }, 401)
         else:
             # Step 2: Validate signature and return token
             VALID_TOKEN = hashlib.md5(str(datetime.now()).encode()).hexdigest()
             print(f"[MockServer] Step 2: Auth successful, token={VALID_TOKEN[:16]}...")
 
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('X-Subject-Token', VALID_TOKEN)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Expose-Headers', 'X-Subject-Token')
-            self.end_headers()
-            self.wfile.write(json.dumps({
+            self.send_json({
                 "token": VALID_TOKEN
-            }).encode())
+            }, headers={
+                'X-Subject-Token': VALID_TOKEN,
+                'Access-Control-Expose-Headers': 'X-Subject-Token'
+            })
 
     def handle_attendance(self, params):
         """Generate mock attendance records"""
@@ -151,13 +152,16 @@ class MockSanBedaHandler(BaseHTTPRequestHandler):
             date_str = current_date.strftime("%Y-%m-%d")
 
             for emp in MOCK_EMPLOYEES:
+                # Seed per employee and day so re-pulls return the same records
+                rng = random.Random(f"{date_str}-{emp['code']}")
+
                 # Random IN time between 7:30 and 9:00
-                in_hour = random.randint(7, 8)
-                in_min = random.randint(0, 59)
+                in_hour = rng.randint(7, 8)
+                in_min = rng.randint(0, 59)
 
                 # Random OUT time between 17:00 and 19:00
-                out_hour = random.randint(17, 19)
-                out_min = random.randint(0, 59)
+                out_hour = rng.randint(17, 19)
+                out_min = rng.randint(0, 59)
 
                 records.append({
                     "code": emp["code"],
@@ -190,7 +194,8 @@ class MockSanBedaHandler(BaseHTTPRequestHandler):
 
 
 def run_mock_server(port=8080):
-    server = HTTPServer(('localhost', port), MockSanBedaHandler)
+    # Threaded so concurrent page requests from the async engine overlap
+    server = ThreadingHTTPServer(('localhost', port), MockSanBedaHandler)
     print(f"=" * 50)
     print(f"Mock San Beda Server running on http://localhost:{port}")
     print(f"=" * 50)
@@ -0,0 +1,310 @@
+"""
+Mock YAHSHUA Payroll Server for Testing
+Simulates the YAHSHUA login and sync-time-in-out endpoints
+
+Point the app at it by setting the push URL (api_config.push_url) to
+http://localhost:8081/api. Latency, error rates and limits below can be
+changed here or from the command line to load-test pushes offline.
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import gzip
+import json
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+# Simulated latency in seconds per request (adjust as needed)
+LATENCY_MIN = 0.2
+LATENCY_MAX = 0.8
+
+# Extra latency per log in a sync request (larger batches take longer)
+LATENCY_PER_LOG = 0.002
+
+# Fraction of sync requests answered with a batch-level error (HTTP 500)
+ERROR_RATE = 0.0
+
+# Fraction of sync requests answered with HTTP 429 (throttled)
+THROTTLE_RATE = 0.0
+
+# Retry-After header sent with throttled responses (None = no header)
+THROTTLE_RETRY_AFTER = 1
+
+# Fraction of logs rejected individually in logs_not_sync (invalid data)
+RECORD_REJECT_RATE = 0.0
+
+# Employee codes YAHSHUA does not know (always rejected)
+UNKNOWN_EMPLOYEES = set()
+
+# Largest log_list accepted per request; larger ones get HTTP 400
+MAX_LOGS_PER_REQUEST = 1000
+
+# Seconds a token stays valid (None = never expires)
+TOKEN_TTL_SECONDS = None
+
+# Accepted credentials (None = any non-empty username and password)
+VALID_CREDENTIALS = None
+
+# Whether gzip-compressed request bodies are accepted (False answers 415)
+ACCEPT_GZIP = True
+
+# Issued tokens -> issue time
+TOKENS = {}
+
+# sync_ids already stored (re-sent logs succeed again without duplicating)
+SYNCED_IDS = set()
+
+# Idempotency-Key -> (status, response) of requests already processed
+IDEMPOTENT_RESPONSES = {}
+
+# Fraction of sync requests that are stored but answered too late (client timeout)
+COMMIT_THEN_TIMEOUT_RATE = 0.0
+COMMIT_THEN_TIMEOUT_SECONDS = 65
+
+# Counters for load tests
+STATS = {
+    'auth_requests': 0,
+    'sync_requests': 0,
+    'logs_received': 0,
+    'logs_synced': 0,
+    'logs_rejected': 0,
+    'duplicates': 0,
+    'idempotent_replays': 0,
+    'bytes_wire': 0,
+    'bytes_decoded': 0
+}
+
+_lock = threading.Lock()
+
+
+def reset_state():
+    """Forget tokens, stored logs and counters"""
+    with _lock:
+        TOKENS.clear()
+        SYNCED_IDS.clear()
+        IDEMPOTENT_RESPONSES.clear()
+        for key in STATS:
+            STATS[key] = 0
+
+
+class MockYahshuaHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real server
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        print(f"[MockYahshua] {format % args}")
+
+    def simulate_latency(self, log_count=0):
+        """Add random delay to simulate cloud latency"""
+        time.sleep(random.uniform(LATENCY_MIN, LATENCY_MAX) + log_count * LATENCY_PER_LOG)
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_body(json.dumps(data).encode(), status, {'Content-Type': 'application/json', **(headers or {})})
+
+    def send_body(self, body, status, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        """Read the request body, decompressing it if it was sent gzipped"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(content_length) if content_length > 0 else b''
+
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            if not ACCEPT_GZIP:
+                return raw, None
+            return raw, gzip.decompress(raw)
+        return raw, raw
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+
+        raw, body = self.read_body()
+        if body is None:
+            self.send_body(b'Unsupported Media Type', 415)
+            return
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            self.send_body(b'Malformed request body', 400)
+            return
+
+        if path.endswith('/api-auth/'):
+            self.handle_auth(data, parse_qs(parsed.query))
+        elif path.endswith('/sync-time-in-out/'):
+            with _lock:
+                STATS['bytes_wire'] += len(raw)
+                STATS['bytes_decoded'] += len(body)
+            self.handle_sync(data)
+        else:
+            self.send_json({"message": "Not found"}, 404)
+
+    def handle_auth(self, data, query):
+        """Log in with credentials from the body (or query string)"""
+        self.simulate_latency()
+
+        username = data.get('username') or query.get('username', [''])[0]
+        password = data.get('password') or query.get('password', [''])[0]
+
+        with _lock:
+            STATS['auth_requests'] += 1
+
+        if VALID_CREDENTIALS is not None:
+            valid = (username, password) == VALID_CREDENTIALS
+        else:
+            valid = bool(username and password)
+
+        if not valid:
+            self.send_json({"message": "Invalid credentials"}, 401)
+            return
+
+        token = hashlib.sha1(f"{username}-{datetime.now()}-{random.random()}".encode()).hexdigest()
+        with _lock:
+            TOKENS[token] = time.time()
+
+        print(f"[MockYahshua] Auth successful for {username}, token={token[:12]}...")
+        self.send_json({
+            "token": token,
+            "user_logged": username,
+            "company_name": "Mock Company"
+        })
+
+    def token_valid(self):
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Token '):
+            return False
+        with _lock:
+            issued = TOKENS.get(auth[6:])
+        if issued is None:
+            return False
+        if TOKEN_TTL_SECONDS is not None and time.time() - issued > TOKEN_TTL_SECONDS:
+            with _lock:
+                TOKENS.pop(auth[6:], None)
+            return False
+        return True
+
+    def handle_sync(self, data):
+        """Store logs, rejecting unknown employees and some invalid records"""
+        log_list = data.get('log_list', [])
+        self.simulate_latency(len(log_list))
+
+        if not self.token_valid():
+            self.send_json({"detail": "Invalid token."}, 401)
+            return
+
+        with _lock:
+            STATS['sync_requests'] += 1
+            STATS['logs_received'] += len(log_list)
+
+        roll = random.random()
+        if roll < THROTTLE_RATE:
+            headers = {'Retry-After': str(THROTTLE_RETRY_AFTER)} if THROTTLE_RETRY_AFTER is not None else None
+            self.send_json({"detail": "Request was throttled."}, 429, headers)
+            return
+        if roll < THROTTLE_RATE + ERROR_RATE:
+            self.send_json({"message": "Internal server error"}, 500)
+            return
+
+        # A repeated Idempotency-Key gets the stored answer without storing again
+        idempotency_key = self.headers.get('Idempotency-Key')
+        with _lock:
+            cached = IDEMPOTENT_RESPONSES.get(idempotency_key) if idempotency_key else None
+            if cached:
+                STATS['idempotent_replays'] += 1
+        if cached:
+            print(f"[MockYahshua] Replaying stored answer for idempotency key {idempotency_key[:12]}...")
+            self.send_json(cached[1], cached[0], {'Idempotent-Replayed': 'true'})
+            return
+
+        if len(log_list) > MAX_LOGS_PER_REQUEST:
+            self.send_json({"message": f"Too many logs in one request (max {MAX_LOGS_PER_REQUEST})"}, 400)
+            return
+
+        synced = []
+        not_synced = []
+        for log in log_list:
+            if log.get('employee') in UNKNOWN_EMPLOYEES:
+                not_synced.append({"id": log.get('id'), "reason": "Employee not found", "error_code": 404})
+            elif not log.get('date') or not log.get('log_time') or random.random() < RECORD_REJECT_RATE:
+                not_synced.append({"id": log.get('id'), "reason": "Invalid log data", "error_code": 422})
+            else:
+                synced.append(log.get('id'))
+                with _lock:
+                    if log.get('sync_id') in SYNCED_IDS:
+                        STATS['duplicates'] += 1
+                    SYNCED_IDS.add(log.get('sync_id'))
+
+        with _lock:
+            STATS['logs_synced'] += len(synced)
+            STATS['logs_rejected'] += len(not_synced)
+
+        print(f"[MockYahshua] Sync request: {len(synced)} synced, {len(not_synced)} rejected")
+
+        # Nothing stored: YAHSHUA answers 400 with the rejections
+        status = 400 if log_list and not synced else 200
+        response = {
+            "logs_successfully_sync": synced,
+            "logs_not_sync": not_synced
+        }
+        if idempotency_key:
+            with _lock:
+                IDEMPOTENT_RESPONSES[idempotency_key] = (status, response)
+
+        if random.random() < COMMIT_THEN_TIMEOUT_RATE:
+            # Stored, but the client gives up before the answer arrives
+            time.sleep(COMMIT_THEN_TIMEOUT_SECONDS)
+        self.send_json(response, status)
+
+
+def run_mock_server(port=8081):
+    server = ThreadingHTTPServer(('localhost', port), MockYahshuaHandler)
+    print(f"=" * 50)
+    print(f"Mock YAHSHUA Server running on http://localhost:{port}/api")
+    print(f"=" * 50)
+    print(f"\nConfigure the app with:")
+    print(f"  Push URL: http://localhost:{port}/api")
+    print(f"  Username/Password: any")
+    print(f"\nPress Ctrl+C to stop\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down mock server...")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mock YAHSHUA Payroll server")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-min', type=float, default=LATENCY_MIN)
+    parser.add_argument('--latency-max', type=float, default=LATENCY_MAX)
+    parser.add_argument('--error-rate', type=float, default=ERROR_RATE)
+    parser.add_argument('--throttle-rate', type=float, default=THROTTLE_RATE)
+    parser.add_argument('--reject-rate', type=float, default=RECORD_REJECT_RATE)
+    parser.add_argument('--max-logs', type=int, default=MAX_LOGS_PER_REQUEST)
+    parser.add_argument('--token-ttl', type=float, default=TOKEN_TTL_SECONDS)
+    parser.add_argument('--commit-timeout-rate', type=float, default=COMMIT_THEN_TIMEOUT_RATE)
+    parser.add_argument('--no-gzip', action='store_true')
+    args = parser.parse_args()
+
+    LATENCY_MIN = args.latency_min
+    LATENCY_MAX = args.latency_max
+    ERROR_RATE = args.error_rate
+    THROTTLE_RATE = args.throttle_rate
+    RECORD_REJECT_RATE = args.reject_rate
+    MAX_LOGS_PER_REQUEST = args.max_logs
+    TOKEN_TTL_SECONDS = args.token_ttl
+    COMMIT_THEN_TIMEOUT_RATE = args.commit_timeout_rate
+    ACCEPT_GZIP = not args.no_gzip
+
+    run_mock_server(args.port)
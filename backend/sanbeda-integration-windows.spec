@@ -26,10 +26,15 @@ a = Analysis(
         'PyQt6.QtWebEngineCore',
         'PyQt6.QtWebChannel',
         'requests',
-        'schedule',
         'Crypto',
         'Crypto.PublicKey',
         'Crypto.PublicKey.RSA',
+        # OS credential store for the client key cache (backends load at runtime)
+        'keyring',
+        'keyring.backends.Windows',
+        # ijson picks its backend at runtime
+        'ijson.backends.yajl2_c',
+        'ijson.backends.python',
     ],
     hookspath=[],
     hooksconfig={},
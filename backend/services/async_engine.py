@@ -0,0 +1,848 @@
+"""
+San Beda Integration Tool - Async Sync Engine
+asyncio-based alternative to the threaded pull/push services.
+
+All HTTP traffic for pull, push and auth runs on one event loop thread, so
+many pages and batches can be in flight without a thread per request.
+Database calls are handed to worker threads (asyncio.to_thread) so they do
+not hold up the loop.
+
+The Async*Service classes keep the synchronous pull_data/push_data interface
+of the services they extend. Bridge and SyncScheduler start runs with
+submit_pull/submit_push instead: the coordinated job finishes from the run's
+completion callback, with no thread blocked waiting for it.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+import aiohttp
+
+from .auth_service import AuthService
+from .cancellation import CancellationToken
+from .json_stream import PageRecordStream, STREAM_CHUNK_SIZE
+from .fingerprints import DayFingerprintTracker
+from .payload import COMPRESSION_NONE, COMPRESSION_GZIP, encode_payload, is_compression_rejected
+from .pull_service import PullService
+from .rate_limit import get_bucket
+from .transport import (
+    DEFAULT_HEADERS, POOL_CONNECTIONS_PER_HOST, IDLE_CONNECTION_SECONDS,
+    get_timeouts, transport_metrics, url_host
+)
+from .push_service import (
+    BatchPipeline, PushService, YAHSHUA_LOGIN_PATH, YAHSHUA_SYNC_PATH, transport_failure
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent attendance page requests per pull
+MAX_CONCURRENT_PAGES = 4
+
+
+class AsyncResponse:
+    """Fully read HTTP response returned by AsyncSyncEngine.request"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncSyncEngine:
+    """Owns the event loop thread and the shared aiohttp session"""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread (idempotent)"""
+        with self._lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self._started.clear()
+            self.thread = threading.Thread(target=self._run_loop, name="async-sync-engine", daemon=True)
+            self.thread.start()
+        self._started.wait()
+        logger.info("Async sync engine started")
+
+    def stop(self):
+        """Close the HTTP session and stop the event loop"""
+        if not self.loop or not self.thread:
+            return
+        if self.session:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(timeout=5)
+            self.session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.thread = None
+        logger.info("Async sync engine stopped")
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def submit(self, coro, on_done=None):
+        """
+        Schedule a coroutine on the engine loop without blocking
+
+        Args:
+            coro: Coroutine returning a tuple (e.g. pull_data_async)
+            on_done: Optional callable(*result), run in a worker thread when
+                     the coroutine has finished. The Future then resolves
+                     with its return value; if that is another Future (a
+                     follow-up run), with that Future's result.
+
+        Returns:
+            concurrent.futures.Future: Resolves with the coroutine result
+        """
+        self.start()
+        if on_done is not None:
+            coro = self._then(coro, on_done)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _then(self, coro, on_done):
+        result = await asyncio.to_thread(on_done, *(await coro))
+        if isinstance(result, concurrent.futures.Future):
+            result = await asyncio.wrap_future(result)
+        return result
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and block until it finishes"""
+        return self.submit(coro).result()
+
+    async def get_session(self):
+        """Get the shared aiohttp session, creating it on first use"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=POOL_CONNECTIONS_PER_HOST,
+                keepalive_timeout=IDLE_CONNECTION_SECONDS
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=DEFAULT_HEADERS,
+                trace_configs=[self.create_trace_config()]
+            )
+        return self.session
+
+    def create_trace_config(self):
+        """Count new connections and TLS handshakes in the shared transport metrics"""
+        async def on_request_start(session, context, params):
+            context.host = url_host(str(params.url))
+            context.tls = params.url.scheme == 'https'
+
+        async def on_connection_create_end(session, context, params):
+            transport_metrics.record_connection(context.host, tls=context.tls)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+
+    async def before_request(self, url):
+        """
+        Wait for the host's rate limit and count the request
+
+        Uses the same per-host token buckets and transport metrics as the
+        requests-based services. Pass responses to bucket.observe().
+
+        Returns:
+            TokenBucket: The host's bucket
+        """
+        bucket = get_bucket(url)
+        delay = bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        transport_metrics.record_request(url_host(url))
+        return bucket
+
+    def watch_cancellation(self, cancel_token):
+        """
+        Get an asyncio.Event that is set on the engine loop when cancel_token
+        is cancelled (call on the engine loop)
+        """
+        event = asyncio.Event()
+        cancel_token.add_callback(lambda: self.loop.call_soon_threadsafe(event.set))
+        return event
+
+    async def sleep(self, seconds, cancelled):
+        """
+        Sleep, waking early when the cancelled event is set
+
+        Returns:
+            bool: Whether the sleep was cut short by cancellation
+        """
+        try:
+            await asyncio.wait_for(cancelled.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_timeout(self, read_timeout):
+        """aiohttp timeout with the configured connect timeout and a read timeout"""
+        connect_timeout, read_timeout = get_timeouts(read_timeout)
+        return aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+
+    async def request(self, method, url, headers=None, json_body=None, timeout=30, data=None):
+        """
+        Send one HTTP request and read the whole body
+
+        The body is json_body serialized as JSON, or the raw bytes in data.
+
+        Raises:
+            asyncio.TimeoutError: On timeout
+            aiohttp.ClientConnectionError: When the host cannot be reached
+        """
+        session = await self.get_session()
+        bucket = await self.before_request(url)
+        async with session.request(
+            method, url,
+            headers=headers,
+            json=json_body,
+            data=data,
+            timeout=self.get_timeout(timeout)
+        ) as response:
+            text = await response.text()
+            bucket.observe(response.status, response.headers.get('Retry-After'))
+            return AsyncResponse(response.status, text)
+
+
+class AsyncAuthService(AuthService):
+    """San Beda challenge-response authentication on the engine loop"""
+
+    def __init__(self, database):
+        super().__init__(database)
+        self.engine = None
+        self.token_manager.login_async = self.login_async
+
+    async def get_valid_token_async(self):
+        """Get a valid login token, authenticating if necessary"""
+        return await self.token_manager.get_token_async()
+
+    async def authenticate_async(self, stale_token=None):
+        """
+        Get a new login token, sharing one login between concurrent callers
+
+        If the token already changed since stale_token was rejected, the
+        new token is returned as is.
+
+        Args:
+            stale_token: Token the caller saw rejected (optional)
+
+        Returns:
+            str: Login token
+        """
+        return await self.token_manager.refresh_async(stale_token)
+
+    async def login_async(self):
+        """
+        Authenticate with San Beda using the two-step challenge flow
+
+        Returns:
+            str: Login token
+        """
+        try:
+            config = await asyncio.to_thread(self.database.get_api_config)
+            if not config:
+                raise Exception("API configuration not found")
+
+            host = config.get('pull_host')
+            username = config.get('pull_username')
+            password = config.get('pull_password')
+
+            if not all([host, username, password]):
+                raise Exception("San Beda host, username, and password required for authentication")
+
+            auth_url = f"http://{host}/brms/api/v1.0/accounts/authorize"
+            logger.info(f"Authenticating to San Beda at {auth_url}")
+            self.prepare_client_key()
+
+            # Step 1: Challenge request
+            response1 = await self.engine.request('POST', auth_url, json_body={
+                "userName": username,
+                "ipAddress": "",
+                "clientType": "WINPC_V2"
+            })
+
+            if response1.status_code == 200:
+                login_token = response1.json().get('loginToken')
+                if login_token:
+                    await asyncio.to_thread(self.database.update_login_token, login_token)
+                    self.token_manager.store(login_token)
+                    logger.info(f"Authentication successful (simple), token: {login_token[:20]}...")
+                    return login_token
+
+            if response1.status_code != 401:
+                raise Exception(f"Authentication failed: HTTP {response1.status_code}")
+
+            challenge_data = response1.json()
+            random_key = challenge_data.get('randomKey')
+            realm = challenge_data.get('realm')
+            encrypt_type = challenge_data.get('encryptType')
+
+            if not all([random_key, realm, encrypt_type]):
+                raise Exception(f"Invalid challenge response: {challenge_data}")
+            if encrypt_type != 'MD5':
+                raise Exception(f"Unsupported encryption type: {encrypt_type}")
+
+            # Step 2: Signed login
+            signature = self.calculate_signature(username, password, realm, random_key)
+            # Waiting for the key thread must not block the event loop
+            public_key = await asyncio.to_thread(lambda: self.public_key_str)
+            response2 = await self.engine.request('POST', auth_url, json_body={
+                "userName": username,
+                "signature": signature,
+                "randomKey": random_key,
+                "publicKey": public_key,
+                "encryptType": encrypt_type,
+                "ipAddress": "",
+                "clientType": "WINPC_V2",
+                "userType": "0"
+            })
+
+            if response2.status_code != 200:
+                raise Exception(f"Authentication failed: HTTP {response2.status_code}")
+
+            data = response2.json()
+            login_token = data.get('token')
+            if not login_token:
+                raise Exception(f"No token in response: {data}")
+
+            await asyncio.to_thread(self.database.update_login_token, login_token)
+            self.token_manager.store(login_token)
+            logger.info(f"Authentication successful! Token: {login_token[:20]}...")
+            return login_token
+
+        except asyncio.TimeoutError:
+            raise Exception("Authentication timeout: Server not responding")
+        except aiohttp.ClientConnectionError as e:
+            raise Exception(f"Connection error: Cannot reach San Beda server - {str(e)}")
+
+
+class AsyncPullService(PullService):
+    """Pull service that fetches attendance pages concurrently on the engine loop"""
+
+    auth_service_class = AsyncAuthService
+    ENGINE = 'async'
+
+    def __init__(self, database, engine):
+        super().__init__(database)
+        self.engine = engine
+        self.auth_service.engine = engine
+
+    def pull_data(self, date_from=None, date_to=None, progress_callback=None, force=False, resume=True,
+                  cancel_token=None):
+        """Synchronous facade for pull_data_async (same contract as PullService.pull_data)"""
+        return self.engine.run(self.pull_data_async(date_from, date_to, progress_callback, force, resume, cancel_token))
+
+    def submit_pull(self, date_from=None, date_to=None, progress_callback=None, force=False, resume=True,
+                    cancel_token=None, on_done=None):
+        """
+        Start a pull without blocking; returns a concurrent.futures.Future
+
+        on_done(success, message, stats) runs in a worker thread after the
+        pull (see AsyncSyncEngine.submit).
+        """
+        return self.engine.submit(
+            self.pull_data_async(date_from, date_to, progress_callback, force, resume, cancel_token), on_done
+        )
+
+    async def fetch_page(self, host, start_time_str, end_time_str, page, token_holder, on_records):
+        """
+        Fetch one attendance page, re-authenticating once on 401
+
+        The body is decoded incrementally and records are passed to
+        on_records (a coroutine function) as they arrive, as in
+        PullService.stream_page.
+
+        Returns:
+            tuple: (record_count: int, body: dict without pageData records)
+
+        Raises:
+            Exception: On HTTP or API-level errors
+        """
+        url = self.build_page_url(host, start_time_str, end_time_str, page, self.PAGE_SIZE)
+        session = await self.engine.get_session()
+
+        # Renew the token if it is about to expire (in memory, no database read)
+        token_holder['token'] = await self.auth_service.get_valid_token_async()
+
+        for attempt in range(2):
+            token = token_holder['token']
+            bucket = await self.engine.before_request(url)
+            async with session.get(
+                url,
+                headers={'X-Subject-Token': token},
+                timeout=self.engine.get_timeout(30)
+            ) as response:
+                bucket.observe(response.status, response.headers.get('Retry-After'))
+                if response.status == 401 and attempt == 0:
+                    logger.warning("Token expired, re-authenticating...")
+                    token_holder['token'] = await self.auth_service.authenticate_async(stale_token=token)
+                    continue
+
+                if response.status != 200:
+                    raise Exception(f"Pull failed: HTTP {response.status} - {await response.text()}")
+
+                stream = PageRecordStream()
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    records = stream.feed(chunk)
+                    if records:
+                        await on_records(records)
+                body = stream.close()
+
+            if body.get('code') != 1000:
+                raise Exception(f"API Error: {body.get('desc', 'Unknown error')}")
+
+            return stream.record_count, body
+
+    async def pull_data_async(self, date_from=None, date_to=None, progress_callback=None, force=False, resume=True,
+                              cancel_token=None):
+        """
+        Pull timesheet data from San Beda with concurrent page requests
+
+        Page 1 is fetched first to learn the record total; the remaining pages
+        are then requested MAX_CONCURRENT_PAGES at a time and processed as
+        they arrive. Without a total, pages are fetched one by one. Pages
+        complete out of order, so a closed day is held back until every page
+        it can continue into has arrived, then fingerprinted (flush_through).
+
+        The checkpoint only advances over the contiguous run of completed
+        pages, so a resumed run (starting after the checkpoint instead of
+        at page 1) never skips a page that was still in flight.
+
+        On cancellation the page requests still in flight are abandoned and
+        the pages completed so far are committed (see record_cancelled).
+
+        Database work (ingest, checkpoints, sync log) runs in worker threads
+        via asyncio.to_thread, one call at a time, so the loop keeps serving
+        the other pages meanwhile.
+
+        Returns:
+            tuple: (success: bool, message: str, stats: dict)
+        """
+        cancel_token = cancel_token or CancellationToken()
+        database_lock = threading.Lock()
+
+        async def in_thread(func, *args, **kwargs):
+            # The fingerprint tracker and stats are not thread-safe; a thread
+            # lock (not an asyncio one) still holds when a page task is cancelled
+            def locked():
+                with database_lock:
+                    return func(*args, **kwargs)
+            return await asyncio.to_thread(locked)
+
+        log_id = await in_thread(self.database.create_sync_log, 'pull')
+        stats = self.new_stats()
+        total_records = 0
+        fingerprints = None
+        checkpoint = None
+        done_through = 0
+
+        def report(status, page):
+            if progress_callback:
+                progress_callback({
+                    "type": "pull",
+                    "status": status,
+                    "page": page,
+                    "records_fetched": total_records,
+                    "records_processed": stats['processed'],
+                    "records_success": stats['success']
+                })
+
+        try:
+            logger.info(f"Starting pull sync from San Beda ({self.ENGINE} engine)")
+
+            config = await in_thread(self.get_config)
+            host = config['pull_host']
+            self.prepare_run(config)
+            token_holder = {'token': await self.auth_service.get_valid_token_async()}
+
+            fingerprints = DayFingerprintTracker(
+                self.database, host,
+                ingest=lambda records: self.process_page(records, stats),
+                force=force,
+                ordered=False
+            )
+
+            start_time_str, end_time_str = self.get_time_range(date_from, date_to)
+            logger.info(f"Pulling data from {start_time_str} to {end_time_str}")
+
+            # Resume an interrupted run for this range, or start a new one
+            checkpoint = await in_thread(self.open_checkpoint, host, start_time_str[:10], end_time_str[:10], resume)
+            run_id = checkpoint['run_id']
+            first_page = checkpoint['last_page'] + 1
+            done_through = checkpoint['last_page']
+            resumed_from_page = first_page if first_page > 1 else None
+            if resumed_from_page:
+                logger.info(f"Resuming pull run {run_id} from page {resumed_from_page}")
+
+            def add_from(page_num):
+                async def add(records):
+                    await in_thread(fingerprints.add, records, page_num)
+                return add
+
+            def commit_through(page, **fields):
+                # Fingerprint the days that are complete, then advance the checkpoint
+                fingerprints.flush_through(page)
+                self.database.update_pull_checkpoint(
+                    run_id, last_page=fingerprints.committed_through(page), **fields
+                )
+
+            if cancel_token.cancelled:
+                return await in_thread(self.record_cancelled, log_id, run_id, stats, cancel_token.reason)
+
+            report("fetching", first_page)
+            page_count, first = await self.fetch_page(
+                host, start_time_str, end_time_str, first_page, token_holder, add_from(first_page)
+            )
+            total = (first.get('data') or {}).get('total')
+
+            # Fewer records than at checkpoint time means pages have shifted
+            if resumed_from_page and isinstance(total, int) and checkpoint['total'] is not None \
+                    and total < checkpoint['total']:
+                logger.warning(
+                    f"Record total dropped from {checkpoint['total']} to {total}, restarting run {run_id} from page 1"
+                )
+                resumed_from_page = None
+                first_page = 1
+                report("fetching", first_page)
+                page_count, first = await self.fetch_page(
+                    host, start_time_str, end_time_str, first_page, token_holder, add_from(first_page)
+                )
+                total = (first.get('data') or {}).get('total')
+
+            total_records += page_count
+            done_through = first_page
+            await in_thread(commit_through, first_page, total=total if isinstance(total, int) else None)
+            report("processing", first_page)
+
+            stopped = page_count >= self.PAGE_SIZE and cancel_token.cancelled
+            if page_count >= self.PAGE_SIZE and not stopped:
+                if isinstance(total, int):
+                    # Known total: fan out the remaining pages
+                    last_page = -(-total // self.PAGE_SIZE)
+                    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+                    completed = set()
+
+                    async def fetch_limited(page_num):
+                        async with semaphore:
+                            count, _ = await self.fetch_page(
+                                host, start_time_str, end_time_str, page_num, token_holder, add_from(page_num)
+                            )
+                            return page_num, count
+
+                    tasks = [asyncio.ensure_future(fetch_limited(p)) for p in range(first_page + 1, last_page + 1)]
+
+                    def abandon_pages():
+                        for task in tasks:
+                            task.cancel()
+
+                    # Drop the page requests in flight as soon as the run is cancelled
+                    cancel_token.add_callback(lambda: self.engine.loop.call_soon_threadsafe(abandon_pages))
+                    try:
+                        for next_done in asyncio.as_completed(tasks):
+                            try:
+                                page_num, page_count = await next_done
+                            except asyncio.CancelledError:
+                                if not cancel_token.cancelled:
+                                    raise
+                                stopped = True
+                                break
+                            total_records += page_count
+
+                            completed.add(page_num)
+                            if done_through + 1 in completed:
+                                while done_through + 1 in completed:
+                                    done_through += 1
+                                    completed.discard(done_through)
+                                await in_thread(commit_through, done_through)
+                            report("processing", page_num)
+                    finally:
+                        for task in tasks:
+                            task.cancel()
+                else:
+                    # Unknown total: walk pages until a short one
+                    page = first_page + 1
+                    while True:
+                        if cancel_token.cancelled:
+                            stopped = True
+                            break
+                        report("fetching", page)
+                        page_count, _ = await self.fetch_page(
+                            host, start_time_str, end_time_str, page, token_holder, add_from(page)
+                        )
+                        total_records += page_count
+                        done_through = page
+                        await in_thread(commit_through, page)
+                        report("processing", page)
+                        if page_count < self.PAGE_SIZE:
+                            break
+                        page += 1
+
+            if stopped:
+                await in_thread(fingerprints.close)
+                await in_thread(self.database.update_pull_checkpoint, run_id, last_page=done_through)
+                return await in_thread(
+                    self.record_cancelled, log_id, run_id, stats, cancel_token.reason, total_records
+                )
+
+            return await in_thread(
+                self.record_completed, log_id, run_id, stats, fingerprints, total_records, force, resumed_from_page
+            )
+
+        except Exception as e:
+            error_msg = f"Pull sync error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+
+            # Commit held-back days so the checkpoint can cover every finished page
+            try:
+                if fingerprints:
+                    await in_thread(fingerprints.close)
+                if checkpoint:
+                    await in_thread(self.database.update_pull_checkpoint, checkpoint['run_id'], last_page=done_through)
+            except Exception as flush_error:
+                logger.error(f"Error flushing held-back days: {flush_error}")
+
+            await in_thread(self.database.update_sync_log, log_id, 'error', error_message=error_msg)
+            return False, error_msg, stats
+
+
+class AsyncPushService(PushService):
+    """Push service that sends YAHSHUA batches concurrently on the engine loop"""
+
+    ENGINE = 'async'
+
+    def __init__(self, database, engine):
+        super().__init__(database)
+        self.engine = engine
+        self.token_manager.login_async = self.login_async
+
+    def push_data(self, progress_callback=None, cancel_token=None):
+        """Synchronous facade for push_data_async (same contract as PushService.push_data)"""
+        return self.engine.run(self.push_data_async(progress_callback, cancel_token))
+
+    def submit_push(self, progress_callback=None, cancel_token=None, on_done=None):
+        """
+        Start a push without blocking; returns a concurrent.futures.Future
+
+        on_done(success, message, stats) runs in a worker thread after the
+        push (see AsyncSyncEngine.submit).
+        """
+        return self.engine.submit(self.push_data_async(progress_callback, cancel_token), on_done)
+
+    async def get_valid_token_async(self):
+        """Get a valid YAHSHUA token, authenticating if necessary or near expiry"""
+        return await self.token_manager.get_token_async()
+
+    async def authenticate_async(self, stale_token=None):
+        """
+        Get a new YAHSHUA token, sharing one login between concurrent batches
+
+        Returns:
+            str: YAHSHUA token
+        """
+        return await self.token_manager.refresh_async(stale_token)
+
+    async def login_async(self):
+        """
+        Log in to YAHSHUA on the engine loop
+
+        Returns:
+            str: YAHSHUA token
+        """
+        config = await asyncio.to_thread(self.get_config)
+        username = config.get('push_username')
+        password = config.get('push_password')
+        logger.info(f"Authenticating to YAHSHUA as {username}")
+
+        # YAHSHUA API requires credentials in both query params and body
+        self.base_url = self.get_base_url(config)
+        auth_url = f"{self.base_url}{YAHSHUA_LOGIN_PATH}?username={username}&password={password}"
+
+        try:
+            response = await self.engine.request(
+                'POST', auth_url,
+                json_body={"username": username, "password": password}
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Authentication timeout: YAHSHUA server not responding")
+        except aiohttp.ClientConnectionError:
+            raise Exception("Connection error: Cannot reach YAHSHUA server")
+
+        if response.status_code != 200:
+            raise Exception(f"Authentication failed: HTTP {response.status_code}")
+
+        data = response.json()
+        token = data.get('token')
+        if not token:
+            raise Exception("No token in response")
+
+        await asyncio.to_thread(self.database.update_push_token, token, data.get('user_logged'))
+        self.token_manager.store(token)
+        return token
+
+    async def push_batch_async(self, token_holder, log_list, idempotency_key=None):
+        """
+        Push a batch of logs to YAHSHUA (async counterpart of push_batch)
+
+        Returns:
+            tuple: (success: bool, result: dict)
+        """
+        payload = self.build_sync_payload(log_list)
+
+        try:
+            # Renew the token if it is about to expire (in memory, no database read)
+            token = token_holder['token'] = await self.get_valid_token_async()
+            response = await self.post_sync_async(token, payload, idempotency_key)
+
+            if response.status_code == 401:
+                logger.warning("Token expired, re-authenticating...")
+                token_holder['token'] = await self.authenticate_async(stale_token=token)
+                response = await self.post_sync_async(token_holder['token'], payload, idempotency_key)
+
+            return self.read_sync_response(response)
+
+        except aiohttp.ConnectionTimeoutError:
+            # Never reached the server (aiohttp raises it for the connect timeout)
+            return transport_failure('Connection timeout', reached_server=False)
+        except asyncio.TimeoutError:
+            return transport_failure('Request timeout', reached_server=True)
+        except aiohttp.ClientConnectorError:
+            return transport_failure('Connection error', reached_server=False)
+        except aiohttp.ClientConnectionError:
+            return transport_failure('Connection error', reached_server=True)
+        except Exception as e:
+            return False, {'error': str(e)}
+
+    async def post_sync_async(self, token, payload, idempotency_key=None):
+        """POST a payload to sync-time-in-out (async counterpart of post_sync)"""
+        compression = COMPRESSION_NONE if self.compression_rejected else self.compression
+        body, encoding_headers, raw_size = encode_payload(payload, compression)
+
+        headers = {'Authorization': f'Token {token}', 'Content-Type': 'application/json', **encoding_headers}
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+
+        response = await self.engine.request(
+            'POST', f"{self.base_url}{YAHSHUA_SYNC_PATH}",
+            headers=headers,
+            data=body,
+            timeout=60
+        )
+        self.payload_meter.record(raw_size, len(body), compression == COMPRESSION_GZIP)
+
+        if compression == COMPRESSION_GZIP and is_compression_rejected(response.status_code, response.text):
+            logger.warning(f"YAHSHUA rejected gzip request body (HTTP {response.status_code}), falling back to plain JSON")
+            self.compression_rejected = True
+            return await self.post_sync_async(token, payload, idempotency_key)
+
+        return response
+
+    async def push_data_async(self, progress_callback=None, cancel_token=None):
+        """
+        Push unsynced timesheets with up to push_max_in_flight batches in flight
+
+        Batches are cut and sent as in PushService.push_data (adaptive batch
+        size, self-adjusting in-flight window, retries with backoff), with
+        the requests running on the engine loop instead of worker threads.
+        Once cancel_token is cancelled no further batch is sent; batches in
+        flight still have their results written. Database work runs in
+        worker threads via asyncio.to_thread.
+
+        Returns:
+            tuple: (success: bool, message: str, stats: dict)
+        """
+        cancel_token = cancel_token or CancellationToken()
+        log_id = await asyncio.to_thread(self.database.create_sync_log, 'push')
+        stats = self.new_stats()
+
+        try:
+            logger.info(f"Starting push sync to YAHSHUA Payroll ({self.ENGINE} engine)")
+
+            config, max_in_flight = await asyncio.to_thread(self.start_run)
+            token_holder = {'token': await self.get_valid_token_async()}
+
+            work = await asyncio.to_thread(self.collect_work, config, stats)
+            if work is None:
+                return await asyncio.to_thread(self.record_nothing_to_push, log_id, stats)
+            replays, fresh_entries, batcher, attempts, rejections = work
+
+            pipeline = await self.run_batch_pipeline_async(
+                token_holder, fresh_entries, batcher, max_in_flight, stats, progress_callback, attempts, replays,
+                cancel_token, rejections
+            )
+            return await asyncio.to_thread(self.record_run, log_id, pipeline, progress_callback)
+
+        except Exception as e:
+            return await asyncio.to_thread(self.record_run_error, log_id, stats, e)
+
+    async def run_batch_pipeline_async(self, token_holder, log_entries, batcher, max_in_flight, stats,
+                                       progress_callback=None, attempts=None, replays=None, cancel_token=None,
+                                       rejections=None):
+        """
+        Send log entries in adaptive batches on the engine loop (async
+        counterpart of PushService.run_batch_pipeline)
+
+        The BatchPipeline picks the batches and applies their results, one
+        call at a time in a worker thread; only the requests run here.
+
+        Returns:
+            BatchPipeline: The finished pipeline
+        """
+        pipeline = BatchPipeline(
+            self, log_entries, batcher, max_in_flight, stats, progress_callback, attempts, replays, cancel_token,
+            rejections
+        )
+        cancelled = self.engine.watch_cancellation(pipeline.cancel_token)
+        in_flight = {}
+
+        try:
+            while pipeline.running(len(in_flight)):
+                # Top up the window, requeued batches first, then in-doubt batches
+                while pipeline.can_send(len(in_flight)):
+                    batch_num, batch, attempt, idempotency_key, delay = await asyncio.to_thread(
+                        pipeline.next_batch, len(in_flight)
+                    )
+                    task = asyncio.ensure_future(
+                        self.timed_push_batch_async(delay, token_holder, batch, idempotency_key, cancelled)
+                    )
+                    in_flight[task] = (batch_num, batch, attempt, idempotency_key)
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    await asyncio.to_thread(pipeline.on_result, *in_flight.pop(task), *task.result())
+
+        finally:
+            # Only left over when applying a result failed
+            for task in in_flight:
+                task.cancel()
+
+        return pipeline.finish()
+
+    async def timed_push_batch_async(self, delay, token_holder, log_list, idempotency_key, cancelled):
+        """
+        Wait delay seconds (for requeued batches), then push_batch_async
+
+        A cancellation during the wait skips the batch.
+
+        Returns:
+            tuple: (success: bool, result: dict, latency: float seconds)
+        """
+        if delay and await self.engine.sleep(delay, cancelled):
+            return False, {'error': 'Cancelled before retry', 'cancelled': True}, 0.0
+        started = time.monotonic()
+        success, result = await self.push_batch_async(token_holder, log_list, idempotency_key)
+        return success, result, time.monotonic() - started
@@ -1,34 +1,187 @@
 """
 San Beda Integration Tool - Authentication Service
 Handles authentication with San Beda timekeeping system
+
+The client RSA key sent with the signed login is only needed when a new
+token is requested. It is loaded (or generated) in a background thread the
+first time authenticate() runs, and cached next to the database (mode 0600)
+encrypted with AES-GCM under a random key.
+
+When the optional keyring package has a usable backend (Windows Credential
+Manager, macOS Keychain, Secret Service), that AES key is kept in the OS
+credential store. Otherwise it falls back to api_config.client_key_secret,
+in the database beside the cache file: that is obfuscation only, since
+anyone who can read both files can decrypt the key.
 """
 
 import requests
 import logging
 import hashlib
 import base64
+import os
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
+from Crypto.Cipher import AES
 from Crypto.PublicKey import RSA
+from .token_manager import TokenManager
+from .transport import create_session
+
+try:
+    import keyring
+except ImportError:
+    keyring = None
 
 logger = logging.getLogger(__name__)
 
+# Client RSA key size and cache file (stored beside the database)
+CLIENT_KEY_BITS = 2048
+CLIENT_KEY_FILENAME = 'client_key.bin'
+
+# OS credential store entry for the cache file's AES key (one per database)
+KEYRING_SERVICE = 'sanbeda-integration'
+
 
 class AuthService:
     """Service for authenticating with San Beda timekeeping system"""
 
     def __init__(self, database):
         self.database = database
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'San Beda Integration Tool/1.0',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json;charset=UTF-8'
-        })
-        # Generate RSA key pair for client
-        self.rsa_key = RSA.generate(2048)
-        self.public_key_str = base64.b64encode(
-            self.rsa_key.publickey().export_key(format='DER')
-        ).decode('utf-8')
+        self.session = create_session({'Content-Type': 'application/json;charset=UTF-8'})
+
+        # Client RSA key, loaded on first authentication (see prepare_client_key)
+        self._rsa_key = None
+        self._key_error = None
+        self._key_thread = None
+        self._key_lock = threading.Lock()
+
+        # Login token kept in memory; concurrent 401s share one authenticate()
+        self.token_manager = TokenManager(
+            'San Beda', database, 'login_token', 'token_created_at', 'pull_token_lifetime_minutes',
+            login=self.authenticate
+        )
+
+    def prepare_client_key(self):
+        """Start loading or generating the client RSA key in the background (idempotent)"""
+        with self._key_lock:
+            if self._rsa_key is not None or (self._key_thread and self._key_thread.is_alive()):
+                return
+            self._key_thread = threading.Thread(target=self._load_client_key, name="client-key", daemon=True)
+            self._key_thread.start()
+
+    def _load_client_key(self):
+        try:
+            key = self.read_cached_client_key()
+            if key is None:
+                started = time.monotonic()
+                key = RSA.generate(CLIENT_KEY_BITS)
+                logger.info(f"Generated client RSA key in {time.monotonic() - started:.2f}s")
+                self.write_cached_client_key(key)
+            self._rsa_key = key
+        except Exception as e:
+            self._key_error = e
+            logger.error(f"Client key error: {e}")
+
+    @property
+    def rsa_key(self):
+        """Client RSA key, waiting for the background load if it is still running"""
+        if self._rsa_key is None:
+            self.prepare_client_key()
+            thread = self._key_thread
+            if thread:
+                thread.join()
+            if self._rsa_key is None:
+                raise Exception(f"Client RSA key unavailable: {self._key_error}")
+        return self._rsa_key
+
+    @property
+    def public_key_str(self):
+        """Base64 DER public key sent with the signed login"""
+        return base64.b64encode(self.rsa_key.publickey().export_key(format='DER')).decode('utf-8')
+
+    def get_client_key_path(self):
+        return Path(self.database.db_path).parent / CLIENT_KEY_FILENAME
+
+    def get_keyring_username(self):
+        return f"client-key:{Path(self.database.db_path).resolve()}"
+
+    def load_client_key_secret(self):
+        """Get the cache file's AES key (hex): OS credential store first, then api_config"""
+        if keyring is not None:
+            try:
+                secret = keyring.get_password(KEYRING_SERVICE, self.get_keyring_username())
+                if secret:
+                    return secret
+            except Exception as e:
+                logger.warning(f"OS credential store unavailable ({e})")
+        return (self.database.get_api_config() or {}).get('client_key_secret')
+
+    def store_client_key_secret(self, secret):
+        """Keep the cache file's AES key in the OS credential store, or in api_config without one"""
+        if keyring is not None:
+            try:
+                keyring.set_password(KEYRING_SERVICE, self.get_keyring_username(), secret)
+                self.database.update_api_config(client_key_secret=None)
+                return
+            except Exception as e:
+                logger.warning(f"OS credential store unavailable ({e})")
+        # Obfuscation only: the key sits in the database beside the file it unlocks
+        logger.warning("No OS credential store: client key cache secret kept in the database (obfuscation only)")
+        self.database.update_api_config(client_key_secret=secret)
+
+    def forget_client_key_secret(self):
+        """Remove this database's entry from the OS credential store (when one is used)"""
+        if keyring is None:
+            return
+        try:
+            keyring.delete_password(KEYRING_SERVICE, self.get_keyring_username())
+        except Exception:
+            pass
+
+    def read_cached_client_key(self):
+        """
+        Load the cached client key
+
+        Returns:
+            RSA.RsaKey: The key, or None if there is no usable cache
+        """
+        path = self.get_client_key_path()
+        secret = self.load_client_key_secret()
+        if not secret or not path.exists():
+            return None
+
+        try:
+            blob = path.read_bytes()
+            nonce, tag, ciphertext = blob[:12], blob[12:28], blob[28:]
+            cipher = AES.new(bytes.fromhex(secret), AES.MODE_GCM, nonce=nonce)
+            key = RSA.import_key(cipher.decrypt_and_verify(ciphertext, tag))
+            if not key.has_private() or key.size_in_bits() != CLIENT_KEY_BITS:
+                return None
+            logger.info("Loaded cached client RSA key")
+            return key
+        except (ValueError, IndexError, TypeError) as e:
+            logger.warning(f"Cached client key unusable ({e}), generating a new one")
+            return None
+
+    def write_cached_client_key(self, key):
+        """Encrypt and store the client key; failures only cost a regeneration next launch"""
+        try:
+            secret = secrets.token_bytes(32)
+            cipher = AES.new(secret, AES.MODE_GCM, nonce=secrets.token_bytes(12))
+            ciphertext, tag = cipher.encrypt_and_digest(key.export_key(format='DER'))
+
+            path = self.get_client_key_path()
+            temp_path = path.with_suffix('.tmp')
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cipher.nonce + tag + ciphertext)
+            os.replace(temp_path, path)
+
+            self.store_client_key_secret(secret.hex())
+        except Exception as e:
+            logger.warning(f"Could not cache client RSA key: {e}")
 
     def calculate_signature(self, username, password, realm, random_key):
         """
@@ -70,21 +223,22 @@ class AuthService:
         """
         Get a valid login token, authenticating if necessary
 
+        The token is kept in memory by the token manager and refreshed
+        before pull_token_lifetime_minutes ends, if configured; otherwise
+        it is assumed valid until the server rejects it.
+
         Returns:
             str: Valid login token
         """
-        # Try to get existing token
-        token = self.database.get_login_token()
+        return self.token_manager.get_token()
 
-        if token:
-            # Check if token is still valid (tokens are typically valid for a long time)
-            # For now, we'll assume token is valid unless auth fails
-            logger.info("Using existing login token")
-            return token
+    def refresh_token(self, stale_token):
+        """
+        Get a new login token after stale_token was rejected (HTTP 401)
 
-        # No token or expired, need to authenticate
-        logger.info("No valid token found, authenticating...")
-        return self.authenticate()
+        Concurrent callers share one authentication.
+        """
+        return self.token_manager.refresh(stale_token=stale_token)
 
     def authenticate(self):
         """
@@ -108,6 +262,9 @@ class AuthService:
             if not all([host, username, password]):
                 raise Exception("San Beda host, username, and password required for authentication")
 
+            # The key is only needed for step 2; load it while step 1 is in flight
+            self.prepare_client_key()
+
             # Build authentication URL
             auth_url = f"http://{host}/brms/api/v1.0/accounts/authorize"
 
@@ -135,6 +292,7 @@ class AuthService:
 
                 if login_token:
                     self.database.update_login_token(login_token)
+                    self.token_manager.store(login_token)
                     logger.info(f"Authentication successful (simple), token: {login_token[:20]}...")
                     return login_token
 
@@ -195,6 +353,7 @@ class AuthService:
 
                 # Store token in database
                 self.database.update_login_token(login_token)
+                self.token_manager.store(login_token)
                 logger.info(f"Authentication successful! Token: {login_token[:20]}...")
 
                 return login_token
@@ -233,4 +392,5 @@ class AuthService:
     def invalidate_token(self):
         """Invalidate the current token (force re-authentication on next request)"""
         self.database.update_login_token(None)
+        self.token_manager.invalidate()
         logger.info("Login token invalidated")
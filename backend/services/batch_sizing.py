@@ -0,0 +1,107 @@
+"""
+San Beda Integration Tool - Adaptive Batch Sizing
+Learns how many log entries to send per YAHSHUA sync request.
+
+The batch size grows while requests come back quickly and without errors,
+and shrinks when they slow down, fail or are throttled. Batches are also
+cut short so their JSON payload stays under a size ceiling. The learned
+size is stored in api_config so the next push starts from it.
+"""
+
+import json
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Bounds on the learned batch size (log entries per request)
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 500
+
+# Default ceiling on the log_list payload of one request
+DEFAULT_MAX_PAYLOAD_KB = 256
+
+# A batch answered within this time is healthy; slower batches shrink the size
+TARGET_LATENCY_SECONDS = 5.0
+
+# Growth per healthy batch and shrink factors for slow and failed batches
+GROWTH_FACTOR = 1.25
+SLOW_FACTOR = 0.75
+FAILURE_FACTOR = 0.5
+
+
+class AdaptiveBatcher:
+    """
+    Cuts log entries into batches of a self-adjusting size
+
+    Usage:
+        batcher = AdaptiveBatcher(size=50, max_payload_bytes=256 * 1024)
+        batch = batcher.take(pending_entries)   # deque, consumed from the left
+        ...send...
+        batcher.record(len(batch), latency, success)
+    """
+
+    def __init__(self, size, max_payload_bytes=DEFAULT_MAX_PAYLOAD_KB * 1024):
+        self.size = max(MIN_BATCH_SIZE, min(int(size), MAX_BATCH_SIZE))
+        self.initial_size = self.size
+        self.max_payload_bytes = max_payload_bytes
+        self.healthy = 0
+        self.unhealthy = 0
+
+    def take(self, entries):
+        """
+        Remove and return the next batch from the front of entries
+
+        The batch holds up to size entries, fewer if adding another one
+        would push the payload over max_payload_bytes (never fewer than one).
+
+        Args:
+            entries: collections.deque of YAHSHUA log entries
+        """
+        batch = []
+        payload_bytes = 2  # enclosing []
+        while entries and len(batch) < self.size:
+            entry_bytes = len(json.dumps(entries[0], separators=(',', ':'))) + 1
+            if batch and payload_bytes + entry_bytes > self.max_payload_bytes:
+                break
+            batch.append(entries.popleft())
+            payload_bytes += entry_bytes
+        return batch
+
+    def split(self, entries):
+        """Cut all entries into batches at the current size"""
+        remaining = deque(entries)
+        batches = []
+        while remaining:
+            batches.append(self.take(remaining))
+        return batches
+
+    def record(self, batch_len, latency, success):
+        """
+        Adjust the size from one batch's outcome
+
+        Args:
+            batch_len: Number of entries that were sent
+            latency: Seconds until YAHSHUA answered
+            success: Whether the request went through (throttling counts as failure)
+        """
+        previous = self.size
+
+        if not success:
+            self.unhealthy += 1
+            self.size = max(MIN_BATCH_SIZE, int(self.size * FAILURE_FACTOR))
+        elif latency > TARGET_LATENCY_SECONDS:
+            self.unhealthy += 1
+            self.size = max(MIN_BATCH_SIZE, int(self.size * SLOW_FACTOR))
+        else:
+            self.healthy += 1
+            # Only grow when the batch actually used the current size
+            if batch_len >= self.size:
+                self.size = min(MAX_BATCH_SIZE, max(self.size + 1, int(self.size * GROWTH_FACTOR)))
+
+        if self.size != previous:
+            logger.debug(f"Batch size {previous} -> {self.size} (latency {latency:.2f}s, success={success})")
+
+    def estimate_batches(self, entry_count):
+        """Estimate how many more batches entry_count entries will take"""
+        return -(-entry_count // self.size)
@@ -0,0 +1,71 @@
+"""
+San Beda Integration Tool - Cooperative Cancellation
+Lets the UI stop a pull or push that is already running.
+
+A CancellationToken is created for every coordinated job and passed to
+pull_data / push_data, which check it between pages and batches. A cancelled
+run finishes the page or batches already in flight, commits that progress,
+and returns (False, message, stats) with stats['cancelled'] set. Waits
+(retry backoff) end as soon as the token is cancelled.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANCEL_REASON = "cancelled by user"
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag with wake-up callbacks"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+        self.cancelled_at = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=DEFAULT_CANCEL_REASON):
+        """
+        Request cancellation (later calls are ignored)
+
+        Returns:
+            bool: Whether this call cancelled the token
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = datetime.now()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Cancellation callback error: {e}", exc_info=True)
+        return True
+
+    def add_callback(self, callback):
+        """Call callback() once on cancellation (right away if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout=None):
+        """
+        Sleep up to timeout seconds, waking early on cancellation
+
+        Returns:
+            bool: Whether the token is cancelled
+        """
+        return self._event.wait(timeout)
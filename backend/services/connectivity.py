@@ -0,0 +1,248 @@
+"""
+San Beda Integration Tool - Connectivity Monitor
+Cheap reachability probes for the upstream hosts, so scheduled syncs are
+deferred while a host is offline instead of waiting out request timeouts.
+
+Each watched host is probed with a plain TCP connect (no HTTP request, no
+rate-limit token) every PROBE_INTERVAL_UP_SECONDS while it is reachable and
+every PROBE_INTERVAL_DOWN_SECONDS while it is not. The state only flips
+after several probes in a row agree (hysteresis), so one dropped packet
+does not skip a sync and one lucky probe does not end an outage. Listeners
+are told when a host comes back, so deferred jobs can run right away.
+"""
+
+import logging
+import socket
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+STATE_UNKNOWN = 'unknown'
+STATE_UP = 'up'
+STATE_DOWN = 'down'
+
+# A probe gives up after this long (a reachable LAN or cloud host answers far sooner)
+PROBE_TIMEOUT_SECONDS = 3
+
+# Probe intervals while a host is reachable / unreachable
+PROBE_INTERVAL_UP_SECONDS = 60
+PROBE_INTERVAL_DOWN_SECONDS = 10
+
+# A probe that disagrees with the current state is confirmed this soon
+PROBE_CONFIRM_SECONDS = 2
+
+# Probes in a row needed to change state (hysteresis)
+PROBE_FAILURES_TO_MARK_DOWN = 2
+PROBE_SUCCESSES_TO_MARK_UP = 2
+
+
+def probe_address(url):
+    """
+    Get the (host, port) to probe for a URL or bare host[:port]
+
+    Returns:
+        tuple: (host, port), or None if the URL has no host
+    """
+    if '//' not in url:
+        url = f"http://{url}"
+    parsed = urlparse(url)
+    if not parsed.hostname:
+        return None
+    try:
+        port = parsed.port
+    except ValueError:
+        return None
+    return parsed.hostname, port or (443 if parsed.scheme == 'https' else 80)
+
+
+def probe(address, timeout=PROBE_TIMEOUT_SECONDS):
+    """
+    Try a TCP connection to (host, port)
+
+    Returns:
+        tuple: (reachable: bool, error: str or None)
+    """
+    try:
+        with socket.create_connection(address, timeout=timeout):
+            return True, None
+    except OSError as e:
+        return False, str(e) or e.__class__.__name__
+
+
+class HostState:
+    """Reachability of one watched upstream"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.address = probe_address(url)
+        self.state = STATE_UNKNOWN
+        self.failures = 0
+        self.successes = 0
+        self.last_probe = 0.0
+        self.changed_at = None
+        self.last_error = None
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'state': self.state,
+            'changed_at': self.changed_at.isoformat() if self.changed_at else None,
+            'last_error': self.last_error
+        }
+
+
+class ConnectivityMonitor:
+    """Background reachability probes with cached per-host state"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._listeners = []
+        self._wake = threading.Event()
+        self._thread = None
+        self.running = False
+
+    def watch(self, name, url):
+        """
+        Probe an upstream under a name (e.g. 'pull', 'push')
+
+        Watching the same URL again keeps its state; a new URL starts unknown.
+        """
+        with self._lock:
+            current = self._hosts.get(name)
+            if current is not None and current.url == url:
+                return
+            self._hosts[name] = HostState(name, url)
+        self._wake.set()
+
+    def unwatch(self, name):
+        with self._lock:
+            self._hosts.pop(name, None)
+
+    def add_listener(self, callback):
+        """Call callback(name) whenever a watched host comes back up"""
+        self._listeners.append(callback)
+
+    def start(self):
+        """Start probing in a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="connectivity-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=PROBE_TIMEOUT_SECONDS + 2)
+
+    def is_available(self, name):
+        """
+        Whether a sync with this upstream is worth attempting
+
+        Unwatched names and hosts not yet probed are probed now (one TCP
+        connect); only a host confirmed down returns False.
+        """
+        with self._lock:
+            host = self._hosts.get(name)
+        if host is None or host.address is None:
+            return True
+        if host.state == STATE_UNKNOWN:
+            self.check(name)
+        return host.state != STATE_DOWN
+
+    def get_state(self, name):
+        with self._lock:
+            host = self._hosts.get(name)
+            return host.state if host else STATE_UNKNOWN
+
+    def snapshot(self):
+        """State of every watched host, for the UI"""
+        with self._lock:
+            return {name: host.as_dict() for name, host in self._hosts.items()}
+
+    def check(self, name):
+        """
+        Probe one host now and update its state
+
+        Returns:
+            str: The host's state after the probe
+        """
+        with self._lock:
+            host = self._hosts.get(name)
+        if host is None or host.address is None:
+            return STATE_UNKNOWN
+
+        reachable, error = probe(host.address)
+        came_back = False
+        with self._lock:
+            host.last_probe = time.monotonic()
+            previous = host.state
+            if reachable:
+                host.successes += 1
+                host.failures = 0
+                host.last_error = None
+                # The first probe decides right away; later changes need agreement
+                if previous == STATE_UNKNOWN or (previous == STATE_DOWN and host.successes >= PROBE_SUCCESSES_TO_MARK_UP):
+                    host.state = STATE_UP
+            else:
+                host.failures += 1
+                host.successes = 0
+                host.last_error = error
+                if previous == STATE_UNKNOWN or (previous == STATE_UP and host.failures >= PROBE_FAILURES_TO_MARK_DOWN):
+                    host.state = STATE_DOWN
+            if host.state != previous:
+                host.changed_at = datetime.now()
+                came_back = previous == STATE_DOWN and host.state == STATE_UP
+            state = host.state
+
+        if state != previous:
+            if state == STATE_DOWN:
+                logger.warning(f"{name} host {host.address[0]}:{host.address[1]} unreachable ({error}), deferring syncs")
+            else:
+                logger.info(f"{name} host {host.address[0]}:{host.address[1]} reachable")
+        if came_back:
+            for callback in list(self._listeners):
+                try:
+                    callback(name)
+                except Exception as e:
+                    logger.error(f"Connectivity listener error: {e}", exc_info=True)
+        return state
+
+    def _seconds_until_probe(self, host, now):
+        # Caller holds self._lock
+        if host.state == STATE_UNKNOWN:
+            return 0
+        if (host.state == STATE_UP and host.failures) or (host.state == STATE_DOWN and host.successes):
+            interval = PROBE_CONFIRM_SECONDS
+        elif host.state == STATE_DOWN:
+            interval = PROBE_INTERVAL_DOWN_SECONDS
+        else:
+            interval = PROBE_INTERVAL_UP_SECONDS
+        return host.last_probe + interval - now
+
+    def _run(self):
+        while self.running:
+            now = time.monotonic()
+            with self._lock:
+                due = [name for name, host in self._hosts.items() if self._seconds_until_probe(host, now) <= 0]
+
+            for name in due:
+                if not self.running:
+                    break
+                try:
+                    self.check(name)
+                except Exception as e:
+                    logger.error(f"Connectivity probe error: {e}", exc_info=True)
+
+            now = time.monotonic()
+            with self._lock:
+                waits = [self._seconds_until_probe(host, now) for host in self._hosts.values()]
+            self._wake.wait(timeout=max(1, min(waits, default=PROBE_INTERVAL_UP_SECONDS)))
+            self._wake.clear()
@@ -0,0 +1,179 @@
+"""
+San Beda Integration Tool - Database Maintenance
+Off-peak upkeep of the SQLite file, run by SyncScheduler.
+
+Tasks, in order:
+- optimize: refresh query planner statistics (ANALYZE the first time,
+  PRAGMA optimize afterwards)
+- vacuum: return free pages to the file system with an incremental vacuum.
+  A database created without auto_vacuum is converted once (a full VACUUM)
+  when enough of it is free pages.
+- checkpoint: truncate the write-ahead log (only in WAL mode)
+- quick_check: verify the file's structure
+
+Every task runs on its own connection under a time budget. A progress
+handler aborts the statement when the budget runs out or when a pull or
+push needs the database, which SQLite rolls back cleanly. The remaining
+tasks are then left for a retry.
+"""
+
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+TASK_OK = 'ok'
+TASK_SKIPPED = 'skipped'
+TASK_YIELDED = 'yielded'
+TASK_TIMED_OUT = 'timed out'
+TASK_ERROR = 'error'
+
+# Time budget per task (seconds)
+TASK_BUDGETS = {
+    'optimize': 60,
+    'vacuum': 120,
+    'checkpoint': 30,
+    'quick_check': 120
+}
+
+# SQLite VM instructions between progress handler calls
+PROGRESS_HANDLER_OPS = 10000
+
+# Convert to incremental auto_vacuum when at least this share of the file
+# (and this many pages) is free
+VACUUM_FREE_RATIO = 0.1
+VACUUM_MIN_FREE_PAGES = 256
+
+# Rows sampled per index by the first ANALYZE (0 = exact)
+ANALYSIS_LIMIT = 1000
+
+# quick_check problems kept for the log message
+MAX_REPORTED_PROBLEMS = 5
+
+
+class DatabaseMaintenance:
+    """Runs the maintenance tasks against one Database"""
+
+    def __init__(self, database, should_yield=None):
+        """
+        Args:
+            database: Database instance
+            should_yield: Callable returning True while a sync needs the database
+        """
+        self.database = database
+        self.should_yield = should_yield or (lambda: False)
+        self.tasks = {
+            'optimize': self.optimize,
+            'vacuum': self.vacuum,
+            'checkpoint': self.checkpoint,
+            'quick_check': self.quick_check
+        }
+
+    def run(self, tasks=None):
+        """
+        Run tasks in order, stopping at the first one that yields to a sync
+
+        Args:
+            tasks: Task names to run (default: all)
+
+        Returns:
+            list: One {'task', 'status', 'detail', 'seconds'} per task
+        """
+        results = []
+        yielded = False
+        for name in tasks or list(self.tasks):
+            if yielded or self.should_yield():
+                yielded = True
+                results.append({'task': name, 'status': TASK_YIELDED, 'detail': "sync running", 'seconds': 0})
+                continue
+
+            started = time.monotonic()
+            deadline = started + TASK_BUDGETS[name]
+            stop_reason = []
+
+            def progress():
+                if self.should_yield():
+                    stop_reason.append(TASK_YIELDED)
+                    return 1
+                if time.monotonic() > deadline:
+                    stop_reason.append(TASK_TIMED_OUT)
+                    return 1
+                return 0
+
+            conn = self.database.get_connection()
+            conn.set_progress_handler(progress, PROGRESS_HANDLER_OPS)
+            try:
+                status, detail = self.tasks[name](conn)
+            except sqlite3.OperationalError as e:
+                if stop_reason:
+                    status, detail = stop_reason[0], "interrupted"
+                else:
+                    status, detail = TASK_ERROR, str(e)
+            except Exception as e:
+                status, detail = TASK_ERROR, str(e)
+            finally:
+                conn.close()
+
+            seconds = round(time.monotonic() - started, 2)
+            results.append({'task': name, 'status': status, 'detail': detail, 'seconds': seconds})
+            logger.info(f"Maintenance {name}: {status} ({detail}, {seconds}s)")
+            yielded = status == TASK_YIELDED
+        return results
+
+    def optimize(self, conn):
+        """Refresh query planner statistics"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            cursor.execute("ANALYZE")
+            conn.commit()
+            return TASK_OK, "initial ANALYZE"
+        # 0x10002: check every table, not only those this connection used
+        cursor.execute("PRAGMA optimize(0x10002)")
+        conn.commit()
+        return TASK_OK, "PRAGMA optimize"
+
+    def vacuum(self, conn):
+        """Release free pages (incremental vacuum, one-time conversion if needed)"""
+        cursor = conn.cursor()
+        mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        total_pages = cursor.execute("PRAGMA page_count").fetchone()[0]
+
+        if free_pages == 0:
+            return TASK_SKIPPED, "no free pages"
+        if mode == 2:
+            # Each result row is a step; fetch them all so every page is freed
+            cursor.execute("PRAGMA incremental_vacuum").fetchall()
+            return TASK_OK, f"freed {free_pages} of {total_pages} pages"
+        if mode == 1:
+            return TASK_SKIPPED, "full auto_vacuum already frees pages"
+
+        if free_pages < VACUUM_MIN_FREE_PAGES or free_pages < total_pages * VACUUM_FREE_RATIO:
+            return TASK_SKIPPED, f"{free_pages} of {total_pages} pages free"
+        # auto_vacuum only changes with a full VACUUM; interrupted, it is retried next time
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("VACUUM")
+        return TASK_OK, f"converted to incremental auto_vacuum, freed {free_pages} of {total_pages} pages"
+
+    def checkpoint(self, conn):
+        """Copy the write-ahead log into the database and truncate it"""
+        cursor = conn.cursor()
+        journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            return TASK_SKIPPED, f"journal mode {journal_mode}"
+        busy, log_frames, checkpointed = cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if busy:
+            return TASK_YIELDED, f"database busy, {checkpointed} of {log_frames} frames checkpointed"
+        return TASK_OK, f"{checkpointed} frames checkpointed"
+
+    def quick_check(self, conn):
+        """Check the file's structure (PRAGMA quick_check)"""
+        rows = [row[0] for row in conn.execute("PRAGMA quick_check").fetchall()]
+        if rows == ['ok']:
+            return TASK_OK, "ok"
+        problems = "; ".join(rows[:MAX_REPORTED_PROBLEMS])
+        more = f" (+{len(rows) - MAX_REPORTED_PROBLEMS} more)" if len(rows) > MAX_REPORTED_PROBLEMS else ""
+        return TASK_ERROR, f"integrity problems: {problems}{more}"
@@ -0,0 +1,190 @@
+"""
+San Beda Integration Tool - Day Fingerprints
+Skips re-ingesting closed attendance days whose content has not changed.
+
+Each closed day's records are hashed per source (San Beda host). When a
+re-pull produces the same fingerprint as the one stored for that day, the
+day's records are dropped instead of going through process_attendance and
+the INSERTs again.
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Days newer than this many days ago are still open (late sign-outs, edits)
+# and are always ingested
+FINGERPRINT_SETTLE_DAYS = 1
+
+
+def get_closed_before():
+    """Get the first date (YYYY-MM-DD) that is still considered open"""
+    return (datetime.now() - timedelta(days=FINGERPRINT_SETTLE_DAYS)).strftime("%Y-%m-%d")
+
+
+def compute_day_fingerprint(records):
+    """
+    Compute an order-independent fingerprint for one day's records
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    keys = sorted(
+        "\x1f".join(str(record.get(field) or '') for field in
+                    ('code', 'name', 'attendanceDate', 'signInTime', 'signOutTime'))
+        for record in records
+    )
+    return hashlib.sha256("\x1e".join(keys).encode('utf-8')).hexdigest()
+
+
+class DayFingerprintTracker:
+    """
+    Routes pulled records to ingest, holding back closed days until complete
+
+    Records of open days are ingested immediately. Records of closed days are
+    buffered per day; a day is flushed when the stream moves on to another
+    day (ordered=True), when every page it can continue into has arrived
+    (flush_through, for pages that complete out of order) or when close() is
+    called. On flush the day is fingerprinted and only ingested if it changed
+    since the last pull.
+
+    If a flushed day shows up again later in the same run (unordered
+    source data), its records are ingested directly and its stored
+    fingerprint is dropped so the next pull re-checks it.
+    """
+
+    def __init__(self, database, source, ingest, force=False, ordered=True):
+        """
+        Args:
+            database: Database instance
+            source: Upstream identifier (San Beda host)
+            ingest: Callable(records) -> int failed count
+            force: Ingest every day regardless of stored fingerprints
+            ordered: Whether records arrive grouped by date
+        """
+        self.database = database
+        self.source = source
+        self.ingest = ingest
+        self.force = force
+        self.ordered = ordered
+        self.closed_before = get_closed_before()
+
+        self._buffers = {}
+        self._day_pages = {}
+        self._flushed = set()
+        self._invalidated = set()
+
+        # Earliest page with records still held back (for pull checkpoints)
+        self.pending_since_page = None
+
+        self.days_unchanged = 0
+        self.days_ingested = 0
+        self.records_unchanged = 0
+
+    def add(self, records, page=None):
+        """
+        Route a batch of pulled records
+
+        Args:
+            records: Attendance records from the API
+            page: Page the records came from (tracked for checkpoints)
+        """
+        passthrough = []
+
+        for record in records:
+            day = record.get('attendanceDate')
+            if not day or day >= self.closed_before:
+                passthrough.append(record)
+                continue
+
+            if day in self._flushed:
+                # Day already fingerprinted this run - ingest and re-check next time
+                if day not in self._invalidated:
+                    self._invalidated.add(day)
+                    self.database.delete_day_fingerprints(day, day, source=self.source)
+                passthrough.append(record)
+                continue
+
+            if self.ordered and day not in self._buffers and self._buffers:
+                self.flush()
+
+            self._buffers.setdefault(day, []).append(record)
+            if page is not None:
+                first, last = self._day_pages.get(day, (page, page))
+                self._day_pages[day] = (min(first, page), max(last, page))
+                if self.pending_since_page is None or page < self.pending_since_page:
+                    self.pending_since_page = page
+
+        if passthrough:
+            self.ingest(passthrough)
+
+    def committed_through(self, page):
+        """
+        Get the last page whose records are all committed or skipped
+
+        Args:
+            page: Last page fully handed to add()
+        """
+        if self.pending_since_page is None:
+            return page
+        return min(page, self.pending_since_page - 1)
+
+    def flush_through(self, page):
+        """
+        Flush the buffered days that cannot continue past page
+
+        For pages that complete out of order: once every page up to page has
+        been handed to add(), a day last seen before page is complete (records
+        are grouped by date across pages). Days seen on page itself may still
+        run on into the next page and stay buffered.
+
+        Args:
+            page: Last page of the contiguous run of pages handed to add()
+        """
+        days = [day for day, (_, last) in self._day_pages.items() if last < page]
+        if days:
+            self.flush(days)
+
+    def flush(self, days=None):
+        """
+        Fingerprint and ingest (or skip) buffered days
+
+        Args:
+            days: Days to flush (default: every buffered day)
+        """
+        days = list(self._buffers) if days is None else days
+        if days:
+            self._flush_days(days)
+
+        pending = [first for day, (first, _) in self._day_pages.items() if day in self._buffers]
+        self.pending_since_page = min(pending) if pending else None
+
+    def _flush_days(self, days):
+        stored = self.database.get_day_fingerprints(self.source, min(days), max(days))
+
+        for day in days:
+            records = self._buffers.pop(day)
+            self._day_pages.pop(day, None)
+            self._flushed.add(day)
+            fingerprint = compute_day_fingerprint(records)
+
+            if not self.force and stored.get(day) == fingerprint:
+                self.days_unchanged += 1
+                self.records_unchanged += len(records)
+                logger.debug(f"Day {day} unchanged ({len(records)} records), skipping ingest")
+                continue
+
+            failed = self.ingest(records)
+            self.days_ingested += 1
+
+            if failed:
+                # Leave the day unfingerprinted so it is retried next time
+                self.database.delete_day_fingerprints(day, day, source=self.source)
+            else:
+                self.database.save_day_fingerprint(self.source, day, fingerprint, len(records))
+
+    def close(self):
+        """Flush whatever is still buffered at the end of a pull"""
+        self.flush()
@@ -0,0 +1,149 @@
+"""
+San Beda Integration Tool - Adaptive Sync Intervals
+Picks the next pull and push interval from what there is to do.
+
+Push: an empty queue waits the maximum interval; a backlog shortens the
+configured push interval (halved at PUSH_BACKLOG_HALVING records, and so
+on) down to the minimum.
+
+Pull: follows the attendance activity per hour of day over the last two
+weeks. The busiest hours (shift changes) pull at the minimum interval,
+hours without logs (overnight) at the maximum. Until there is history, the
+configured pull interval is used.
+
+For both, recent failed runs stretch the interval (up to
+1 + FAILURE_BACKOFF_FACTOR times), and every interval gets a little random
+jitter so several installations do not hit the servers in step. Results
+always stay within the configured minimum and maximum
+(api_config *_interval_min_minutes / *_interval_max_minutes).
+"""
+
+import json
+import logging
+import random
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the bounds (minutes)
+DEFAULT_PULL_INTERVAL_MIN_MINUTES = 5
+DEFAULT_PULL_INTERVAL_MAX_MINUTES = 60
+DEFAULT_PUSH_INTERVAL_MIN_MINUTES = 2
+DEFAULT_PUSH_INTERVAL_MAX_MINUTES = 60
+
+# Unsynced records at which the push interval is halved (twice this: a third, ...)
+PUSH_BACKLOG_HALVING = 50
+
+# All recent runs failed: interval x (1 + factor); scaled by the failure rate
+FAILURE_BACKOFF_FACTOR = 3
+RECENT_RUNS = 5
+
+# Attendance history used for the hourly activity profile, and how often it is recounted
+ACTIVITY_DAYS = 14
+ACTIVITY_REFRESH_SECONDS = 60 * 60
+
+# Random spread applied to every interval (fraction)
+INTERVAL_JITTER = 0.1
+
+
+class AdaptiveIntervalPolicy:
+    """Next pull/push interval from the backlog, activity profile and recent results"""
+
+    def __init__(self, database):
+        self.database = database
+        self.enabled = False
+        self.nominal = {'pull': 30 * 60, 'push': 15 * 60}
+        self.bounds = {
+            'pull': (DEFAULT_PULL_INTERVAL_MIN_MINUTES * 60, DEFAULT_PULL_INTERVAL_MAX_MINUTES * 60),
+            'push': (DEFAULT_PUSH_INTERVAL_MIN_MINUTES * 60, DEFAULT_PUSH_INTERVAL_MAX_MINUTES * 60)
+        }
+        self._activity = None
+        self._activity_loaded_at = 0.0
+
+    def configure(self, config, pull_interval_minutes, push_interval_minutes):
+        """Apply api_config: adaptive_intervals switch, configured intervals and bounds"""
+        self.enabled = bool(config.get('adaptive_intervals', 0))
+        self.nominal = {'pull': pull_interval_minutes * 60, 'push': push_interval_minutes * 60}
+        for kind, default_min, default_max in (
+            ('pull', DEFAULT_PULL_INTERVAL_MIN_MINUTES, DEFAULT_PULL_INTERVAL_MAX_MINUTES),
+            ('push', DEFAULT_PUSH_INTERVAL_MIN_MINUTES, DEFAULT_PUSH_INTERVAL_MAX_MINUTES)
+        ):
+            low = config.get(f'{kind}_interval_min_minutes') or default_min
+            high = config.get(f'{kind}_interval_max_minutes') or default_max
+            low, high = sorted((float(low) * 60, float(high) * 60))
+            self.bounds[kind] = (low, high)
+        self._activity = None
+
+    def _finish(self, kind, interval, reason):
+        low, high = self.bounds[kind]
+        interval *= random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER)
+        interval = max(low, min(high, interval))
+        logger.info(f"Next {kind} in {interval / 60:.1f} min ({reason})")
+        return interval
+
+    def recent_success_rate(self, kind):
+        """Fraction of the last RECENT_RUNS finished runs that succeeded (None without history)"""
+        # Cancelled runs say nothing about the upstream's health
+        logs = [log for log in self.database.get_recent_sync_logs(kind, limit=RECENT_RUNS * 2)
+                if log.get('status') != 'started'
+                and not json.loads(log.get('metadata') or '{}').get('cancelled')][:RECENT_RUNS]
+        if not logs:
+            return None
+        return sum(1 for log in logs if log['status'] == 'success') / len(logs)
+
+    def _apply_failures(self, kind, interval, reasons):
+        rate = self.recent_success_rate(kind)
+        if rate is not None and rate < 1:
+            interval *= 1 + FAILURE_BACKOFF_FACTOR * (1 - rate)
+            reasons.append(f"{rate:.0%} of recent runs succeeded")
+        return interval
+
+    def push_interval(self):
+        """Seconds until the next interval push"""
+        if not self.enabled:
+            return self.nominal['push']
+        try:
+            backlog = self.database.count_unsynced_timesheets()
+            if backlog == 0:
+                interval = self.bounds['push'][1]
+                reasons = ["nothing to push"]
+            else:
+                interval = self.nominal['push'] / (1 + backlog / PUSH_BACKLOG_HALVING)
+                reasons = [f"backlog {backlog}"]
+            interval = self._apply_failures('push', interval, reasons)
+            return self._finish('push', interval, ", ".join(reasons))
+        except Exception as e:
+            logger.error(f"Adaptive push interval error: {e}", exc_info=True)
+            return self.nominal['push']
+
+    def get_activity(self):
+        """Share of attendance logs per hour of day relative to the busiest hour (None without history)"""
+        if self._activity is None or time.monotonic() - self._activity_loaded_at > ACTIVITY_REFRESH_SECONDS:
+            counts = self.database.get_hourly_activity(ACTIVITY_DAYS)
+            busiest = max(counts)
+            self._activity = [count / busiest for count in counts] if busiest else []
+            self._activity_loaded_at = time.monotonic()
+        return self._activity or None
+
+    def pull_interval(self, now=None):
+        """Seconds until the next interval pull"""
+        if not self.enabled:
+            return self.nominal['pull']
+        try:
+            activity = self.get_activity()
+            if not activity:
+                interval = self.nominal['pull']
+                reasons = ["no activity history yet"]
+            else:
+                hour = (now or datetime.now()).hour
+                # Look ahead one hour so pulls speed up before a shift change, not after
+                level = max(activity[hour], activity[(hour + 1) % 24])
+                low, high = self.bounds['pull']
+                interval = high - (high - low) * level
+                reasons = [f"activity {level:.0%} of peak"]
+            interval = self._apply_failures('pull', interval, reasons)
+            return self._finish('pull', interval, ", ".join(reasons))
+        except Exception as e:
+            logger.error(f"Adaptive pull interval error: {e}", exc_info=True)
+            return self.nominal['pull']
@@ -0,0 +1,277 @@
+"""
+San Beda Integration Tool - Job Coordinator
+One pull and one push at a time, whoever starts them.
+
+Manual syncs from the UI and scheduled syncs all go through the
+coordinator. A request for a kind of job ('pull', 'push') that is already
+running does not start a second run: it becomes the single follow-up run
+that starts when the current one ends, and any further requests join that
+follow-up. A manual request's arguments (date range, UI callbacks) take
+precedence over a scheduled one's. Every request gets a JobHandle that
+reports the run's status and result.
+
+Each job carries a CancellationToken, passed to the job function as
+cancel_token. Cancelling a queued job drops it; cancelling a running job
+asks it to stop after the page or batch in progress.
+
+A job function may also just start the run and return a
+concurrent.futures.Future of its result (the async engine's submit_pull /
+submit_push). The job then finishes from the future's done callback and
+no thread waits for it.
+"""
+
+import logging
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+from .cancellation import CancellationToken, DEFAULT_CANCEL_REASON
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# Finished jobs kept for status queries
+JOB_HISTORY_SIZE = 50
+
+
+class JobHandle:
+    """Status and result of one coordinated run"""
+
+    def __init__(self, kind, trigger, call):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.triggers = [trigger]
+        self.call = call
+        self.status = JOB_QUEUED
+        self.requested_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.cancel_token = CancellationToken()
+        self._done = threading.Event()
+
+    @property
+    def trigger(self):
+        return self.triggers[0]
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the run ends; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'triggers': list(self.triggers),
+            'requested_at': self.requested_at.isoformat(timespec='seconds'),
+            'started_at': self.started_at.isoformat(timespec='seconds') if self.started_at else None,
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+            'cancel_requested': self.cancel_token.cancelled,
+            'cancel_reason': self.cancel_token.reason,
+            'result': self.result
+        }
+
+
+class JobCoordinator:
+    """Mutual exclusion and request coalescing per job kind"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = {}
+        self._follow_up = {}
+        self._jobs = {}
+        self._history = deque(maxlen=JOB_HISTORY_SIZE)
+
+    def submit(self, kind, func, *args, trigger='manual', background=True, **kwargs):
+        """
+        Request a run of func(*args, **kwargs) as a `kind` job
+
+        func is called as func(*args, cancel_token=..., **kwargs) with the
+        job's CancellationToken and returns (success, message, stats) like
+        pull_data / push_data, or a Future of that tuple.
+
+        Args:
+            kind: Job kind ('pull' or 'push'); one run per kind at a time
+            trigger: What asked for the run ('manual', 'interval', ...)
+            background: Run in a new thread (True) or in the calling thread.
+                        A func returning a Future does not block, so it can
+                        be started in the calling thread.
+
+        Returns:
+            JobHandle: The new run, or the follow-up run this request joined
+        """
+        call = (func, args, kwargs)
+        with self._lock:
+            if kind in self._running:
+                follow_up = self._follow_up.get(kind)
+                if follow_up is not None:
+                    # Join the queued follow-up; a manual request's arguments win
+                    if trigger == 'manual' or 'manual' not in follow_up.triggers:
+                        follow_up.call = call
+                    follow_up.triggers.append(trigger)
+                    logger.info(f"{kind} already running with a follow-up queued, request ({trigger}) joined it")
+                    return follow_up
+
+                follow_up = self._follow_up[kind] = self._new_handle(kind, trigger, call)
+                logger.info(f"{kind} already running, queued one follow-up run ({trigger})")
+                return follow_up
+
+            handle = self._running[kind] = self._new_handle(kind, trigger, call)
+            handle.status = JOB_RUNNING
+
+        if background:
+            threading.Thread(target=self._drive, args=(handle,), name=f"{kind}-job", daemon=True).start()
+        else:
+            self._drive(handle)
+        return handle
+
+    def _new_handle(self, kind, trigger, call):
+        # Caller holds self._lock
+        handle = JobHandle(kind, trigger, call)
+        self._jobs[handle.id] = handle
+        return handle
+
+    def _record_finished(self, handle):
+        # Caller holds self._lock
+        if len(self._history) == self._history.maxlen:
+            self._jobs.pop(self._history[0].id, None)
+        self._history.append(handle)
+
+    def _drive(self, handle):
+        """Run a job, then the follow-up queued behind it, until none is left"""
+        while handle is not None:
+            pending = self._execute(handle)
+            if pending is not None:
+                # The done callback finishes the job and starts the follow-up
+                pending.add_done_callback(lambda future, handle=handle: self._complete(handle, future))
+                return
+            handle = self._advance(handle)
+
+    def _advance(self, handle):
+        """Retire a finished job and promote its follow-up (returned, or None)"""
+        kind = handle.kind
+        with self._lock:
+            self._record_finished(handle)
+
+            handle = self._follow_up.pop(kind, None)
+            if handle is None:
+                del self._running[kind]
+            else:
+                self._running[kind] = handle
+        return handle
+
+    def _complete(self, handle, future):
+        # Done callback of a job that returned a Future; it may run on the
+        # thread that resolved it (the engine loop), so the follow-up gets
+        # its own thread
+        try:
+            result = future.result()
+        except Exception as e:
+            result = e
+        self._finish(handle, result)
+
+        follow_up = self._advance(handle)
+        if follow_up is not None:
+            threading.Thread(target=self._drive, args=(follow_up,), name=f"{follow_up.kind}-job", daemon=True).start()
+
+    def _execute(self, handle):
+        """Start a job; returns its Future if it finishes later, otherwise finishes it"""
+        func, args, kwargs = handle.call
+        handle.status = JOB_RUNNING
+        handle.started_at = datetime.now()
+        logger.info(f"{handle.kind} job {handle.id} starting ({', '.join(handle.triggers)})")
+        try:
+            result = func(*args, cancel_token=handle.cancel_token, **kwargs)
+        except Exception as e:
+            result = e
+        if isinstance(result, Future):
+            return result
+        self._finish(handle, result)
+        return None
+
+    def _finish(self, handle, result):
+        """Record a job's result: (success, message, stats) or the exception it raised"""
+        try:
+            if isinstance(result, Exception):
+                raise result
+            success, message, stats = result
+            handle.result = {'success': success, 'message': message, 'stats': stats}
+            if success:
+                handle.status = JOB_SUCCEEDED
+            else:
+                handle.status = JOB_CANCELLED if handle.cancel_token.cancelled else JOB_FAILED
+        except Exception as e:
+            logger.error(f"{handle.kind} job {handle.id} error: {e}", exc_info=True)
+            handle.result = {'success': False, 'message': str(e), 'stats': {}}
+            handle.status = JOB_FAILED
+        finally:
+            handle.finished_at = datetime.now()
+            handle.call = None
+            handle._done.set()
+
+    def cancel(self, job_id, reason=DEFAULT_CANCEL_REASON):
+        """
+        Cancel a job: a queued job is dropped, a running one asked to stop
+
+        Returns:
+            JobHandle: The job (its status turns 'cancelled' once it has
+                stopped), or None if the id is unknown
+        """
+        with self._lock:
+            handle = self._jobs.get(job_id)
+            if handle is None or handle.done:
+                return handle
+            queued = self._follow_up.get(handle.kind) is handle
+            if queued:
+                del self._follow_up[handle.kind]
+
+        handle.cancel_token.cancel(reason)
+        if not queued:
+            logger.info(f"{handle.kind} job {handle.id} cancellation requested ({reason})")
+            return handle
+
+        logger.info(f"Queued {handle.kind} job {handle.id} cancelled ({reason})")
+        handle.status = JOB_CANCELLED
+        handle.result = {'success': False, 'message': f"Cancelled before it started ({reason})",
+                         'stats': {'cancelled': True}}
+        handle.finished_at = datetime.now()
+        handle.call = None
+        handle._done.set()
+        with self._lock:
+            self._record_finished(handle)
+        return handle
+
+    def is_running(self, kind):
+        with self._lock:
+            return kind in self._running
+
+    def get_job(self, job_id):
+        """Get a job handle by id (recent jobs only)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self):
+        """Running and queued jobs per kind, plus recently finished jobs"""
+        with self._lock:
+            kinds = set(self._running) | set(self._follow_up)
+            return {
+                'jobs': {
+                    kind: {
+                        'running': self._running[kind].as_dict() if kind in self._running else None,
+                        'queued': self._follow_up[kind].as_dict() if kind in self._follow_up else None
+                    } for kind in sorted(kinds)
+                },
+                'recent': [handle.as_dict() for handle in reversed(self._history)]
+            }
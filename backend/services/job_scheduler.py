@@ -0,0 +1,271 @@
+"""
+San Beda Integration Tool - Job Scheduler
+Timer heap plus worker pool used by SyncScheduler.
+
+One thread sleeps until the earliest job in the heap is due (or until a job
+is added or cancelled), then hands the job to a small thread pool, so a long
+pull never delays the push or cleanup behind it and an idle app does not
+wake up every second.
+
+Jobs with the same key never overlap: a job that comes due while another
+run with its key is still going is held and started right after it ends
+(several such runs collapse into one).
+
+An interval can be a callable returning seconds (see interval_policy); such
+adaptive jobs are rescheduled when a run ends, so the next interval
+reflects what the run just did.
+
+Listeners are told whenever a recurring job starts or gets a new next run
+time, which is how SyncScheduler persists its schedule across restarts.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Jobs that can run at the same time (pull, push, cleanup, backlog check)
+DEFAULT_JOB_WORKERS = 4
+
+# The timer thread re-checks the heap at least this often, so a change of the
+# wall clock (jobs are due at wall-clock times) is noticed
+MAX_SLEEP_SECONDS = 300
+
+
+class ScheduledJob:
+    """One heap entry: a recurring (interval or daily) or one-shot job"""
+
+    def __init__(self, key, func, args=(), interval=None, at=None):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.at = at
+        self.cancelled = False
+        self.next_run = None
+        self.last_run = None
+        self.last_interval = None
+
+    @property
+    def recurring(self):
+        return self.interval is not None or self.at is not None
+
+    @property
+    def adaptive(self):
+        return callable(self.interval)
+
+    def schedule_next(self, now):
+        """Set next_run (epoch seconds) to the next occurrence after now"""
+        if self.interval is not None:
+            self.last_interval = float(self.interval() if self.adaptive else self.interval)
+            self.next_run = now + self.last_interval
+        else:
+            hour, minute = self.at
+            current = datetime.fromtimestamp(now)
+            due = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if due <= current:
+                due += timedelta(days=1)
+            self.next_run = due.timestamp()
+        return self.next_run
+
+
+class JobScheduler:
+    """Per-instance timer heap that dispatches due jobs to a worker pool"""
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, name="sync-job"):
+        self.max_workers = max_workers
+        self.name = name
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        # Recurring jobs, including adaptive ones off the heap while they run
+        self._recurring = set()
+        self._running_keys = set()
+        self._held = {}
+        self._listeners = []
+        self._executor = None
+        self._thread = None
+        self.running = False
+
+    # ---- adding and removing jobs ----
+
+    def every(self, key, seconds, func, *args, first_run=None):
+        """
+        Run func(*args) every `seconds` seconds, first after one interval
+
+        seconds may be a callable returning the next interval; it is called
+        after each run ends. first_run (epoch seconds) overrides the time of
+        the first run.
+        """
+        job = ScheduledJob(key, func, args, interval=seconds if callable(seconds) else float(seconds))
+        return self._add_recurring(job, first_run)
+
+    def daily_at(self, key, time_str, func, *args, first_run=None):
+        """Run func(*args) every day at local time 'HH:MM' (first_run as for every())"""
+        hour, minute = (int(part) for part in time_str.split(':'))
+        job = ScheduledJob(key, func, args, at=(hour, minute))
+        return self._add_recurring(job, first_run)
+
+    def _add_recurring(self, job, first_run):
+        if first_run is None:
+            job.schedule_next(time.time())
+        else:
+            job.next_run = first_run
+        with self._cond:
+            self._recurring.add(job)
+        self._add(job)
+        self._notify(job)
+        return job
+
+    def run_later(self, key, delay, func, *args):
+        """Run func(*args) once after `delay` seconds"""
+        job = ScheduledJob(key, func, args)
+        job.next_run = time.time() + max(0.0, delay)
+        return self._add(job)
+
+    def run_now(self, key, func, *args):
+        """Run func(*args) once as soon as no other job with this key is running"""
+        return self.run_later(key, 0, func, *args)
+
+    def cancel(self, job):
+        """Cancel a job (it is dropped from the heap when it comes up)"""
+        with self._cond:
+            job.cancelled = True
+            self._recurring.discard(job)
+            if self._held.get(job.key) is job:
+                del self._held[job.key]
+            self._cond.notify()
+
+    def clear(self, recurring_only=True):
+        """Cancel all recurring jobs (and one-shot jobs unless recurring_only)"""
+        with self._cond:
+            for job in self._recurring:
+                job.cancelled = True
+            self._recurring.clear()
+            for _, _, job in self._heap:
+                if job.recurring or not recurring_only:
+                    job.cancelled = True
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def add_listener(self, callback):
+        """Call callback(job) when a recurring job starts or is rescheduled (from the calling or a worker thread)"""
+        self._listeners.append(callback)
+
+    def _notify(self, job):
+        # Never called with self._cond held: listeners may touch the database
+        for callback in list(self._listeners):
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"Job listener error: {e}", exc_info=True)
+
+    def get_jobs(self):
+        """Scheduled jobs, earliest first, for status display"""
+        with self._cond:
+            entries = sorted(entry for entry in self._heap if not entry[2].cancelled)
+            return [{
+                'key': job.key,
+                'recurring': job.recurring,
+                'interval_seconds': round(job.last_interval) if job.last_interval is not None else None,
+                'next_run': datetime.fromtimestamp(next_run).isoformat(timespec='seconds'),
+                'last_run': datetime.fromtimestamp(job.last_run).isoformat(timespec='seconds') if job.last_run else None,
+                'running': job.key in self._running_keys
+            } for next_run, _, job in entries]
+
+    def is_running(self, key):
+        with self._cond:
+            return key in self._running_keys
+
+    def _add(self, job):
+        with self._cond:
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+            self._cond.notify()
+        return job
+
+    # ---- timer thread ----
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self._thread = threading.Thread(target=self._run_timer, name=f"{self.name}-timer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop dispatching; running jobs finish in the background"""
+        with self._cond:
+            self.running = False
+            self._held.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_timer(self):
+        logger.info("Job scheduler started")
+        with self._cond:
+            while self.running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                next_run, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = next_run - time.time()
+                if delay > 0:
+                    self._cond.wait(timeout=min(delay, MAX_SLEEP_SECONDS))
+                    continue
+
+                heapq.heappop(self._heap)
+                if job.recurring and not job.adaptive:
+                    job.schedule_next(time.time())
+                    heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+                self._dispatch(job)
+        logger.info("Job scheduler stopped")
+
+    def _dispatch(self, job):
+        # Caller holds self._cond
+        if job.key in self._running_keys:
+            if self._held.get(job.key) is None:
+                logger.info(f"{job.key} job still running, next run starts when it ends")
+            self._held[job.key] = job
+            return
+        self._running_keys.add(job.key)
+        job.last_run = time.time()
+        self._executor.submit(self._run_job, job)
+
+    def _run_job(self, job):
+        if job.recurring:
+            self._notify(job)
+        try:
+            job.func(*job.args)
+        except Exception as e:
+            logger.error(f"{job.key} job error: {e}", exc_info=True)
+        finally:
+            if job.adaptive and not job.cancelled and self.running:
+                # Outside the lock: the interval callable may query the database
+                try:
+                    job.schedule_next(time.time())
+                except Exception as e:
+                    logger.error(f"{job.key} interval error: {e}", exc_info=True)
+                    job.next_run = time.time() + (job.last_interval or MAX_SLEEP_SECONDS)
+                self._add(job)
+                self._notify(job)
+            with self._cond:
+                self._running_keys.discard(job.key)
+                held = self._held.pop(job.key, None)
+                if held is not None and not held.cancelled and self.running:
+                    self._dispatch(held)
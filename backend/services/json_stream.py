@@ -0,0 +1,223 @@
+"""
+San Beda Integration Tool - Streaming JSON Decoder
+Incremental decoding of attendance report pages.
+
+Attendance pages are fed to PageRecordStream chunk by chunk as they arrive
+from the network; each call to feed() returns the pageData records that are
+complete so far. Only the current chunk and one partial record are held in
+memory, whatever the page size.
+
+When ijson with its C backend is installed it is used for decoding;
+otherwise the standard library decoder is used.
+"""
+
+import codecs
+import json
+import logging
+
+try:
+    import ijson
+    HAS_FAST_BACKEND = ijson.backend == 'yajl2_c'
+except ImportError:
+    ijson = None
+    HAS_FAST_BACKEND = False
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the response per iteration
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# JSON path of the attendance records in a report response
+RECORDS_KEY = 'pageData'
+
+
+class StreamDecodeError(Exception):
+    """Raised when a streamed page is not valid JSON"""
+
+
+class _StdlibPageDecoder:
+    """Incremental pageData decoder built on json.JSONDecoder.raw_decode"""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._state = 'head'  # head -> records -> tail
+        self._streamed = False
+        self._head = []
+        self._tail = []
+
+    def feed(self, chunk):
+        self._buf += self._text.decode(chunk)
+        records = []
+
+        if self._state == 'head':
+            self._consume_head()
+
+        if self._state == 'records':
+            self._consume_records(records)
+
+        if self._state == 'tail':
+            self._tail.append(self._buf)
+            self._buf = ''
+
+        return records
+
+    def _consume_head(self):
+        """Move text up to the opening '[' of pageData into the head buffer"""
+        key_pos = self._buf.find(f'"{RECORDS_KEY}"')
+        if key_pos < 0:
+            # Keep a short overlap in case the key is split across chunks
+            keep = len(RECORDS_KEY) + 2
+            if len(self._buf) > keep:
+                self._head.append(self._buf[:-keep])
+                self._buf = self._buf[-keep:]
+            return
+
+        pos = key_pos + len(RECORDS_KEY) + 2
+        length = len(self._buf)
+        while pos < length and self._buf[pos] in ' \t\r\n:':
+            pos += 1
+        if pos >= length:
+            return
+
+        if self._buf[pos] != '[':
+            # pageData is null or not a list: nothing to stream
+            self._state = 'tail'
+            return
+
+        self._head.append(self._buf[:pos])
+        self._buf = self._buf[pos + 1:]
+        self._state = 'records'
+        self._streamed = True
+
+    def _consume_records(self, records):
+        """Decode every complete record at the front of the buffer"""
+        buf = self._buf
+        pos = 0
+        length = len(buf)
+
+        while True:
+            while pos < length and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= length:
+                break
+            if buf[pos] == ']':
+                self._state = 'tail'
+                pos += 1
+                break
+            try:
+                record, pos = self._decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Incomplete record - wait for the next chunk
+                break
+            records.append(record)
+
+        self._buf = buf[pos:]
+
+    def close(self):
+        """Finish decoding and return the response without its records"""
+        self._buf += self._text.decode(b'', final=True)
+        if self._state == 'records':
+            raise StreamDecodeError("Response ended inside pageData")
+
+        self._tail.append(self._buf)
+        separator = '[]' if self._streamed else ''
+        text = ''.join(self._head) + separator + ''.join(self._tail)
+
+        try:
+            return json.loads(text) if text.strip() else {}
+        except json.JSONDecodeError as e:
+            raise StreamDecodeError(f"Invalid JSON response: {e}")
+
+
+class _IjsonPageDecoder:
+    """Incremental pageData decoder using the ijson C backend"""
+
+    HEADER_PATHS = ('code', 'desc', 'data.total', 'data.page', 'data.pageSize')
+
+    def __init__(self):
+        self._records = ijson.sendable_list()
+        self._records_coro = ijson.items_coro(self._records, f'data.{RECORDS_KEY}.item')
+        self._header = {}
+        self._header_coros = []
+        for path in self.HEADER_PATHS:
+            target = ijson.sendable_list()
+            self._header_coros.append((path, target, ijson.items_coro(target, path)))
+
+    def feed(self, chunk):
+        try:
+            self._records_coro.send(chunk)
+            for _, _, coro in self._header_coros:
+                coro.send(chunk)
+        except ijson.JSONError as e:
+            raise StreamDecodeError(f"Invalid JSON response: {e}")
+
+        records = list(self._records)
+        del self._records[:]
+        return records
+
+    def close(self):
+        try:
+            self._records_coro.close()
+            for path, target, coro in self._header_coros:
+                coro.close()
+                if target:
+                    self._header[path] = target[0]
+        except ijson.IncompleteJSONError as e:
+            raise StreamDecodeError(f"Response ended early: {e}")
+        except ijson.JSONError as e:
+            raise StreamDecodeError(f"Invalid JSON response: {e}")
+
+        response = {'data': {RECORDS_KEY: []}}
+        for path, value in self._header.items():
+            if path.startswith('data.'):
+                response['data'][path[5:]] = value
+            else:
+                response[path] = value
+        return response
+
+
+class PageRecordStream:
+    """
+    Streams pageData records out of an attendance report response
+
+    Usage:
+        stream = PageRecordStream()
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            for record in stream.feed(chunk):
+                ...
+        body = stream.close()  # code/desc/data.total, pageData left empty
+    """
+
+    def __init__(self, use_fast_backend=True):
+        if use_fast_backend and HAS_FAST_BACKEND:
+            self._decoder = _IjsonPageDecoder()
+            self.backend = 'ijson'
+        else:
+            self._decoder = _StdlibPageDecoder()
+            self.backend = 'stdlib'
+        self.record_count = 0
+
+    def feed(self, chunk):
+        """
+        Feed the next chunk of response bytes
+
+        Returns:
+            list: Records completed by this chunk (may be empty)
+        """
+        records = self._decoder.feed(chunk)
+        self.record_count += len(records)
+        return records
+
+    def close(self):
+        """
+        Signal end of response
+
+        Returns:
+            dict: The decoded response with an empty pageData list
+
+        Raises:
+            StreamDecodeError: If the response was truncated or malformed
+        """
+        return self._decoder.close()
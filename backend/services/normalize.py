@@ -0,0 +1,178 @@
+"""
+San Beda Integration Tool - Attendance Normalization
+Validates and converts a page of San Beda attendance records in one pass.
+
+San Beda returns dates as "YYYY-MM-DD" and times as "HH:MM". Instead of
+building a string and running datetime.strptime/strftime for every IN and
+OUT field, the normalizer checks the fixed layout by slicing and caches the
+converted date and time fragments, which repeat heavily within a page.
+Values outside the fixed layout (e.g. "9:05" or "2024-1-5") fall back to
+strptime, which accepts them as the importer always has.
+Invalid records are returned with a reason instead of being logged one by
+one.
+"""
+
+import calendar
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Reject reasons
+REJECT_MISSING_FIELDS = 'missing_fields'
+REJECT_INVALID_DATE = 'invalid_date'
+REJECT_INVALID_SIGN_IN = 'invalid_sign_in_time'
+REJECT_INVALID_SIGN_OUT = 'invalid_sign_out_time'
+
+# Bound on cached date prefixes and times (one per distinct value)
+DATE_CACHE_LIMIT = 4096
+
+# One attendance record ready for ingest. sign_in/sign_out and their
+# sync ids are None when the record has no such time.
+NormalizedAttendance = namedtuple('NormalizedAttendance', [
+    'employee_code', 'employee_name', 'date',
+    'sign_in', 'sync_id_in', 'sign_out', 'sync_id_out'
+])
+
+_DIGITS = frozenset('0123456789')
+
+
+def _strptime_compact(value, layout, compact_layout):
+    """Convert with strptime/strftime (slow path), or None if invalid"""
+    try:
+        return datetime.strptime(value, layout).strftime(compact_layout)
+    except ValueError:
+        return None
+
+
+def _parse_date(value):
+    """Convert "YYYY-MM-DD" to "YYYYMMDD", or None if invalid"""
+    if not isinstance(value, str):
+        return None
+    if len(value) != 10 or value[4] != '-' or value[7] != '-':
+        return _strptime_compact(value, "%Y-%m-%d", "%Y%m%d")
+    compact = value[:4] + value[5:7] + value[8:]
+    if not _DIGITS.issuperset(compact):
+        return None
+    year, month, day = int(compact[:4]), int(compact[4:6]), int(compact[6:])
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return compact
+
+
+def _parse_time(value):
+    """Convert "HH:MM" to "HHMM", or None if invalid"""
+    if not isinstance(value, str):
+        return None
+    if len(value) != 5 or value[2] != ':':
+        return _strptime_compact(value, "%H:%M", "%H%M")
+    compact = value[:2] + value[3:]
+    if not _DIGITS.issuperset(compact) or compact[:2] > '23' or compact[2:] > '59':
+        return None
+    return compact
+
+
+class AttendanceNormalizer:
+    """Validates attendance records and builds their timesheet sync ids"""
+
+    def __init__(self):
+        self._dates = {}
+        self._times = {}
+
+    def _date(self, value):
+        try:
+            return self._dates[value]
+        except (KeyError, TypeError):
+            pass
+        compact = _parse_date(value)
+        if isinstance(value, str):
+            if len(self._dates) >= DATE_CACHE_LIMIT:
+                self._dates.clear()
+            self._dates[value] = compact
+        return compact
+
+    def _time(self, value):
+        try:
+            return self._times[value]
+        except (KeyError, TypeError):
+            pass
+        compact = _parse_time(value)
+        if isinstance(value, str):
+            if len(self._times) >= DATE_CACHE_LIMIT:
+                self._times.clear()
+            self._times[value] = compact
+        return compact
+
+    def normalize(self, records):
+        """
+        Validate and convert a page of attendance records
+
+        Sync ids keep the format "<code>_<YYYYMMDDHHMMSS>_IN|OUT" used since
+        the first release, so existing rows are still recognised as
+        duplicates.
+
+        Args:
+            records: Attendance records from the San Beda API
+
+        Returns:
+            tuple: (entries: list of NormalizedAttendance,
+                    rejects: list of (record, reason))
+        """
+        entries = []
+        rejects = []
+        date_of = self._date
+        time_of = self._time
+
+        for record in records:
+            code = record.get('code')
+            name = record.get('name')
+            date = record.get('attendanceDate')
+
+            if not code or not name or not date:
+                rejects.append((record, REJECT_MISSING_FIELDS))
+                continue
+            if not isinstance(code, str):
+                code = str(code)
+
+            ymd = date_of(date)
+            if ymd is None:
+                rejects.append((record, REJECT_INVALID_DATE))
+                continue
+
+            sign_in = record.get('signInTime') or None
+            sync_id_in = None
+            if sign_in:
+                hm = time_of(sign_in)
+                if hm is None:
+                    rejects.append((record, REJECT_INVALID_SIGN_IN))
+                    continue
+                sync_id_in = f"{code}_{ymd}{hm}00_IN"
+
+            sign_out = record.get('signOutTime') or None
+            sync_id_out = None
+            if sign_out:
+                hm = time_of(sign_out)
+                if hm is None:
+                    rejects.append((record, REJECT_INVALID_SIGN_OUT))
+                    continue
+                sync_id_out = f"{code}_{ymd}{hm}00_OUT"
+
+            entries.append(NormalizedAttendance(
+                code, name, date, sign_in, sync_id_in, sign_out, sync_id_out
+            ))
+
+        return entries, rejects
+
+
+def summarize_rejects(rejects):
+    """
+    Count rejected records by reason
+
+    Returns:
+        dict: {reason: count}
+    """
+    summary = {}
+    for _, reason in rejects:
+        summary[reason] = summary.get(reason, 0) + 1
+    return summary
@@ -3,28 +3,42 @@ San Beda Integration Tool - Pull Service
 Service for pulling timesheet data from San Beda's timekeeping system
 """
 
-import requests
 import logging
 from datetime import datetime, timedelta
-import json
+import uuid
 from urllib.parse import urlencode
 from .auth_service import AuthService
+from .cancellation import CancellationToken
+from .json_stream import PageRecordStream, STREAM_CHUNK_SIZE
+from .fingerprints import DayFingerprintTracker
+from .normalize import AttendanceNormalizer, summarize_rejects
+from .rate_limit import configure_bucket, DEFAULT_PULL_RATE, DEFAULT_PULL_BURST
+from .transport import create_session, configure_timeouts, transport_metrics, url_host
 
 logger = logging.getLogger(__name__)
 
+# Unfinished pull runs that have not advanced for this long are not resumed
+CHECKPOINT_MAX_AGE_HOURS = 12
+
 
 class PullService:
     """Service for pulling data from San Beda timekeeping system"""
 
+    # Page size for attendance report requests
+    PAGE_SIZE = 100
+
+    # Overridden by the async engine to swap in its auth service
+    auth_service_class = AuthService
+
+    # Recorded in the sync log metadata; overridden by the async engine
+    ENGINE = 'threaded'
+
     def __init__(self, database):
         self.database = database
-        self.auth_service = AuthService(database)
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'San Beda Integration Tool/1.0',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json;charset=UTF-8'
-        })
+        self.auth_service = self.auth_service_class(database)
+        self.normalizer = AttendanceNormalizer()
+        # Own headers (the login token), connection pools shared with auth_service
+        self.session = create_session({'Content-Type': 'application/json;charset=UTF-8'})
 
     def get_config(self):
         """Get pull configuration from database"""
@@ -37,6 +51,26 @@ class PullService:
 
         return config
 
+    def configure_rate_limit(self, config):
+        """Apply the configured San Beda request rate and return the host's bucket"""
+        rate = config.get('pull_rate_limit')
+        burst = config.get('pull_rate_burst')
+        return configure_bucket(
+            config['pull_host'],
+            DEFAULT_PULL_RATE if rate is None else rate,
+            DEFAULT_PULL_BURST if burst is None else burst
+        )
+
+    def prepare_run(self, config):
+        """Apply the run's rate limit, timeouts and token lifetime, and snapshot their counters"""
+        self.host = config['pull_host']
+        self.rate_bucket = self.configure_rate_limit(config)
+        self.rate_snapshot = self.rate_bucket.snapshot()
+        configure_timeouts(config)
+        self.transport_snapshot = transport_metrics.snapshot(url_host(self.host))
+        self.auth_service.token_manager.configure(config)
+        self.token_snapshot = self.auth_service.token_manager.snapshot()
+
     def test_connection(self):
         """Test connection to San Beda API"""
         try:
@@ -46,32 +80,56 @@ class PullService:
             logger.error(f"Connection test error: {e}")
             return False, f"Error: {str(e)}"
 
-    def pull_data(self, date_from=None, date_to=None, progress_callback=None):
+    def pull_data(self, date_from=None, date_to=None, progress_callback=None, force=False, resume=True,
+                  cancel_token=None):
         """
         Pull timesheet data from San Beda timekeeping system
 
+        Closed days whose content fingerprint matches the previous pull are
+        not re-ingested unless force is set. Progress is checkpointed after
+        every committed page; an interrupted run for the same range is
+        resumed from its checkpoint unless resume is False. A cancelled run
+        stops before its next page (see record_cancelled).
+
         Args:
             date_from: Start date in "YYYY-MM-DD" format (optional, defaults to yesterday)
             date_to: End date in "YYYY-MM-DD" format (optional, defaults to today)
             progress_callback: Optional callback function to report progress
+            force: Re-ingest every day even if unchanged since the last pull
+            resume: Continue an unfinished run for the same range if one exists
+            cancel_token: Optional CancellationToken checked between pages
 
         Returns:
             tuple: (success: bool, message: str, stats: dict)
         """
+        cancel_token = cancel_token or CancellationToken()
         log_id = self.database.create_sync_log('pull')
-        stats = {
-            'processed': 0,
-            'success': 0,
-            'failed': 0,
-            'skipped': 0
-        }
+        stats = self.new_stats()
+        fingerprints = None
+        checkpoint = None
+        page = 1
+
+        def commit_before_failure():
+            """Commit held-back days and checkpoint the pages before the failing one"""
+            if fingerprints:
+                fingerprints.close()
+            if checkpoint:
+                self.database.update_pull_checkpoint(checkpoint['run_id'], last_page=page - 1)
 
         try:
-            logger.info("Starting pull sync from San Beda")
+            logger.info(f"Starting pull sync from San Beda ({self.ENGINE} engine)")
 
             # Get configuration
             config = self.get_config()
             host = config['pull_host']
+            self.prepare_run(config)
+
+            # Closed days are held back and skipped if their fingerprint is unchanged
+            fingerprints = DayFingerprintTracker(
+                self.database, host,
+                ingest=lambda records: self.process_page(records, stats),
+                force=force
+            )
 
             # Get authentication token
             login_token = self.auth_service.get_valid_token()
@@ -80,25 +138,29 @@ class PullService:
             self.session.headers['X-Subject-Token'] = login_token
 
             # Calculate date range
-            if date_from and date_to:
-                # Use provided dates
-                start_time_str = f"{date_from} 00:00:00"
-                end_time_str = f"{date_to} 23:59:59"
-            else:
-                # Default: yesterday 00:00:00 to today 23:59:59
-                yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-                today = datetime.now().strftime("%Y-%m-%d")
-                start_time_str = f"{yesterday} 00:00:00"
-                end_time_str = f"{today} 23:59:59"
+            start_time_str, end_time_str = self.get_time_range(date_from, date_to)
 
             logger.info(f"Pulling data from {start_time_str} to {end_time_str}")
 
+            # Resume an interrupted run for this range, or start a new one
+            checkpoint = self.open_checkpoint(host, start_time_str[:10], end_time_str[:10], resume)
+            run_id = checkpoint['run_id']
+            resumed_from_page = checkpoint['last_page'] + 1 if checkpoint['last_page'] else None
+            if resumed_from_page:
+                logger.info(f"Resuming pull run {run_id} from page {resumed_from_page}")
+
             # Pull data with pagination
-            page = 1
-            page_size = 100  # Adjust based on performance
+            page = resumed_from_page or 1
+            page_size = self.PAGE_SIZE
             total_records = 0
+            verify_total = resumed_from_page is not None
 
             while True:
+                # Stop between pages once the run is no longer wanted
+                if cancel_token.cancelled:
+                    commit_before_failure()
+                    return self.record_cancelled(log_id, run_id, stats, cancel_token.reason, total_records)
+
                 logger.info(f"Fetching page {page}...")
 
                 # Emit progress update
@@ -111,78 +173,76 @@ class PullService:
                         "records_processed": stats['processed']
                     })
 
-                # Build request parameters
-                params = {
-                    'startTime': start_time_str,
-                    'endTime': end_time_str,
-                    'personName': '',
-                    'personId': '',
-                    'deptId': '',
-                    'page': page,
-                    'pageSize': page_size
-                }
-
                 # Build URL
-                url = f"http://{host}/brms/api/v1.0/attendance/record-info-report/page?{urlencode(params)}"
+                url = self.build_page_url(host, start_time_str, end_time_str, page, page_size)
 
-                # Make API request
-                response = self.session.get(url, timeout=30)
+                # Renew the token if it is about to expire (in memory, no database read)
+                login_token = self.auth_service.get_valid_token()
+                self.session.headers['X-Subject-Token'] = login_token
+
+                # Make API request (streamed so large pages are never fully buffered)
+                response = self.session.get(url, timeout=30, stream=True)
 
                 if response.status_code == 401:
-                    # Token expired, re-authenticate
+                    # Token expired, re-authenticate (shared with any concurrent refresh)
+                    response.close()
                     logger.warning("Token expired, re-authenticating...")
-                    self.auth_service.invalidate_token()
-                    login_token = self.auth_service.authenticate()
+                    login_token = self.auth_service.refresh_token(login_token)
                     self.session.headers['X-Subject-Token'] = login_token
 
                     # Retry request
-                    response = self.session.get(url, timeout=30)
+                    response = self.session.get(url, timeout=30, stream=True)
 
                 if response.status_code != 200:
                     error_msg = f"Pull failed: HTTP {response.status_code} - {response.text}"
                     logger.error(error_msg)
+                    response.close()
+                    commit_before_failure()
                     self.database.update_sync_log(
                         log_id, 'error', error_message=error_msg
                     )
                     return False, error_msg, stats
 
-                # Parse response
-                data = response.json()
+                # Decode and process records as they arrive
+                page_count, data = self.stream_page(
+                    response, lambda records: fingerprints.add(records, page)
+                )
 
                 # Check API-level success
                 if data.get('code') != 1000:
                     error_msg = f"API Error: {data.get('desc', 'Unknown error')}"
                     logger.error(error_msg)
+                    commit_before_failure()
                     self.database.update_sync_log(
                         log_id, 'error', error_message=error_msg
                     )
                     return False, error_msg, stats
 
-                # Get page data
-                page_data = data.get('data', {}).get('pageData', [])
+                page_total = (data.get('data') or {}).get('total')
+
+                # Fewer records than at checkpoint time means pages have shifted
+                if verify_total:
+                    verify_total = False
+                    if page_total is not None and checkpoint['total'] is not None and page_total < checkpoint['total']:
+                        logger.warning(
+                            f"Record total dropped from {checkpoint['total']} to {page_total}, restarting run {run_id} from page 1"
+                        )
+                        resumed_from_page = None
+                        page = 1
+                        continue
 
-                if not page_data:
+                if page_count == 0:
                     logger.info(f"No more data on page {page}, stopping pagination")
                     break
 
-                logger.info(f"Processing {len(page_data)} attendance records from page {page}")
-
-                # Process each attendance record
-                for attendance in page_data:
-                    stats['processed'] += 1
-                    try:
-                        result = self.process_attendance(attendance)
-                        if result == 'success':
-                            stats['success'] += 2  # 2 entries per attendance (IN + OUT)
-                        elif result == 'skipped':
-                            stats['skipped'] += 2
-                        else:
-                            stats['failed'] += 1
-                    except Exception as e:
-                        logger.error(f"Error processing attendance {attendance}: {e}")
-                        stats['failed'] += 1
-
-                total_records += len(page_data)
+                logger.info(f"Processed {page_count} attendance records from page {page}")
+
+                total_records += page_count
+
+                # Checkpoint the pages whose records are committed
+                self.database.update_pull_checkpoint(
+                    run_id, last_page=fingerprints.committed_through(page), total=page_total
+                )
 
                 # Emit progress update after processing page
                 if progress_callback:
@@ -197,112 +257,291 @@ class PullService:
 
                 # Check if we should continue pagination
                 # San Beda API doesn't provide clear pagination info, so we stop when page is not full
-                if len(page_data) < page_size:
+                if page_count < page_size:
                     logger.info("Last page reached")
                     break
 
                 page += 1
 
-            # Update last pull time
-            self.database.update_last_sync_time('pull')
-
-            # Update sync log
-            self.database.update_sync_log(
-                log_id,
-                status='success',
-                records_processed=stats['processed'],
-                records_success=stats['success'],
-                records_failed=stats['failed'],
-                metadata={'skipped': stats['skipped'], 'total_records': total_records}
-            )
-
-            message = f"Pull completed: {stats['success']} records imported ({stats['processed']} attendance records processed)"
-            logger.info(message)
-            return True, message, stats
+            return self.record_completed(log_id, run_id, stats, fingerprints, total_records, force, resumed_from_page)
 
         except Exception as e:
             error_msg = f"Pull sync error: {str(e)}"
             logger.error(error_msg, exc_info=True)
+            try:
+                commit_before_failure()
+            except Exception as flush_error:
+                logger.error(f"Error flushing held-back days: {flush_error}")
             self.database.update_sync_log(
                 log_id, 'error', error_message=error_msg
             )
             return False, error_msg, stats
 
-    def process_attendance(self, attendance_data):
+    def record_completed(self, log_id, run_id, stats, fingerprints, total_records, force=False,
+                         resumed_from_page=None):
         """
-        Process single attendance record from San Beda API
-        Creates 2 timesheet entries: one for signInTime, one for signOutTime
+        Close a pull run that fetched every page
+
+        The closed days still held back are ingested (or skipped), the
+        checkpoint is completed and the sync log written.
 
         Returns:
-            str: 'success', 'skipped', or 'failed'
+            tuple: (True, message, stats)
+        """
+        fingerprints.close()
+        stats['unchanged'] = fingerprints.records_unchanged
+        self.database.update_pull_checkpoint(run_id, status='completed')
+
+        # Update last pull time
+        self.database.update_last_sync_time('pull')
+
+        # Update sync log
+        self.database.update_sync_log(
+            log_id,
+            status='success',
+            records_processed=stats['processed'],
+            records_success=stats['success'],
+            records_failed=stats['failed'],
+            metadata={
+                'engine': self.ENGINE,
+                'skipped': stats['skipped'],
+                'total_records': total_records,
+                'inserted': stats['inserted'],
+                'rejected': stats['rejected'],
+                'reject_reasons': stats['reject_reasons'],
+                'unchanged_records': fingerprints.records_unchanged,
+                'unchanged_days': fingerprints.days_unchanged,
+                'force': force,
+                'run_id': run_id,
+                'resumed_from_page': resumed_from_page,
+                **self.rate_bucket.metrics_since(self.rate_snapshot),
+                **transport_metrics.metrics_since(url_host(self.host), self.transport_snapshot),
+                **self.auth_service.token_manager.metrics_since(self.token_snapshot)
+            }
+        )
+
+        message = f"Pull completed: {stats['success']} records imported ({stats['processed']} attendance records processed)"
+        if fingerprints.days_unchanged:
+            message += f", {fingerprints.days_unchanged} unchanged days skipped"
+        if stats['rejected']:
+            message += f", {stats['rejected']} invalid records rejected"
+        if resumed_from_page:
+            message += f" (resumed from page {resumed_from_page})"
+        logger.info(message)
+        return True, message, stats
+
+    def record_cancelled(self, log_id, run_id, stats, reason, total_records=0):
+        """
+        Close a cancelled pull run
+
+        Pages committed before the cancellation stay imported. The run's
+        checkpoint is expired so the next scheduled pull does not resume
+        the cancelled range.
+
+        Returns:
+            tuple: (False, message, stats) with stats['cancelled'] set
+        """
+        if run_id:
+            self.database.update_pull_checkpoint(run_id, status='expired')
+        stats['cancelled'] = True
+        message = f"Pull cancelled ({reason}): {stats['success']} records imported before stopping"
+        logger.info(message)
+        self.database.update_sync_log(
+            log_id, 'error',
+            records_processed=stats['processed'],
+            records_success=stats['success'],
+            records_failed=stats['failed'],
+            error_message=message,
+            metadata={'cancelled': True, 'total_records': total_records, 'run_id': run_id}
+        )
+        return False, message, stats
+
+    def is_checkpoint_fresh(self, checkpoint):
+        """
+        Check whether an unfinished pull checkpoint may still be resumed
+
+        A checkpoint goes stale when it has not advanced for
+        CHECKPOINT_MAX_AGE_HOURS, or when its range reaches into the day the
+        run started and that day is over (the range's open days have
+        changed too much for the saved page positions to hold).
         """
         try:
-            # Extract employee data
-            employee_id = attendance_data.get('code')  # Person ID
-            employee_name = attendance_data.get('name')
-            attendance_date = attendance_data.get('attendanceDate')
-            sign_in_time = attendance_data.get('signInTime')
-            sign_out_time = attendance_data.get('signOutTime')
-
-            if not all([employee_id, employee_name, attendance_date]):
-                logger.warning(f"Missing required fields in attendance data: {attendance_data}")
-                return 'failed'
-
-            # First, ensure employee exists (use employee_code for lookup)
-            employee = self.database.get_employee_by_code(employee_id)
-            if not employee:
-                # Create employee
-                # Try to use backend_id as integer if possible, otherwise set to None
-                try:
-                    backend_id_int = int(employee_id)
-                except ValueError:
-                    backend_id_int = None
-
-                emp_id = self.database.add_or_update_employee(
-                    backend_id=backend_id_int,
-                    name=employee_name,
-                    employee_code=employee_id,
-                    employee_number=None
-                )
-                employee = {'id': emp_id, 'employee_code': employee_id}
-                logger.info(f"Created employee: {employee_name} (Code: {employee_id})")
-
-            # Create IN entry if signInTime exists
-            if sign_in_time:
-                timestamp_in = datetime.strptime(f"{attendance_date} {sign_in_time}", "%Y-%m-%d %H:%M")
-                sync_id_in = f"{employee_id}_{timestamp_in.strftime('%Y%m%d%H%M%S')}_IN"
-
-                result_in = self.database.add_timesheet_entry(
-                    sync_id=sync_id_in,
-                    employee_id=employee['id'],
-                    log_type='in',
-                    date=attendance_date,
-                    time=sign_in_time,
-                    photo_path=None
-                )
+            updated_at = datetime.fromisoformat(str(checkpoint['updated_at']))
+        except ValueError:
+            return False
 
-                if result_in is None:
-                    logger.debug(f"IN entry already exists: {sync_id_in}")
-
-            # Create OUT entry if signOutTime exists
-            if sign_out_time:
-                timestamp_out = datetime.strptime(f"{attendance_date} {sign_out_time}", "%Y-%m-%d %H:%M")
-                sync_id_out = f"{employee_id}_{timestamp_out.strftime('%Y%m%d%H%M%S')}_OUT"
-
-                result_out = self.database.add_timesheet_entry(
-                    sync_id=sync_id_out,
-                    employee_id=employee['id'],
-                    log_type='out',
-                    date=attendance_date,
-                    time=sign_out_time,
-                    photo_path=None
-                )
+        now = datetime.now()
+        if now - updated_at > timedelta(hours=CHECKPOINT_MAX_AGE_HOURS):
+            return False
 
-                if result_out is None:
-                    logger.debug(f"OUT entry already exists: {sync_id_out}")
+        started_on = str(checkpoint['created_at'])[:10]
+        today = now.strftime("%Y-%m-%d")
+        if checkpoint['date_to'] >= started_on and started_on != today:
+            return False
 
-            return 'success'
+        return True
 
+    def open_checkpoint(self, source, date_from, date_to, resume=True):
+        """
+        Find the resumable checkpoint for this range or start a new run
+
+        Non-resumable checkpoints for the same range are marked expired.
+
+        Returns:
+            dict: Checkpoint row (last_page is 0 for a new run)
+        """
+        for checkpoint in self.database.get_running_pull_checkpoints(source):
+            if (checkpoint['date_from'], checkpoint['date_to'], checkpoint['page_size']) != (date_from, date_to, self.PAGE_SIZE):
+                continue
+            if resume and self.is_checkpoint_fresh(checkpoint):
+                return checkpoint
+            self.database.update_pull_checkpoint(checkpoint['run_id'], status='expired')
+
+        self.database.prune_pull_checkpoints()
+
+        run_id = uuid.uuid4().hex
+        self.database.create_pull_checkpoint(run_id, source, date_from, date_to, self.PAGE_SIZE)
+        return {
+            'run_id': run_id,
+            'source': source,
+            'date_from': date_from,
+            'date_to': date_to,
+            'page_size': self.PAGE_SIZE,
+            'last_page': 0,
+            'total': None
+        }
+
+    def get_resumable_run(self):
+        """
+        Get the most recent unfinished pull that can still be resumed
+
+        Stale checkpoints found along the way are marked expired.
+
+        Returns:
+            dict: Checkpoint row, or None
+        """
+        config = self.database.get_api_config() or {}
+        source = config.get('pull_host')
+        if not source:
+            return None
+
+        for checkpoint in self.database.get_running_pull_checkpoints(source):
+            if checkpoint['page_size'] == self.PAGE_SIZE and self.is_checkpoint_fresh(checkpoint):
+                return checkpoint
+            self.database.update_pull_checkpoint(checkpoint['run_id'], status='expired')
+
+        return None
+
+    def get_time_range(self, date_from=None, date_to=None):
+        """
+        Resolve the attendance query window
+
+        Returns:
+            tuple: (start_time_str, end_time_str) in "YYYY-MM-DD HH:MM:SS" format
+        """
+        if date_from and date_to:
+            # Use provided dates
+            return f"{date_from} 00:00:00", f"{date_to} 23:59:59"
+
+        # Default: yesterday 00:00:00 to today 23:59:59
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        today = datetime.now().strftime("%Y-%m-%d")
+        return f"{yesterday} 00:00:00", f"{today} 23:59:59"
+
+    def build_page_url(self, host, start_time_str, end_time_str, page, page_size):
+        """Build the attendance report URL for one page"""
+        params = {
+            'startTime': start_time_str,
+            'endTime': end_time_str,
+            'personName': '',
+            'personId': '',
+            'deptId': '',
+            'page': page,
+            'pageSize': page_size
+        }
+        return f"http://{host}/brms/api/v1.0/attendance/record-info-report/page?{urlencode(params)}"
+
+    def stream_page(self, response, on_records):
+        """
+        Decode a streamed page response, handing records on as they arrive
+
+        Records are passed to on_records one network chunk at a time, so
+        memory use does not grow with the page size. The response is closed.
+
+        Returns:
+            tuple: (record_count: int, body: dict without pageData records)
+        """
+        stream = PageRecordStream()
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                records = stream.feed(chunk)
+                if records:
+                    on_records(records)
+            body = stream.close()
+        finally:
+            response.close()
+
+        return stream.record_count, body
+
+    def new_stats(self):
+        """Create the stats dict returned by pull_data"""
+        return {
+            'processed': 0,
+            'success': 0,
+            'failed': 0,
+            'skipped': 0,
+            'unchanged': 0,
+            'rejected': 0,
+            'inserted': 0,
+            'reject_reasons': {}
+        }
+
+    def process_page(self, page_data, stats):
+        """
+        Normalize and ingest one page of attendance records, updating stats in place
+
+        Invalid records are counted under 'rejected' (with per-reason counts
+        in 'reject_reasons'); 'failed' only counts records that could not be
+        written to the database.
+
+        Args:
+            page_data: List of attendance records from the API
+            stats: Pull stats dict from new_stats()
+
+        Returns:
+            int: Number of records that failed in this page
+        """
+        entries, rejects = self.normalizer.normalize(page_data)
+        stats['processed'] += len(page_data)
+
+        if rejects:
+            reasons = summarize_rejects(rejects)
+            stats['rejected'] += len(rejects)
+            for reason, count in reasons.items():
+                stats['reject_reasons'][reason] = stats['reject_reasons'].get(reason, 0) + count
+            logger.warning(f"Rejected {len(rejects)} attendance records: {reasons} (first: {rejects[0][0]})")
+
+        try:
+            result = self.database.ingest_attendance(entries)
         except Exception as e:
-            logger.error(f"Error processing attendance: {e}", exc_info=True)
+            logger.error(f"Error ingesting {len(entries)} attendance records: {e}", exc_info=True)
+            stats['failed'] += len(entries)
+            return len(entries)
+
+        stats['success'] += result['entries']
+        stats['inserted'] += result['inserted']
+        return 0
+
+    def process_attendance(self, attendance_data):
+        """
+        Process single attendance record from San Beda API
+        Creates 2 timesheet entries: one for signInTime, one for signOutTime
+
+        Returns:
+            str: 'success', 'skipped', or 'failed'
+        """
+        stats = self.new_stats()
+        failed = self.process_page([attendance_data], stats)
+        if failed or stats['rejected']:
             return 'failed'
+        return 'success'
@@ -1,32 +1,336 @@
 """
 San Beda Integration Tool - Push Service
 Service for pushing timesheet data to YAHSHUA Payroll cloud system
+
+Every batch is recorded in the push ledger under a new random key, sent as
+the Idempotency-Key header. When a send ends without a definite answer
+(timeout, dropped connection, gateway error) the batch is re-sent unchanged
+under the same key - later in the run, or before anything else in the next
+run - so YAHSHUA can recognize it instead of storing it twice. After a
+definite answer the key is spent: sending those records again starts a new
+ledger entry with a new key, so YAHSHUA never replays its earlier answer.
 """
 
 import requests
+from urllib3.exceptions import NewConnectionError
+import hashlib
 import logging
-from datetime import datetime
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
 import json
+import uuid
+from .cancellation import CancellationToken
+from .rate_limit import get_bucket, configure_bucket, DEFAULT_PUSH_RATE, DEFAULT_PUSH_BURST
+from .token_manager import TokenManager
+from .transport import create_session, configure_timeouts, transport_metrics, url_host
+from .batch_sizing import AdaptiveBatcher, DEFAULT_MAX_PAYLOAD_KB
+from .payload import (
+    COMPRESSION_NONE, COMPRESSION_GZIP, PayloadMeter, encode_payload, is_compression_rejected
+)
 
 logger = logging.getLogger(__name__)
 
-# YAHSHUA API endpoints
+# YAHSHUA API endpoints, relative to the base URL (api_config.push_url
+# overrides the production base, e.g. to point at mock_yahshua_server)
 YAHSHUA_BASE_URL = "https://yahshuapayroll.com/api"
-YAHSHUA_LOGIN_URL = f"{YAHSHUA_BASE_URL}/api-auth/"
-YAHSHUA_SYNC_URL = f"{YAHSHUA_BASE_URL}/sync-time-in-out/"
+YAHSHUA_LOGIN_PATH = "/api-auth/"
+YAHSHUA_SYNC_PATH = "/sync-time-in-out/"
+
+# Batches in flight when push_max_in_flight is not configured, and its upper bound
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_IN_FLIGHT_LIMIT = 16
+
+# Times a batch with a transient failure (throttled, timeout, connection
+# error) is sent again before its records are marked failed
+MAX_BATCH_RETRIES = 3
+
+# Exponential backoff between batch retries: base * 2^(retry - 1), capped
+BATCH_RETRY_BASE_SECONDS = 2
+BATCH_RETRY_MAX_SECONDS = 30
+
+# Exponential backoff before a failed record is pushed again, capped
+RECORD_RETRY_BASE_SECONDS = 60
+RECORD_RETRY_MAX_SECONDS = 6 * 60 * 60
+
+# Stop the run after this many batches in a row fail all their retries
+MAX_CONSECUTIVE_FAILED_BATCHES = 3
+
+# A record YAHSHUA keeps rejecting (logs_not_sync) is dead-lettered after
+# this many rejections. Failed batches (network errors, timeouts, HTTP
+# errors) only delay the record's next attempt.
+MAX_RECORD_REJECTIONS = 10
+
+# logs_not_sync error codes that re-sending cannot fix. More codes can be
+# added with api_config.push_permanent_error_codes.
+DEFAULT_PERMANENT_ERROR_CODES = {
+    '404': 'employee not found',
+    '422': 'invalid log data'
+}
+
+# Reasons that re-sending cannot fix (matched case-insensitively), only used
+# for rejections that carry no error code
+PERMANENT_REJECTION_KEYWORDS = ('employee not found', 'does not exist', 'no employee', 'inactive')
+
+# HTTP statuses YAHSHUA (or its proxy) uses when it is overloaded
+THROTTLE_STATUS_CODES = (429, 502, 503, 504)
+
+# Gateway errors after which YAHSHUA may still have stored the batch
+IN_DOUBT_STATUS_CODES = (502, 504)
+
+# Push ledger rows untouched for this long are deleted
+PUSH_LEDGER_RETENTION_DAYS = 30
+
+
+def batch_fingerprint(log_list):
+    """
+    Fingerprint a batch by its log entries, independent of their order
+
+    Returns:
+        str: SHA-256 hex digest, kept in the push ledger to tell whether an
+             in-doubt batch is unchanged and can be replayed under its key
+    """
+    entries = sorted(log_list, key=lambda entry: str(entry.get('sync_id')))
+    body = json.dumps(entries, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def backoff_with_jitter(attempt, base_seconds, max_seconds):
+    """
+    Exponential backoff delay with "equal jitter"
+
+    Returns a delay between half and all of min(max, base * 2^(attempt - 1)),
+    so retries from many batches or records do not line up.
+    """
+    delay = min(max_seconds, base_seconds * (2 ** max(0, attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def next_record_retry_at(attempts):
+    """Get when a record that has failed attempts times may be pushed again"""
+    delay = backoff_with_jitter(attempts, RECORD_RETRY_BASE_SECONDS, RECORD_RETRY_MAX_SECONDS)
+    return datetime.now() + timedelta(seconds=delay)
+
+
+def transport_failure(error, reached_server):
+    """
+    push_batch result for a request that got no HTTP response
+
+    Args:
+        error: Short description ('Request timeout', 'Connection error', ...)
+        reached_server: Whether the request may have been delivered. A
+                        connection that was never opened cannot have stored
+                        anything; a read timeout or dropped connection may
+                        have, so the batch is in doubt.
+
+    Returns:
+        tuple: (False, result dict) - always retryable
+    """
+    return False, {'error': error, 'retryable': True, 'in_doubt': reached_server}
+
+
+class InFlightWindow:
+    """
+    Number of batches allowed in flight, adjusted additive-increase /
+    multiplicative-decrease: it halves on errors or throttling and grows by
+    one after a full window of successful batches, up to its limit.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = limit
+        self.smallest = limit
+        self._successes = 0
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.size and self.size < self.limit:
+            self.size += 1
+            self._successes = 0
+
+    def on_congestion(self):
+        self.size = max(1, self.size // 2)
+        self.smallest = min(self.smallest, self.size)
+        self._successes = 0
+
+
+class BatchPipeline:
+    """
+    Batch bookkeeping for one push run, shared by the threaded and async engines
+
+    Decides which batch goes next (requeued retries first, then in-doubt
+    replays, then new batches cut at the batcher's current size), records
+    sends in the push ledger with their idempotency key (reused only for a
+    batch whose last send is in doubt), and applies results: retry or write them,
+    adjust the in-flight window and stop the run after too many failed
+    batches in a row. The engines only send the requests; they call
+    next_batch while can_send allows it and on_result for each completed
+    batch, one call at a time.
+    """
+
+    def __init__(self, service, log_entries, batcher, max_in_flight, stats,
+                 progress_callback=None, attempts=None, replays=None, cancel_token=None, rejections=None):
+        self.service = service
+        self.batcher = batcher
+        self.stats = stats
+        self.progress_callback = progress_callback
+        self.attempts = attempts or {}
+        self.rejections = rejections or {}
+        self.cancel_token = cancel_token or CancellationToken()
+        self.window = InFlightWindow(max_in_flight)
+        self.remaining = deque(log_entries)
+        self.replays = deque(replays or [])
+        self.replayed = len(self.replays)
+        self.retries = deque()
+        self.batch_error = None
+        self.failed_batch = None
+        self.retried = 0
+        self.batch_count = 0
+        self.consecutive_failures = 0
+
+    def has_work(self):
+        """Whether batches are left to send and the run has not been stopped"""
+        return bool(self.retries or self.replays or self.remaining) \
+            and self.batch_error is None and not self.cancel_token.cancelled
+
+    def running(self, in_flight):
+        """Whether the engine should keep waiting for or sending batches"""
+        return in_flight > 0 or self.has_work()
+
+    def can_send(self, in_flight):
+        """Whether another batch may be sent with in_flight batches outstanding"""
+        return self.has_work() and in_flight < self.window.size
+
+    def next_batch(self, in_flight):
+        """
+        Take the next batch to send and record it in the push ledger
+
+        Returns:
+            tuple: (batch_num, batch, attempt, idempotency_key,
+                    delay seconds before sending)
+        """
+        if self.retries:
+            batch_num, batch, attempt, idempotency_key = self.retries.popleft()
+        else:
+            if self.replays:
+                idempotency_key, batch = self.replays.popleft()
+            else:
+                idempotency_key, batch = None, self.batcher.take(self.remaining)
+            self.batch_count += 1
+            batch_num, attempt = self.batch_count, 0
+            self.stats['batches_total'] = self.estimate_total()
+        logger.info(
+            f"Processing batch {batch_num}/{self.stats['batches_total']} "
+            f"({len(batch)} records, {in_flight + 1} in flight)"
+        )
+
+        # Emit progress before sending batch
+        if self.progress_callback:
+            self.progress_callback({
+                'batch_current': batch_num,
+                'batch_total': self.stats['batches_total'],
+                'batch_size': len(batch),
+                'success': self.stats['success'],
+                'failed': self.stats['failed']
+            })
+
+        # Only a send left in doubt goes out again under its key
+        database = self.service.database
+        if idempotency_key is None or not database.record_push_batch_resent(idempotency_key):
+            idempotency_key = uuid.uuid4().hex
+            database.create_push_batch(idempotency_key, batch_fingerprint(batch), batch)
+        delay = backoff_with_jitter(attempt, BATCH_RETRY_BASE_SECONDS, BATCH_RETRY_MAX_SECONDS) if attempt else 0
+        return batch_num, batch, attempt, idempotency_key, delay
+
+    def on_result(self, batch_num, batch, attempt, idempotency_key, success, result, latency):
+        """Requeue a batch with a transient failure, or write its result"""
+        if result.get('cancelled'):
+            # Never sent: the records stay unsynced for the next push
+            return
+        self.batcher.record(len(batch), latency, success)
+
+        if not success and result.get('retryable') and attempt < MAX_BATCH_RETRIES:
+            self.window.on_congestion()
+            self.retried += 1
+            logger.warning(
+                f"Batch {batch_num} failed ({result.get('error')}), retry {attempt + 1}/{MAX_BATCH_RETRIES}; "
+                f"window now {self.window.size}, batch size {self.batcher.size}"
+            )
+            in_doubt = result.get('in_doubt', False)
+            self.service.database.record_push_batch_outcome(
+                idempotency_key, 'in_doubt' if in_doubt else 'failed', error=result.get('error')
+            )
+            self.retries.append((batch_num, batch, attempt + 1, idempotency_key if in_doubt else None))
+            return
+
+        error = self.service.apply_batch_result(
+            batch_num, batch, idempotency_key, success, result, self.stats, self.attempts, self.rejections
+        )
+        if not error:
+            self.consecutive_failures = 0
+            self.window.on_success()
+            return
+
+        self.window.on_congestion()
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= MAX_CONSECUTIVE_FAILED_BATCHES and self.batch_error is None:
+            self.batch_error = error
+            self.failed_batch = batch_num
+            logger.error(f"Batch {batch_num} failed: {error} - {self.consecutive_failures} batches in a row, stopping")
+        else:
+            logger.error(f"Batch {batch_num} failed: {error} - records deferred, continuing")
+
+    def estimate_total(self):
+        """Batches sent so far plus those still expected"""
+        return self.batch_count + len(self.replays) + (
+            self.batcher.estimate_batches(len(self.remaining)) if self.remaining else 0
+        )
+
+    def finish(self):
+        """
+        Settle the batch total once the engine has stopped sending
+
+        Entries never sent count as neither synced nor failed.
+
+        Returns:
+            BatchPipeline: self
+        """
+        self.stats['batches_total'] = self.estimate_total()
+        return self
 
 
 class PushService:
     """Service for pushing data to YAHSHUA Payroll cloud system"""
 
+    # Log entries per sync-time-in-out request until a size has been learned
+    BATCH_SIZE = 50
+
+    # Recorded in the sync log metadata; overridden by the async engine
+    ENGINE = 'threaded'
+
     def __init__(self, database):
         self.database = database
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'San Beda Integration Tool/1.0',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        })
+        # Shared connection pools hold one connection per batch in flight
+        self.session = create_session({'Content-Type': 'application/json'})
+        self.base_url = YAHSHUA_BASE_URL
+        self.rate_bucket = get_bucket(self.base_url)
+        self.rate_snapshot = self.rate_bucket.snapshot()
+        self.transport_snapshot = transport_metrics.snapshot(url_host(self.base_url))
+
+        # YAHSHUA token kept in memory; concurrent 401s share one login
+        self.token_manager = TokenManager(
+            'YAHSHUA', database, 'push_token', 'push_token_created_at', 'push_token_lifetime_minutes',
+            login=lambda: self.authenticate()['token']
+        )
+        self.token_snapshot = self.token_manager.snapshot()
+
+        # Request body compression for the current run; once the server
+        # rejects a compressed body, plain JSON is used for this session
+        self.compression = COMPRESSION_NONE
+        self.compression_rejected = False
+        self.payload_meter = PayloadMeter()
 
     def get_config(self):
         """Get push configuration from database"""
@@ -39,6 +343,49 @@ class PushService:
 
         return config
 
+    def get_compression(self, config=None):
+        """Get the request body compression to use ('gzip' or 'none')"""
+        config = config or self.database.get_api_config() or {}
+        if self.compression_rejected or config.get('push_compression') != COMPRESSION_GZIP:
+            return COMPRESSION_NONE
+        return COMPRESSION_GZIP
+
+    def get_base_url(self, config=None):
+        """Get the YAHSHUA API base URL (api_config.push_url, or production)"""
+        config = config or self.database.get_api_config() or {}
+        return (config.get('push_url') or YAHSHUA_BASE_URL).rstrip('/')
+
+    def prepare_run(self, config=None):
+        """Resolve the run's base URL, compression, rate limit and timeouts, and reset its counters"""
+        config = config or self.database.get_api_config() or {}
+        self.base_url = self.get_base_url(config)
+        self.compression = self.get_compression(config)
+        self.payload_meter = PayloadMeter()
+
+        rate = config.get('push_rate_limit')
+        burst = config.get('push_rate_burst')
+        self.rate_bucket = configure_bucket(
+            self.base_url,
+            DEFAULT_PUSH_RATE if rate is None else rate,
+            DEFAULT_PUSH_BURST if burst is None else burst
+        )
+        self.rate_snapshot = self.rate_bucket.snapshot()
+
+        configure_timeouts(config)
+        self.transport_snapshot = transport_metrics.snapshot(url_host(self.base_url))
+
+        self.token_manager.configure(config)
+        self.token_snapshot = self.token_manager.snapshot()
+
+    def get_max_in_flight(self, config=None):
+        """Get the configured number of batches in flight (1 = sequential)"""
+        config = config or self.database.get_api_config() or {}
+        try:
+            value = int(config.get('push_max_in_flight') or DEFAULT_MAX_IN_FLIGHT)
+        except (TypeError, ValueError):
+            value = DEFAULT_MAX_IN_FLIGHT
+        return max(1, min(value, MAX_IN_FLIGHT_LIMIT))
+
     def authenticate(self, username=None, password=None):
         """
         Authenticate with YAHSHUA Payroll and get token
@@ -64,7 +411,8 @@ class PushService:
             }
 
             # YAHSHUA API requires credentials in both query params and body
-            auth_url = f"{YAHSHUA_LOGIN_URL}?username={username}&password={password}"
+            self.base_url = self.get_base_url()
+            auth_url = f"{self.base_url}{YAHSHUA_LOGIN_PATH}?username={username}&password={password}"
 
             response = self.session.post(
                 auth_url,
@@ -83,6 +431,7 @@ class PushService:
 
                 # Store token and user info in database
                 self.database.update_push_token(token, user_logged)
+                self.token_manager.store(token)
 
                 logger.info(f"YAHSHUA authentication successful. User: {user_logged}, Company: {company_name}")
                 return {
@@ -108,16 +457,8 @@ class PushService:
             raise
 
     def get_valid_token(self):
-        """Get a valid token, authenticating if necessary"""
-        token = self.database.get_push_token()
-
-        if token:
-            logger.info("Using existing YAHSHUA token")
-            return token
-
-        logger.info("No valid token found, authenticating...")
-        auth_result = self.authenticate()
-        return auth_result['token']
+        """Get a valid token (kept in memory), authenticating if necessary or near expiry"""
+        return self.token_manager.get_token()
 
     def test_connection(self):
         """Test connection to YAHSHUA Payroll API"""
@@ -127,268 +468,614 @@ class PushService:
         except Exception as e:
             return False, str(e)
 
-    def push_data(self, progress_callback=None):
+    def push_data(self, progress_callback=None, cancel_token=None):
         """
-        Push unsynced timesheet data to YAHSHUA Payroll in batches of 50
+        Push unsynced timesheet data to YAHSHUA Payroll in adaptive batches
+
+        Up to push_max_in_flight batches are sent at once and each result is
+        written as soon as its batch completes. Batches with transient
+        failures are retried with exponential backoff; a batch that still
+        fails, or records YAHSHUA rejects, are deferred with a per-record
+        next retry time and the run carries on with the remaining batches.
+        The run only stops early when several batches in a row fail, or
+        when it is cancelled (see record_cancelled).
 
         Args:
             progress_callback: Optional callback function for progress updates.
                               Called with dict: {batch_current, batch_total, batch_size, success, failed}
+            cancel_token: Optional CancellationToken; no new batch is sent once it is cancelled
 
         Returns:
             tuple: (success: bool, message: str, stats: dict)
         """
-        BATCH_SIZE = 50
-
+        cancel_token = cancel_token or CancellationToken()
         log_id = self.database.create_sync_log('push')
-        stats = {
+        stats = self.new_stats()
+
+        try:
+            logger.info(f"Starting push sync to YAHSHUA Payroll ({self.ENGINE} engine)")
+
+            # Apply timeouts, rate limit and token lifetime before the first request
+            config, max_in_flight = self.start_run()
+
+            # Get token
+            token = self.get_valid_token()
+
+            work = self.collect_work(config, stats)
+            if work is None:
+                return self.record_nothing_to_push(log_id, stats)
+            replays, fresh_entries, batcher, attempts, rejections = work
+
+            pipeline = self.run_batch_pipeline(
+                token, fresh_entries, batcher, max_in_flight, stats, progress_callback, attempts, replays,
+                cancel_token, rejections
+            )
+            return self.record_run(log_id, pipeline, progress_callback)
+
+        except Exception as e:
+            return self.record_run_error(log_id, stats, e)
+
+    def new_stats(self):
+        """Empty stats dict for a push run"""
+        return {
             'processed': 0,
             'success': 0,
             'failed': 0,
             'skipped': 0,
             'batches_completed': 0,
-            'batches_total': 0
+            'batches_failed': 0,
+            'batches_total': 0,
+            'dead_lettered': 0
         }
 
-        try:
-            logger.info("Starting push sync to YAHSHUA Payroll")
+    def start_run(self):
+        """
+        Load the configuration and apply it to the run (see prepare_run)
 
-            # Get token
-            token = self.get_valid_token()
+        Returns:
+            tuple: (config: dict, max_in_flight: int)
+        """
+        config = self.get_config()
+        max_in_flight = self.get_max_in_flight(config)
+        self.prepare_run(config)
+        return config, max_in_flight
 
-            # Get ALL unsynced timesheets
-            all_unsynced = self.database.get_unsynced_timesheets(limit=10000)
-            logger.info(f"Found {len(all_unsynced)} unsynced timesheet records")
+    def collect_work(self, config, stats):
+        """
+        Load the records due for pushing and split them into batches to
+        replay (see reconcile_ledger) and entries to batch afresh
 
-            if len(all_unsynced) == 0:
-                message = "No records to sync"
-                logger.info(message)
-                self.database.update_sync_log(
-                    log_id, status='success', records_processed=0
-                )
-                return True, message, stats
+        Returns:
+            tuple: (replays, fresh_entries, batcher: AdaptiveBatcher,
+                    attempts: {timesheet id: previous push attempts},
+                    rejections: {timesheet id: previous rejections}),
+                   or None when there is nothing to send
+        """
+        # Get ALL unsynced timesheets
+        all_unsynced = self.database.get_unsynced_timesheets(limit=10000)
+        logger.info(f"Found {len(all_unsynced)} unsynced timesheet records")
+
+        # Build log_list for all valid records
+        all_log_entries = self.build_log_entries(all_unsynced, stats)
+        if not all_log_entries:
+            return None
+
+        # Batches left in doubt by an earlier run go first, unchanged
+        replays, fresh_entries = self.reconcile_ledger(all_log_entries)
+
+        # Batch size adapts to YAHSHUA latency and errors
+        batcher = self.load_batcher(config)
+        stats['batches_total'] = len(replays) + batcher.estimate_batches(len(fresh_entries))
+        logger.info(f"Pushing {len(all_log_entries)} records in batches starting at {batcher.size}")
+
+        # Previous attempts per record, for the retry backoff, and rejections, for dead-lettering
+        attempts = {row['id']: row.get('push_attempts') or 0 for row in all_unsynced}
+        rejections = {row['id']: row.get('push_rejections') or 0 for row in all_unsynced}
+        return replays, fresh_entries, batcher, attempts, rejections
+
+    def record_nothing_to_push(self, log_id, stats):
+        """Close the sync log of a run that found no valid records"""
+        message = "No records to sync" if stats['processed'] == 0 else "No valid records to sync"
+        logger.info(message)
+        self.database.update_sync_log(
+            log_id, status='success', records_processed=stats['processed']
+        )
+        return True, message, stats
+
+    def record_run(self, log_id, pipeline, progress_callback=None):
+        """
+        Save the learned batch size and close the sync log of a finished run
+
+        Returns:
+            tuple: (success: bool, message: str, stats: dict)
+        """
+        stats = pipeline.stats
+        self.save_batcher(pipeline.batcher)
+
+        # Emit final progress (completed)
+        if progress_callback:
+            progress_callback({
+                'batch_current': stats['batches_completed'],
+                'batch_total': stats['batches_total'],
+                'batch_size': 0,
+                'success': stats['success'],
+                'failed': stats['failed'],
+                'completed': True
+            })
+
+        if pipeline.cancel_token.cancelled:
+            return self.record_cancelled(log_id, stats, pipeline.cancel_token.reason)
+
+        # Update last push time
+        self.database.update_last_sync_time('push')
+
+        # Update sync log
+        status = 'success' if pipeline.batch_error is None and stats['failed'] == 0 else 'error'
+        self.database.update_sync_log(
+            log_id,
+            status=status,
+            records_processed=stats['processed'],
+            records_success=stats['success'],
+            records_failed=stats['failed'],
+            metadata=self.build_run_metadata(pipeline)
+        )
+
+        # Build message
+        message = self.build_push_message(pipeline.batch_error, stats, pipeline.failed_batch)
+
+        logger.info(message)
+        return pipeline.batch_error is None and stats['batches_failed'] == 0, message, stats
+
+    def build_run_metadata(self, pipeline):
+        """Sync log metadata for a finished push run"""
+        return {
+            'engine': self.ENGINE,
+            'max_in_flight': pipeline.window.limit,
+            'min_window': pipeline.window.smallest,
+            'batch_retries': pipeline.retried,
+            'replayed_batches': pipeline.replayed,
+            'batches_failed': pipeline.stats['batches_failed'],
+            'dead_lettered': pipeline.stats['dead_lettered'],
+            'batch_size_start': pipeline.batcher.initial_size,
+            'batch_size_end': pipeline.batcher.size,
+            'compression': self.compression,
+            'compression_rejected': self.compression_rejected,
+            **self.payload_meter.as_metadata(),
+            **self.rate_bucket.metrics_since(self.rate_snapshot),
+            **transport_metrics.metrics_since(url_host(self.base_url), self.transport_snapshot),
+            **self.token_manager.metrics_since(self.token_snapshot)
+        }
+
+    def record_run_error(self, log_id, stats, error):
+        """Close the sync log of a run that raised"""
+        error_msg = f"Push sync error: {str(error)}"
+        logger.error(error_msg, exc_info=True)
+        self.database.update_sync_log(
+            log_id, 'error', error_message=error_msg
+        )
+        return False, error_msg, stats
+
+    def run_batch_pipeline(self, token, log_entries, batcher, max_in_flight, stats,
+                           progress_callback=None, attempts=None, replays=None, cancel_token=None,
+                           rejections=None):
+        """
+        Send log entries in adaptive batches with a bounded, self-adjusting
+        number in flight
+
+        Requests run on worker threads; the BatchPipeline picks the batches
+        and its results are applied here, on the calling thread, in
+        completion order.
+
+        Args:
+            attempts: Optional {timesheet id: previous push attempts}
+            replays: Optional batches to send unchanged before the new ones
+                     (see reconcile_ledger)
+            cancel_token: Optional CancellationToken; once cancelled no batch
+                          is sent, and batches in flight are waited for
+            rejections: Optional {timesheet id: previous rejections}
 
-            # Build log_list for all valid records
-            all_log_entries = []
-            timesheet_map = {}  # Map local ID to timesheet data
+        Returns:
+            BatchPipeline: The finished pipeline (batch_error, failed_batch,
+                           window, retried, ...)
+        """
+        pipeline = BatchPipeline(
+            self, log_entries, batcher, max_in_flight, stats, progress_callback, attempts, replays, cancel_token,
+            rejections
+        )
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='push-batch') as executor:
+            while pipeline.running(len(in_flight)):
+                # Top up the window, requeued batches first, then in-doubt batches
+                while pipeline.can_send(len(in_flight)):
+                    batch_num, batch, attempt, idempotency_key, delay = pipeline.next_batch(len(in_flight))
+                    # Pick up a token renewed by another batch, or renew it before it expires
+                    token = self.get_valid_token()
+                    future = executor.submit(
+                        self.timed_push_batch, delay, token, batch, idempotency_key, pipeline.cancel_token
+                    )
+                    in_flight[future] = (batch_num, batch, attempt, idempotency_key)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pipeline.on_result(*in_flight.pop(future), *future.result())
+
+        return pipeline.finish()
+
+    def timed_push_batch(self, delay, token, log_list, idempotency_key=None, cancel_token=None):
+        """
+        Wait delay seconds (for requeued batches), then push_batch
+
+        A cancellation during the wait skips the batch.
+
+        Returns:
+            tuple: (success: bool, result: dict, latency: float seconds)
+        """
+        if delay:
+            if cancel_token is None:
+                time.sleep(delay)
+            elif cancel_token.wait(delay):
+                return False, {'error': 'Cancelled before retry', 'cancelled': True}, 0.0
+        started = time.monotonic()
+        success, result = self.push_batch(token, log_list, idempotency_key)
+        return success, result, time.monotonic() - started
+
+    def reconcile_ledger(self, log_entries):
+        """
+        Pick out batches whose earlier outcome is unknown so they are re-sent as they were
 
-            for timesheet in all_unsynced:
-                stats['processed'] += 1
+        A ledger batch is replayed under its Idempotency-Key when all of its
+        records are due in this run and unchanged.
+        If only some of its records are still unsynced, or they changed, the
+        old batch is marked superseded and its records are batched normally.
+        Batches whose records are all deferred stay open for a later run.
 
-                # Get employee code
-                employee_code = timesheet.get('employee_code')
-                if not employee_code:
-                    logger.warning(f"Timesheet {timesheet['id']} has no employee code, skipping")
-                    stats['skipped'] += 1
+        Returns:
+            tuple: (replays: list of (idempotency_key, log list),
+                    fresh_entries: list of log entries)
+        """
+        self.database.prune_push_ledger(PUSH_LEDGER_RETENTION_DAYS)
+
+        pending = {entry['id']: entry for entry in log_entries}
+        replays = []
+        for row in self.database.get_open_push_batches():
+            ids = [entry['id'] for entry in row['payload']]
+            due = [local_id for local_id in ids if local_id in pending]
+            if not due:
+                continue
+
+            if len(due) == len(ids):
+                batch = [pending[local_id] for local_id in ids]
+                if batch_fingerprint(batch) == row['fingerprint']:
+                    for local_id in ids:
+                        del pending[local_id]
+                    replays.append((row['idempotency_key'], batch))
                     continue
 
-                # Transform to YAHSHUA format
-                log_entry = {
-                    "id": timesheet['id'],
-                    "employee": employee_code,  # San Beda employee code
-                    "log_time": timesheet['time'],  # HH:MM format
-                    "log_type": timesheet['log_type'].upper(),  # IN or OUT
-                    "sync_id": timesheet['sync_id'],
-                    "date": timesheet['date']  # YYYY-MM-DD format
-                }
+            self.database.record_push_batch_outcome(
+                row['idempotency_key'], 'superseded', error='Records changed or partly settled since the batch was sent'
+            )
+            logger.warning(f"In-doubt batch of {len(ids)} records superseded, {len(due)} records will be re-batched")
+
+        if replays:
+            logger.info(f"Replaying {len(replays)} in-doubt batches with their original idempotency keys")
+        return replays, [entry for entry in log_entries if entry['id'] in pending]
+
+    def load_batcher(self, config=None):
+        """Create an AdaptiveBatcher starting from the last learned batch size"""
+        config = config or self.database.get_api_config() or {}
+        size = config.get('push_batch_size') or self.BATCH_SIZE
+        max_payload_kb = config.get('push_max_payload_kb') or DEFAULT_MAX_PAYLOAD_KB
+        return AdaptiveBatcher(size, max_payload_bytes=int(max_payload_kb) * 1024)
+
+    def save_batcher(self, batcher):
+        """Persist the learned batch size for the next push"""
+        if batcher.size != batcher.initial_size:
+            self.database.update_api_config(push_batch_size=batcher.size)
+            logger.info(f"Learned push batch size: {batcher.initial_size} -> {batcher.size}")
+
+    def build_log_entries(self, timesheets, stats):
+        """
+        Transform unsynced timesheet rows into YAHSHUA log entries
 
-                all_log_entries.append(log_entry)
-                timesheet_map[timesheet['id']] = timesheet
+        Rows without an employee code are counted as skipped.
+
+        Returns:
+            list: Log entries in YAHSHUA format
+        """
+        log_entries = []
+
+        for timesheet in timesheets:
+            stats['processed'] += 1
+
+            # Get employee code
+            employee_code = timesheet.get('employee_code')
+            if not employee_code:
+                logger.warning(f"Timesheet {timesheet['id']} has no employee code, skipping")
+                stats['skipped'] += 1
+                continue
+
+            # Transform to YAHSHUA format
+            log_entries.append({
+                "id": timesheet['id'],
+                "employee": employee_code,  # San Beda employee code
+                "log_time": timesheet['time'],  # HH:MM format
+                "log_type": timesheet['log_type'].upper(),  # IN or OUT
+                "sync_id": timesheet['sync_id'],
+                "date": timesheet['date']  # YYYY-MM-DD format
+            })
+
+        return log_entries
+
+    def apply_batch_result(self, batch_num, batch, idempotency_key, success, result, stats, attempts=None,
+                           rejections=None):
+        """
+        Record the outcome of one pushed batch in the database
 
-            if len(all_log_entries) == 0:
-                message = "No valid records to sync"
-                logger.info(message)
-                self.database.update_sync_log(
-                    log_id, status='success', records_processed=stats['processed']
+        Failed records get their push attempt counted and are deferred
+        until a next retry time that backs off with the attempt count.
+        Only records YAHSHUA rejects are dead-lettered: on a permanent error
+        code, or after MAX_RECORD_REJECTIONS rejections.
+
+        Args:
+            batch_num: 1-based batch number (for messages)
+            batch: Log entries that were sent
+            idempotency_key: Push ledger key the batch was sent under
+            success: Whether the batch request itself succeeded
+            result: YAHSHUA response data, or {'error': ...} on failure
+            stats: Push stats dict, updated in place
+            attempts: Optional {timesheet id: previous push attempts}
+            rejections: Optional {timesheet id: previous rejections}
+
+        Returns:
+            str: Batch-level error message, or None if the batch went through
+        """
+        if success:
+            # Process results for this batch
+            logs_synced = result.get('logs_successfully_sync', [])
+            logs_failed = result.get('logs_not_sync', [])
+
+            # Mark successful logs
+            for local_id in logs_synced:
+                self.database.mark_timesheet_synced(local_id, local_id)
+                stats['success'] += 1
+                logger.info(f"Timesheet {local_id} synced successfully")
+
+            # Mark failed logs with reason (individual record failures)
+            permanent_codes = self.get_permanent_error_codes() if logs_failed else set()
+            for failed_log in logs_failed:
+                local_id = failed_log.get('id')
+                reason = failed_log.get('reason', 'Unknown error')
+                error_code = failed_log.get('error_code', 0)
+                attempt = (attempts or {}).get(local_id, 0) + 1
+                rejection = (rejections or {}).get(local_id, 0) + 1
+
+                error_msg = f"YAHSHUA Error (code {error_code}): {reason}"
+                stats['failed'] += 1
+
+                if self.is_permanent_rejection(error_code, reason, permanent_codes) or rejection >= MAX_RECORD_REJECTIONS:
+                    # Re-sending will not help - keep it out of the queue
+                    self.database.mark_timesheet_dead_lettered(local_id, error_msg)
+                    stats['dead_lettered'] = stats.get('dead_lettered', 0) + 1
+                    logger.warning(f"Timesheet {local_id} dead-lettered after {rejection} rejections: {error_msg}")
+                    continue
+
+                self.database.mark_timesheet_sync_failed(
+                    local_id, error_msg, next_retry_at=next_record_retry_at(attempt), rejected=True
                 )
-                return True, message, stats
-
-            # Split into batches of 50
-            batches = []
-            for i in range(0, len(all_log_entries), BATCH_SIZE):
-                batches.append(all_log_entries[i:i + BATCH_SIZE])
-
-            stats['batches_total'] = len(batches)
-            logger.info(f"Split {len(all_log_entries)} records into {len(batches)} batches of up to {BATCH_SIZE}")
-
-            batch_error = None
-
-            # Process each batch
-            for batch_num, batch in enumerate(batches, 1):
-                logger.info(f"Processing batch {batch_num}/{len(batches)} ({len(batch)} records)")
-
-                # Emit progress before processing batch
-                if progress_callback:
-                    progress_callback({
-                        'batch_current': batch_num,
-                        'batch_total': len(batches),
-                        'batch_size': len(batch),
-                        'success': stats['success'],
-                        'failed': stats['failed']
-                    })
-
-                # Push batch to YAHSHUA
-                success, result = self.push_batch(token, batch)
-
-                if success:
-                    # Process results for this batch
-                    logs_synced = result.get('logs_successfully_sync', [])
-                    logs_failed = result.get('logs_not_sync', [])
-
-                    # Mark successful logs
-                    for local_id in logs_synced:
-                        self.database.mark_timesheet_synced(local_id, local_id)
-                        stats['success'] += 1
-                        logger.info(f"Timesheet {local_id} synced successfully")
-
-                    # Mark failed logs with reason (individual record failures)
-                    for failed_log in logs_failed:
-                        local_id = failed_log.get('id')
-                        reason = failed_log.get('reason', 'Unknown error')
-                        error_code = failed_log.get('error_code', 0)
-
-                        error_msg = f"YAHSHUA Error (code {error_code}): {reason}"
-                        self.database.mark_timesheet_sync_failed(local_id, error_msg)
-                        stats['failed'] += 1
-                        logger.warning(f"Timesheet {local_id} failed: {error_msg}")
-
-                    stats['batches_completed'] += 1
-                    logger.info(f"Batch {batch_num} completed: {len(logs_synced)} synced, {len(logs_failed)} failed")
-
-                else:
-                    # Batch-level failure (network error, timeout) - STOP immediately
-                    batch_error = result.get('error', 'Unknown error')
-                    logger.error(f"Batch {batch_num} failed: {batch_error} - stopping")
-
-                    # Mark all records in this batch as failed
-                    for log_entry in batch:
-                        self.database.mark_timesheet_sync_failed(
-                            log_entry['id'],
-                            f"Batch {batch_num} failed: {batch_error}"
-                        )
-                        stats['failed'] += 1
-
-                    break  # Stop processing remaining batches
-
-            # Emit final progress (completed)
-            if progress_callback:
-                progress_callback({
-                    'batch_current': stats['batches_completed'],
-                    'batch_total': stats['batches_total'],
-                    'batch_size': 0,
-                    'success': stats['success'],
-                    'failed': stats['failed'],
-                    'completed': True
-                })
-
-            # Update last push time
-            self.database.update_last_sync_time('push')
-
-            # Update sync log
-            status = 'success' if batch_error is None and stats['failed'] == 0 else 'error'
-            self.database.update_sync_log(
-                log_id,
-                status=status,
-                records_processed=stats['processed'],
-                records_success=stats['success'],
-                records_failed=stats['failed']
+                logger.warning(f"Timesheet {local_id} failed: {error_msg}")
+
+            stats['batches_completed'] += 1
+            self.database.record_push_batch_outcome(
+                idempotency_key, 'committed',
+                records_synced=len(logs_synced), records_failed=len(logs_failed)
             )
+            logger.info(f"Batch {batch_num} completed: {len(logs_synced)} synced, {len(logs_failed)} failed")
+            return None
+
+        # Batch-level failure (network error, timeout)
+        batch_error = result.get('error', 'Unknown error')
+        in_doubt = result.get('in_doubt', False)
+        self.database.record_push_batch_outcome(
+            idempotency_key, 'in_doubt' if in_doubt else 'failed', error=batch_error
+        )
+
+        # In-doubt records share one retry time so the batch can be replayed whole
+        shared_retry_at = None
+        if in_doubt:
+            shared_retry_at = next_record_retry_at(max((attempts or {}).get(entry['id'], 0) for entry in batch) + 1)
+
+        # Mark all records in this batch as failed
+        for log_entry in batch:
+            self.database.mark_timesheet_sync_failed(
+                log_entry['id'],
+                f"Batch {batch_num} failed: {batch_error}",
+                next_retry_at=shared_retry_at or next_record_retry_at((attempts or {}).get(log_entry['id'], 0) + 1)
+            )
+            stats['failed'] += 1
 
-            # Build message
-            if batch_error:
-                message = f"Push stopped at batch {stats['batches_completed'] + 1}/{stats['batches_total']}: {batch_error}. {stats['success']} synced, {stats['failed']} failed"
-            elif stats['failed'] > 0:
-                message = f"Push completed ({stats['batches_completed']}/{stats['batches_total']} batches): {stats['success']} success, {stats['failed']} failed"
-            else:
-                message = f"Push completed ({stats['batches_completed']} batches): {stats['success']} records synced"
+        stats['batches_failed'] = stats.get('batches_failed', 0) + 1
+        return batch_error
 
-            logger.info(message)
-            return batch_error is None, message, stats
+    def get_permanent_error_codes(self):
+        """Get the YAHSHUA error codes that mean a record can never sync (defaults plus configured)"""
+        config = self.database.get_api_config() or {}
+        raw = config.get('push_permanent_error_codes') or ''
+        return set(DEFAULT_PERMANENT_ERROR_CODES) | {code.strip() for code in str(raw).split(',') if code.strip()}
 
-        except Exception as e:
-            error_msg = f"Push sync error: {str(e)}"
-            logger.error(error_msg, exc_info=True)
-            self.database.update_sync_log(
-                log_id, 'error', error_message=error_msg
-            )
-            return False, error_msg, stats
+    def is_permanent_rejection(self, error_code, reason, permanent_codes):
+        """Check whether a logs_not_sync rejection will fail again however often it is re-sent"""
+        if error_code:
+            return str(error_code) in permanent_codes
+        reason = str(reason or '').lower()
+        return any(keyword in reason for keyword in PERMANENT_REJECTION_KEYWORDS)
 
-    def push_batch(self, token, log_list):
+    def record_cancelled(self, log_id, stats, reason):
+        """
+        Close a cancelled push run
+
+        Results of the batches that were answered are already written;
+        records never sent stay unsynced for the next push.
+
+        Returns:
+            tuple: (False, message, stats) with stats['cancelled'] set
+        """
+        stats['cancelled'] = True
+        message = (f"Push cancelled ({reason}) after {stats['batches_completed']}/{stats['batches_total']} batches: "
+                   f"{stats['success']} synced, {stats['failed']} failed")
+        logger.info(message)
+        self.database.update_sync_log(
+            log_id, 'error',
+            records_processed=stats['processed'],
+            records_success=stats['success'],
+            records_failed=stats['failed'],
+            error_message=message,
+            metadata={
+                'cancelled': True,
+                'batches_failed': stats['batches_failed'],
+                'dead_lettered': stats['dead_lettered']
+            }
+        )
+        return False, message, stats
+
+    def build_push_message(self, batch_error, stats, failed_batch=None):
+        """Build the user-facing summary for a push run"""
+        if batch_error:
+            failed_batch = failed_batch or stats['batches_completed'] + 1
+            message = f"Push stopped at batch {failed_batch}/{stats['batches_total']}: {batch_error}. {stats['success']} synced, {stats['failed']} failed"
+        elif stats.get('batches_failed'):
+            message = f"Push completed with {stats['batches_failed']} failed batches ({stats['batches_completed']}/{stats['batches_total']} batches): {stats['success']} success, {stats['failed']} failed"
+        elif stats['failed'] > 0:
+            message = f"Push completed ({stats['batches_completed']}/{stats['batches_total']} batches): {stats['success']} success, {stats['failed']} failed"
+        else:
+            return f"Push completed ({stats['batches_completed']} batches): {stats['success']} records synced"
+
+        if stats.get('dead_lettered'):
+            message += f" ({stats['dead_lettered']} rejected permanently, moved to dead letters)"
+        return message
+
+    def push_batch(self, token, log_list, idempotency_key=None):
         """
         Push a batch of logs to YAHSHUA
 
         Args:
             token: YAHSHUA auth token
             log_list: List of log entries in YAHSHUA format
+            idempotency_key: Optional push ledger key, sent as Idempotency-Key
 
         Returns:
             tuple: (success: bool, result: dict)
         """
         try:
-            headers = {
-                'Authorization': f'Token {token}'
-            }
-
-            # YAHSHUA API requires:
-            # - from_biometrics: true to extract log_list from wrapper
-            # - from_new_biometrics: true to lookup by employee code (not PK)
-            payload = {
-                "from_biometrics": True,
-                "from_new_biometrics": True,
-                "log_list": log_list
-            }
+            headers = {'Authorization': f'Token {token}'}
+            if idempotency_key:
+                headers['Idempotency-Key'] = idempotency_key
+            payload = self.build_sync_payload(log_list)
 
             logger.info(f"Pushing {len(log_list)} logs to YAHSHUA")
             logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
 
-            response = self.session.post(
-                YAHSHUA_SYNC_URL,
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
+            response = self.post_sync(headers, payload)
 
+            if response.status_code == 401:
+                # Token expired: re-authenticate (one login shared by all batches
+                # that got a 401) and retry once with the new token
+                logger.warning("Token expired, re-authenticating...")
+                new_token = self.token_manager.refresh(stale_token=token)
+                headers['Authorization'] = f'Token {new_token}'
+                response = self.post_sync(headers, payload)
+
+            return self.read_sync_response(response)
+
+        except requests.exceptions.ConnectTimeout:
+            return transport_failure('Connection timeout', reached_server=False)
+        except requests.exceptions.Timeout:
+            return transport_failure('Request timeout', reached_server=True)
+        except requests.exceptions.ConnectionError as e:
+            return transport_failure('Connection error', reached_server=not self.is_connect_failure(e))
+        except Exception as e:
+            return False, {'error': str(e)}
+
+    def is_connect_failure(self, error):
+        """Whether a requests ConnectionError happened before a connection was opened"""
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def build_sync_payload(self, log_list):
+        """Wrap log entries in the sync-time-in-out request body"""
+        # YAHSHUA API requires:
+        # - from_biometrics: true to extract log_list from wrapper
+        # - from_new_biometrics: true to lookup by employee code (not PK)
+        return {
+            "from_biometrics": True,
+            "from_new_biometrics": True,
+            "log_list": log_list
+        }
+
+    def read_sync_response(self, response):
+        """
+        Turn a sync-time-in-out response into a push_batch result
+
+        Shared by both engines (response needs status_code, text and json()).
+        A 401 here is the answer to the request already re-sent with a new
+        token.
+
+        Returns:
+            tuple: (success: bool, result: dict). Failed results carry
+                   'retryable' and 'in_doubt' flags.
+        """
+        status_code = response.status_code
+
+        if status_code == 401:
+            return False, {'error': 'Authentication failed after retry: HTTP 401'}
+
+        if status_code == 200:
+            # Success or partial success
             data = response.json()
             logger.info(f"YAHSHUA response: {json.dumps(data)}")
+            return True, data
 
-            if response.status_code == 200:
-                # Success or partial success
+        if status_code == 400:
+            # Bad request - check for partial success
+            data = response.json()
+            logger.info(f"YAHSHUA response: {json.dumps(data)}")
+            if data.get('logs_successfully_sync') or data.get('logs_not_sync'):
                 return True, data
+            return False, {'error': data.get('message', 'Bad request')}
 
-            elif response.status_code == 400:
-                # Bad request - check for partial success
-                if data.get('logs_successfully_sync'):
-                    return True, data
-                return False, {'error': data.get('message', 'Bad request')}
+        return False, {
+            'error': f'HTTP {status_code}: {response.text[:200]}',
+            'retryable': status_code >= 500 or status_code in THROTTLE_STATUS_CODES,
+            'in_doubt': status_code in IN_DOUBT_STATUS_CODES
+        }
 
-            elif response.status_code == 401:
-                # Token expired, try to re-authenticate
-                logger.warning("Token expired, re-authenticating...")
-                self.database.update_push_token(None)
-                new_token = self.authenticate()
-                # Retry once with new token
-                headers['Authorization'] = f'Token {new_token}'
-                retry_response = self.session.post(
-                    YAHSHUA_SYNC_URL,
-                    headers=headers,
-                    json=payload,
-                    timeout=60
-                )
-                if retry_response.status_code == 200:
-                    return True, retry_response.json()
-                return False, {'error': f'Authentication failed after retry: HTTP {retry_response.status_code}'}
+    def post_sync(self, headers, payload):
+        """
+        POST a payload to sync-time-in-out, compressed if enabled for the run
 
-            else:
-                return False, {'error': f'HTTP {response.status_code}: {response.text[:200]}'}
+        If the server does not accept the compressed body, the request is
+        sent again as plain JSON and compression stays off for the session.
+        """
+        compression = COMPRESSION_NONE if self.compression_rejected else self.compression
+        body, encoding_headers, raw_size = encode_payload(payload, compression)
 
-        except requests.exceptions.Timeout:
-            return False, {'error': 'Request timeout'}
-        except requests.exceptions.ConnectionError:
-            return False, {'error': 'Connection error'}
-        except Exception as e:
-            return False, {'error': str(e)}
+        response = self.session.post(
+            f"{self.base_url}{YAHSHUA_SYNC_PATH}",
+            headers={**headers, **encoding_headers},
+            data=body,
+            timeout=60
+        )
+        self.payload_meter.record(raw_size, len(body), compression == COMPRESSION_GZIP)
+
+        if compression == COMPRESSION_GZIP and is_compression_rejected(response.status_code, response.text):
+            logger.warning(f"YAHSHUA rejected gzip request body (HTTP {response.status_code}), falling back to plain JSON")
+            self.compression_rejected = True
+            return self.post_sync(headers, payload)
+
+        return response
 
     def invalidate_token(self):
         """Invalidate the current token (force re-authentication)"""
         self.database.update_push_token(None)
+        self.token_manager.invalidate()
         logger.info("Push token invalidated")
@@ -0,0 +1,203 @@
+"""
+San Beda Integration Tool - Client-side Rate Limiting
+Token buckets per upstream host, shared by pull, auth and push requests.
+
+Every request to a host takes a token from that host's bucket first; when
+the bucket is empty the caller waits until the next token is due. Buckets
+refill at the configured rate (requests per second) up to the burst size.
+A 429 or 503 answer with a Retry-After header pauses the whole bucket, so
+every thread and coroutine talking to that host backs off together.
+
+Rates come from api_config (pull_rate_limit / push_rate_limit, 0 = no
+limit) and are applied by the services at the start of each run.
+"""
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Defaults for new installs (requests per second, burst size)
+DEFAULT_PULL_RATE = 5.0
+DEFAULT_PULL_BURST = 10
+DEFAULT_PUSH_RATE = 5.0
+DEFAULT_PUSH_BURST = 10
+
+# Responses whose Retry-After header pauses the bucket
+RETRY_AFTER_STATUS_CODES = (429, 503)
+
+# Never pause a host longer than this, whatever Retry-After says
+MAX_RETRY_AFTER_SECONDS = 300
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date)
+
+    Returns:
+        float: Seconds to wait (capped), or None if missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return max(0.0, min(seconds, MAX_RETRY_AFTER_SECONDS))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for one upstream host
+
+    reserve() takes a token and returns how long the caller must wait
+    before sending, so the same bucket works for blocking threads
+    (acquire) and coroutines (await asyncio.sleep(reserve())).
+    """
+
+    def __init__(self, rate=0.0, burst=1):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.burst = 1
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.configure(rate, burst)
+
+        self.requests = 0
+        self.waited_requests = 0
+        self.wait_seconds = 0.0
+        self.retry_after_pauses = 0
+
+    def configure(self, rate, burst):
+        """
+        Set the refill rate and burst size
+
+        Args:
+            rate: Requests per second (0 or less = unlimited)
+            burst: Requests that may be sent back to back after an idle period
+        """
+        with self._lock:
+            was_unlimited = self.rate == 0
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = max(1, int(burst or 1))
+            if was_unlimited:
+                # Start full rather than from whatever an unlimited bucket held
+                self.tokens = float(self.burst)
+                self.updated = time.monotonic()
+            else:
+                self.tokens = min(self.tokens, self.burst)
+
+    def reserve(self):
+        """
+        Take a token
+
+        Returns:
+            float: Seconds to wait before sending (0 if a token was available)
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self.blocked_until - now)
+
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Tokens may go negative: later callers queue behind earlier ones
+                self.tokens -= 1
+                if self.tokens < 0:
+                    delay = max(delay, -self.tokens / self.rate)
+
+            self.requests += 1
+            if delay > 0:
+                self.waited_requests += 1
+                self.wait_seconds += delay
+            return delay
+
+    def acquire(self):
+        """Take a token, sleeping until it is due; returns the seconds waited"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def observe(self, status_code, retry_after=None):
+        """Pause the bucket if a response asks the client to back off"""
+        if status_code not in RETRY_AFTER_STATUS_CODES:
+            return
+        seconds = parse_retry_after(retry_after)
+        if not seconds:
+            return
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.retry_after_pauses += 1
+        logger.warning(f"Server asked to retry after {seconds:.1f}s (HTTP {status_code}), pausing requests")
+
+    def snapshot(self):
+        """Current counters, for measuring one run with metrics_since()"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'waited_requests': self.waited_requests,
+                'wait_seconds': self.wait_seconds,
+                'retry_after_pauses': self.retry_after_pauses
+            }
+
+    def metrics_since(self, snapshot):
+        """Limiter activity since snapshot, for the sync_logs metadata"""
+        now = self.snapshot()
+        return {
+            'rate_limit': self.rate,
+            'rate_limit_wait_seconds': round(now['wait_seconds'] - snapshot['wait_seconds'], 3),
+            'rate_limited_requests': now['waited_requests'] - snapshot['waited_requests'],
+            'retry_after_pauses': now['retry_after_pauses'] - snapshot['retry_after_pauses']
+        }
+
+
+def host_of(url):
+    """Get the bucket key (host[:port]) of a URL or bare host"""
+    if '//' not in url:
+        url = f"http://{url}"
+    return urlparse(url).netloc.lower()
+
+
+def get_bucket(host):
+    """Get the shared bucket for a host, creating an unlimited one on first use"""
+    key = host_of(host)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket()
+        return bucket
+
+
+def configure_bucket(host, rate, burst):
+    """Apply the configured rate and burst to a host's bucket and return it"""
+    bucket = get_bucket(host)
+    bucket.configure(rate, burst)
+    return bucket
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """requests transport adapter that takes a token before every request"""
+
+    def send(self, request, **kwargs):
+        bucket = get_bucket(request.url)
+        bucket.acquire()
+        response = super().send(request, **kwargs)
+        bucket.observe(response.status_code, response.headers.get('Retry-After'))
+        return response
@@ -1,29 +1,110 @@
 """
 San Beda Integration Tool - Sync Scheduler
 Automated scheduling for pull and push sync operations
+
+Besides the fixed intervals, pushes are event-driven (api_config.push_on_pull):
+a pull that inserted rows, or an unsynced backlog at or above
+push_backlog_threshold, requests a push that starts push_debounce_seconds
+later. Requests arriving in the meantime join that push; a request while a
+push is running schedules one more push after it. The interval push stays
+as a fallback.
+
+Jobs run on a JobScheduler: a timer heap that sleeps until the next job is
+due and a small worker pool, so a long pull does not hold up the push or
+cleanup, and two runs of the same job never overlap. Pulls and pushes are
+then run through the JobCoordinator shared with the UI, so a scheduled run
+never races a manual one: it is queued behind it instead.
+With the async engine a job only starts the run (submit_pull /
+submit_push) and finishes from its completion callback, so no worker waits
+on it.
+
+While the connectivity monitor reports an upstream host unreachable
+(api_config.connectivity_checks), scheduled pulls and pushes are deferred
+without a request or a sync_logs row, and run as soon as the host is back.
+
+With api_config.adaptive_intervals on (opt-in), the configured pull and
+push intervals are a starting point: AdaptiveIntervalPolicy picks each next
+interval from the unsynced backlog, the hourly attendance pattern and
+recent failures, within the configured minimum and maximum.
+
+The next and last run of the pull, push and cleanup jobs are kept in the
+schedule_state table. On startup a job whose saved next run is still ahead
+keeps that time; a job that came due while the app was closed runs once
+(however many runs were missed), pull first, then push, then cleanup,
+a few seconds apart so the catch-up does not pile up on startup.
+
+Database maintenance (services/db_maintenance) runs daily at
+api_config.maintenance_time. It gives way to any pull or push; what it
+could not finish is retried until maintenance_window_minutes have passed.
+It is not caught up on startup, since it is meant for off-peak hours only.
 """
 
-import schedule
 import threading
-import time
 import logging
+import time
 from datetime import datetime, timedelta
+from .connectivity import ConnectivityMonitor
+from .db_maintenance import DatabaseMaintenance, TASK_ERROR, TASK_YIELDED
+from .interval_policy import AdaptiveIntervalPolicy
+from .job_coordinator import JobCoordinator
+from .job_scheduler import JobScheduler
 
 logger = logging.getLogger(__name__)
 
 # Records older than this will be auto-deleted
 CLEANUP_DAYS = 60
 
+# Event-driven push defaults (api_config push_debounce_seconds / push_backlog_threshold)
+DEFAULT_PUSH_DEBOUNCE_SECONDS = 10
+DEFAULT_PUSH_BACKLOG_THRESHOLD = 200
+
+# How often the local unsynced backlog is counted
+BACKLOG_CHECK_SECONDS = 60
+
+# Jobs whose schedule is persisted, in catch-up order
+PERSISTED_JOBS = ('pull', 'push', 'cleanup')
+
+# Missed runs start this long after startup, one job every CATCH_UP_STAGGER_SECONDS
+CATCH_UP_DELAY_SECONDS = 10
+CATCH_UP_STAGGER_SECONDS = 30
+
+# Database maintenance defaults (api_config maintenance_time / maintenance_window_minutes)
+DEFAULT_MAINTENANCE_TIME = "03:00"
+DEFAULT_MAINTENANCE_WINDOW_MINUTES = 120
+
+# Maintenance that gave way to a sync is retried after this long
+MAINTENANCE_RETRY_SECONDS = 300
+
 
 class SyncScheduler:
     """Scheduler for automated sync operations"""
 
-    def __init__(self, pull_service, push_service, database):
+    def __init__(self, pull_service, push_service, database, coordinator=None):
         self.pull_service = pull_service
         self.push_service = push_service
         self.database = database
         self.running = False
-        self.thread = None
+        self.jobs = JobScheduler()
+        self.jobs.add_listener(self._save_job_state)
+        self.interval_policy = AdaptiveIntervalPolicy(database)
+        # One pull and one push at a time across scheduled and manual runs
+        self.coordinator = coordinator or JobCoordinator()
+
+        # Event-driven push state
+        self.push_on_pull = True
+        self.push_debounce_seconds = DEFAULT_PUSH_DEBOUNCE_SECONDS
+        self.push_backlog_threshold = DEFAULT_PUSH_BACKLOG_THRESHOLD
+        self._push_state_lock = threading.Lock()
+        self._push_timer = None
+        self._event_push_failed = False
+
+        self.maintenance_window_minutes = DEFAULT_MAINTENANCE_WINDOW_MINUTES
+
+        # Jobs deferred while their upstream host was unreachable ('pull', 'push')
+        self.connectivity = ConnectivityMonitor()
+        self.connectivity.add_listener(self.on_host_reachable)
+        self.connectivity_checks = True
+        self._deferred = set()
 
     def start(self):
         """Start the scheduler"""
@@ -34,98 +115,381 @@ class SyncScheduler:
         logger.info("Starting sync scheduler")
         self.running = True
 
-        # Set up schedules based on config
-        self.update_schedules()
+        # Set up schedules based on config, catching up on runs missed while closed
+        self.update_schedules(catch_up=True)
 
-        # Start scheduler thread
-        self.thread = threading.Thread(target=self._run_scheduler, daemon=True)
-        self.thread.start()
+        self.jobs.start()
+        self.connectivity.start()
 
     def stop(self):
         """Stop the scheduler"""
         logger.info("Stopping sync scheduler")
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5)
-
-    def update_schedules(self):
-        """Update schedules based on database config"""
+        with self._push_state_lock:
+            self._push_timer = None
+        self.connectivity.stop()
+        self.jobs.stop()
+
+    def update_schedules(self, catch_up=False):
+        """
+        Update schedules based on database config
+
+        Args:
+            catch_up: Resume the saved schedule and run missed jobs (on startup)
+        """
         try:
             config = self.database.get_api_config()
             if not config:
                 logger.warning("No API config found, using default intervals")
                 pull_interval = 30
                 push_interval = 15
+                config = {}
             else:
                 pull_interval = config.get('pull_interval_minutes', 30)
                 push_interval = config.get('push_interval_minutes', 15)
 
-            # Clear existing schedules
-            schedule.clear()
+            self.push_on_pull = bool(config.get('push_on_pull', 1))
+            self.push_debounce_seconds = max(0, int(config.get('push_debounce_seconds') or DEFAULT_PUSH_DEBOUNCE_SECONDS))
+            self.push_backlog_threshold = int(config.get('push_backlog_threshold') or DEFAULT_PUSH_BACKLOG_THRESHOLD)
+
+            self.interval_policy.configure(config, pull_interval, push_interval)
+            adaptive = self.interval_policy.enabled
+
+            first_runs = {}
+            if catch_up:
+                first_runs = self.restore_schedule({
+                    'pull': pull_interval * 60 if pull_interval > 0 else 0,
+                    'push': push_interval * 60 if push_interval > 0 else 0,
+                    'cleanup': None
+                })
+
+            # Clear existing schedules (pending one-shot runs are kept)
+            self.jobs.clear()
 
             # Schedule pull sync
             if pull_interval > 0:
-                schedule.every(pull_interval).minutes.do(self.run_pull_sync)
-                logger.info(f"Pull sync scheduled every {pull_interval} minutes")
+                if adaptive:
+                    self.jobs.every('pull', self.interval_policy.pull_interval, self.run_pull_sync,
+                                   first_run=first_runs.get('pull'))
+                    logger.info(f"Pull sync scheduled adaptively (nominal {pull_interval} minutes)")
+                else:
+                    self.jobs.every('pull', pull_interval * 60, self.run_pull_sync, first_run=first_runs.get('pull'))
+                    logger.info(f"Pull sync scheduled every {pull_interval} minutes")
 
             # Schedule push sync
             if push_interval > 0:
-                schedule.every(push_interval).minutes.do(self.run_push_sync)
-                logger.info(f"Push sync scheduled every {push_interval} minutes")
+                if adaptive:
+                    self.jobs.every('push', self.interval_policy.push_interval, self.run_push_sync,
+                                   first_run=first_runs.get('push'))
+                    logger.info(f"Push sync scheduled adaptively (nominal {push_interval} minutes)")
+                else:
+                    self.jobs.every('push', push_interval * 60, self.run_push_sync, first_run=first_runs.get('push'))
+                    logger.info(f"Push sync scheduled every {push_interval} minutes")
+
+            # Event-driven push: watch the local backlog (interval push remains the fallback)
+            if self.push_on_pull:
+                self.jobs.every('backlog', BACKLOG_CHECK_SECONDS, self.check_push_backlog)
+                logger.info(f"Event-driven push enabled (debounce {self.push_debounce_seconds}s, "
+                            f"backlog threshold {self.push_backlog_threshold})")
 
             # Schedule daily cleanup of old records (runs at 2:00 AM)
-            schedule.every().day.at("02:00").do(self.run_cleanup)
+            self.jobs.daily_at('cleanup', "02:00", self.run_cleanup, first_run=first_runs.get('cleanup'))
             logger.info(f"Cleanup scheduled daily at 02:00 AM (deletes records older than {CLEANUP_DAYS} days)")
 
+            # Schedule database maintenance in the off-peak window (after cleanup frees pages)
+            if config.get('maintenance_enabled', 1):
+                self.maintenance_window_minutes = int(
+                    config.get('maintenance_window_minutes') or DEFAULT_MAINTENANCE_WINDOW_MINUTES)
+                maintenance_time = config.get('maintenance_time') or DEFAULT_MAINTENANCE_TIME
+                try:
+                    self.jobs.daily_at('maintenance', maintenance_time, self.run_maintenance)
+                except ValueError:
+                    logger.warning(f"Invalid maintenance_time '{maintenance_time}', using {DEFAULT_MAINTENANCE_TIME}")
+                    maintenance_time = DEFAULT_MAINTENANCE_TIME
+                    self.jobs.daily_at('maintenance', maintenance_time, self.run_maintenance)
+                logger.info(f"Database maintenance scheduled daily at {maintenance_time} "
+                            f"({self.maintenance_window_minutes} minute window)")
+
+            self.update_connectivity_checks(config)
+
         except Exception as e:
             logger.error(f"Error updating schedules: {e}")
 
-    def _run_scheduler(self):
-        """Run the scheduler loop"""
-        logger.info("Scheduler loop started")
-
-        while self.running:
-            try:
-                schedule.run_pending()
-                time.sleep(1)
-            except Exception as e:
-                logger.error(f"Scheduler loop error: {e}", exc_info=True)
+    def restore_schedule(self, intervals):
+        """
+        Work out first run times from the saved schedule state
 
-        logger.info("Scheduler loop stopped")
+        Args:
+            intervals: {job key: interval seconds (None for daily jobs, 0 if disabled)}
 
-    def run_pull_sync(self):
-        """Execute pull sync"""
+        Returns:
+            dict: {job key: first run (epoch seconds)}; jobs not listed use their normal schedule
+        """
+        try:
+            state = self.database.get_schedule_state()
+        except Exception as e:
+            logger.error(f"Error loading schedule state: {e}", exc_info=True)
+            return {}
+
+        now = time.time()
+        first_runs = {}
+        overdue = []
+        for key in PERSISTED_JOBS:
+            saved = state.get(key)
+            if intervals.get(key) == 0 or not saved or not saved['next_run']:
+                continue
+            next_run = datetime.fromisoformat(str(saved['next_run'])).timestamp()
+            if next_run <= now:
+                overdue.append((key, saved['next_run']))
+            elif intervals.get(key):
+                # Keep the saved time, unless the interval was shortened since
+                first_runs[key] = min(next_run, now + intervals[key])
+
+        for position, (key, due) in enumerate(overdue):
+            delay = CATCH_UP_DELAY_SECONDS + position * CATCH_UP_STAGGER_SECONDS
+            first_runs[key] = now + delay
+            logger.info(f"{key} was due at {due} while the app was closed, running it in {delay}s")
+        return first_runs
+
+    def _save_job_state(self, job):
+        """Persist a recurring job's next and last run (JobScheduler listener)"""
+        if job.key not in PERSISTED_JOBS or not job.recurring:
+            return
+        try:
+            self.database.save_schedule_state(
+                job.key,
+                datetime.fromtimestamp(job.next_run),
+                datetime.fromtimestamp(job.last_run) if job.last_run else None
+            )
+        except Exception as e:
+            logger.error(f"Error saving {job.key} schedule state: {e}")
+
+    def update_connectivity_checks(self, config):
+        """Watch the configured San Beda and YAHSHUA hosts (api_config.connectivity_checks)"""
+        self.connectivity_checks = bool(config.get('connectivity_checks', 1))
+        if self.connectivity_checks and config.get('pull_host'):
+            self.connectivity.watch('pull', config['pull_host'])
+        else:
+            self.connectivity.unwatch('pull')
+        if self.connectivity_checks:
+            self.connectivity.watch('push', self.push_service.get_base_url(config))
+        else:
+            self.connectivity.unwatch('push')
+
+        with self._push_state_lock:
+            self._deferred.clear()
+
+    def is_upstream_available(self, name):
+        """
+        Check an upstream before a scheduled job, deferring the job if it is down
+
+        Args:
+            name: 'pull' (San Beda) or 'push' (YAHSHUA)
+
+        Returns:
+            bool: Whether the job should run now
+        """
+        if not self.connectivity_checks or self.connectivity.is_available(name):
+            return True
+        with self._push_state_lock:
+            self._deferred.add(name)
+        logger.info(f"Scheduled {name} sync deferred: host unreachable, will run when it is back")
+        return False
+
+    def on_host_reachable(self, name):
+        """Run a job deferred while its host was unreachable (connectivity listener)"""
+        with self._push_state_lock:
+            deferred = name in self._deferred
+            self._deferred.discard(name)
+        if not deferred or not self.running:
+            return
+        logger.info(f"{name} host reachable again, running deferred {name} sync")
+        if name == 'pull':
+            self.jobs.run_now('pull', self.run_pull_sync, 'connectivity restored')
+        else:
+            self.jobs.run_now('push', self.run_push_sync, 'connectivity restored')
+
+    def get_job_status(self):
+        """Running, queued and recent pull/push jobs plus the timer schedule"""
+        return {**self.coordinator.get_status(), 'schedule': self.jobs.get_jobs()}
+
+    def get_connectivity_status(self):
+        """Reachability of the watched hosts and the jobs waiting for them"""
+        with self._push_state_lock:
+            deferred = sorted(self._deferred)
+        return {
+            'enabled': self.connectivity_checks,
+            'hosts': self.connectivity.snapshot(),
+            'deferred': deferred
+        }
+
+    def run_pull_sync(self, trigger='interval'):
+        """
+        Execute pull sync, first finishing any interrupted pull
+
+        Args:
+            trigger: What started the pull; manual pulls skip the connectivity check
+
+        Returns:
+            JobHandle: The coordinated run (None if deferred)
+        """
+        if trigger != 'manual' and not self.is_upstream_available('pull'):
+            return None
+        return self.coordinator.submit('pull', self._scheduled_pull, trigger=trigger, background=False)
+
+    def _scheduled_pull(self, cancel_token=None):
         logger.info("Scheduled pull sync starting")
+        if hasattr(self.pull_service, 'submit_pull'):
+            return self._submit_scheduled_pull(cancel_token)
         try:
-            success, message, stats = self.pull_service.pull_data()
-            if success:
-                logger.info(f"Scheduled pull sync completed: {message}")
-            else:
-                logger.error(f"Scheduled pull sync failed: {message}")
+            run = self.pull_service.get_resumable_run()
+            if run:
+                logger.info(f"Resuming interrupted pull {run['run_id']} ({run['date_from']} to {run['date_to']})")
+                success, message, stats = self.pull_service.pull_data(
+                    run['date_from'], run['date_to'], cancel_token=cancel_token
+                )
+                if not success:
+                    logger.error(f"Resumed pull failed: {message}")
+                if cancel_token and cancel_token.cancelled:
+                    return success, message, stats
         except Exception as e:
-            logger.error(f"Scheduled pull sync error: {e}", exc_info=True)
+            logger.error(f"Resumed pull error: {e}", exc_info=True)
+
+        return self._scheduled_pull_done(*self.pull_service.pull_data(cancel_token=cancel_token))
+
+    def _submit_scheduled_pull(self, cancel_token):
+        """
+        The runs of _scheduled_pull on the async engine, chained by completion callbacks
 
-    def run_push_sync(self):
-        """Execute push sync"""
+        Returns:
+            concurrent.futures.Future: Result of the last pull
+        """
+        def pull_latest():
+            return self.pull_service.submit_pull(cancel_token=cancel_token, on_done=self._scheduled_pull_done)
+
+        try:
+            run = self.pull_service.get_resumable_run()
+        except Exception as e:
+            logger.error(f"Resumed pull error: {e}", exc_info=True)
+            run = None
+        if not run:
+            return pull_latest()
+
+        def resumed(success, message, stats):
+            if not success:
+                logger.error(f"Resumed pull failed: {message}")
+            if cancel_token and cancel_token.cancelled:
+                return success, message, stats
+            return pull_latest()
+
+        logger.info(f"Resuming interrupted pull {run['run_id']} ({run['date_from']} to {run['date_to']})")
+        return self.pull_service.submit_pull(
+            run['date_from'], run['date_to'], cancel_token=cancel_token, on_done=resumed
+        )
+
+    def _scheduled_pull_done(self, success, message, stats):
+        if success:
+            logger.info(f"Scheduled pull sync completed: {message}")
+            self.notify_pull_completed(stats)
+        else:
+            logger.error(f"Scheduled pull sync failed: {message}")
+        return success, message, stats
+
+    def run_push_sync(self, trigger='interval'):
+        """
+        Execute push sync
+
+        Only one push runs at a time (scheduled or from the UI); a push
+        requested while one is running starts right after it.
+
+        Args:
+            trigger: What started the push; manual pushes skip the connectivity check
+
+        Returns:
+            JobHandle: The coordinated run (None if deferred)
+        """
+        if trigger != 'manual' and not self.is_upstream_available('push'):
+            return None
+        return self.coordinator.submit('push', self._scheduled_push, trigger=trigger, background=False)
+
+    def _scheduled_push(self, cancel_token=None):
         logger.info("Scheduled push sync starting")
+        if hasattr(self.push_service, 'submit_push'):
+            # Async engine: finished by the push's completion callback
+            return self.push_service.submit_push(cancel_token=cancel_token, on_done=self._scheduled_push_done)
         try:
-            success, message, stats = self.push_service.push_data()
-            if success:
-                logger.info(f"Scheduled push sync completed: {message}")
-            else:
-                logger.error(f"Scheduled push sync failed: {message}")
+            success, message, stats = self.push_service.push_data(cancel_token=cancel_token)
+        except Exception:
+            self._event_push_failed = True
+            raise
+        return self._scheduled_push_done(success, message, stats)
+
+    def _scheduled_push_done(self, success, message, stats):
+        # A failed push pauses event triggers until a push succeeds again
+        self._event_push_failed = not success
+        if success:
+            logger.info(f"Scheduled push sync completed: {message}")
+        else:
+            logger.error(f"Scheduled push sync failed: {message}")
+        return success, message, stats
+
+    def request_push(self, reason):
+        """
+        Ask for an event-driven push after the debounce delay
+
+        Requests are dropped when event-driven push is disabled, the
+        scheduler is stopped, or the last push failed (the interval push
+        retries instead). Requests during the debounce join the pending push.
+
+        Returns:
+            bool: Whether a push is now pending
+        """
+        if not self.push_on_pull or not self.running:
+            return False
+        if self._event_push_failed:
+            logger.info(f"Push requested ({reason}) but the last push failed, waiting for the interval push")
+            return False
+
+        with self._push_state_lock:
+            if self._push_timer or 'push' in self._deferred:
+                # Already pending, or waiting for YAHSHUA to be reachable again
+                return True
+            logger.info(f"Push requested ({reason}), starting in {self.push_debounce_seconds}s")
+            self._push_timer = self.jobs.run_later('push', self.push_debounce_seconds, self._run_requested_push, reason)
+        return True
+
+    def _run_requested_push(self, reason):
+        with self._push_state_lock:
+            self._push_timer = None
+        if self.running:
+            self.run_push_sync(trigger=reason)
+
+    def notify_pull_completed(self, stats):
+        """Request a push when a successful pull inserted new rows"""
+        inserted = (stats or {}).get('inserted', 0)
+        if inserted:
+            self.request_push(f"pull inserted {inserted} records")
+        else:
+            self.check_push_backlog()
+
+    def check_push_backlog(self):
+        """Request a push when the unsynced backlog reaches the threshold"""
+        try:
+            backlog = self.database.count_unsynced_timesheets()
+            if backlog and backlog >= self.push_backlog_threshold:
+                self.request_push(f"backlog of {backlog} unsynced records")
         except Exception as e:
-            logger.error(f"Scheduled push sync error: {e}", exc_info=True)
+            logger.error(f"Backlog check error: {e}", exc_info=True)
 
     def trigger_pull_now(self):
         """Manually trigger pull sync immediately"""
         logger.info("Manual pull sync triggered")
-        threading.Thread(target=self.run_pull_sync, daemon=True).start()
+        self.jobs.run_now('pull', self.run_pull_sync, 'manual')
 
     def trigger_push_now(self):
         """Manually trigger push sync immediately"""
         logger.info("Manual push sync triggered")
-        threading.Thread(target=self.run_push_sync, daemon=True).start()
+        self.jobs.run_now('push', self.run_push_sync, 'manual')
 
     def run_cleanup(self):
         """Delete timesheet records older than CLEANUP_DAYS"""
@@ -145,6 +509,10 @@ class SyncScheduler:
             conn.commit()
             conn.close()
 
+            # Drop fingerprints of the removed days so a re-pull restores them
+            last_deleted_day = (datetime.strptime(cutoff_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+            self.database.delete_day_fingerprints(date_to=last_deleted_day)
+
             # Log the cleanup event
             message = f"Auto-cleanup: deleted {deleted_count} records older than {cutoff_date}"
             self.database.log_other_event(message)
@@ -159,7 +527,45 @@ class SyncScheduler:
             # Log the error
             self.database.log_other_event(f"Auto-cleanup failed: {str(e)}", status="error")
 
+    def sync_needs_database(self):
+        """Whether a pull or push is running or queued (maintenance gives way)"""
+        return self.coordinator.is_running('pull') or self.coordinator.is_running('push')
+
+    def run_maintenance(self, tasks=None, window_end=None):
+        """
+        Run database maintenance and record the outcome as an 'other' event
+
+        Args:
+            tasks: Task names still to run (default: all)
+            window_end: Epoch seconds after which tasks that gave way to a
+                sync are not retried (default: maintenance window from now)
+        """
+        if window_end is None:
+            window_end = time.time() + self.maintenance_window_minutes * 60
+        logger.info("Database maintenance starting")
+        try:
+            results = DatabaseMaintenance(self.database, self.sync_needs_database).run(tasks)
+        except Exception as e:
+            logger.error(f"Maintenance error: {e}", exc_info=True)
+            self.database.log_other_event(f"Database maintenance failed: {str(e)}", status="error")
+            return
+
+        summary = ", ".join(f"{r['task']} {r['status']} ({r['detail']}, {r['seconds']}s)" for r in results)
+        failed = any(r['status'] == TASK_ERROR for r in results)
+        self.database.log_other_event(f"Database maintenance: {summary}", status="error" if failed else "success")
+
+        remaining = [r['task'] for r in results if r['status'] == TASK_YIELDED]
+        if remaining and self.running and time.time() + MAINTENANCE_RETRY_SECONDS < window_end:
+            logger.info(f"Maintenance gave way to a sync, retrying {', '.join(remaining)} "
+                        f"in {MAINTENANCE_RETRY_SECONDS}s")
+            self.jobs.run_later('maintenance', MAINTENANCE_RETRY_SECONDS, self.run_maintenance, remaining, window_end)
+
+    def trigger_maintenance_now(self):
+        """Manually trigger database maintenance immediately"""
+        logger.info("Manual database maintenance triggered")
+        self.jobs.run_now('maintenance', self.run_maintenance)
+
     def trigger_cleanup_now(self):
         """Manually trigger cleanup immediately"""
         logger.info("Manual cleanup triggered")
-        threading.Thread(target=self.run_cleanup, daemon=True).start()
+        self.jobs.run_now('cleanup', self.run_cleanup)
@@ -0,0 +1,286 @@
+"""
+San Beda Integration Tool - Token Manager
+Keeps one upstream's auth token in memory and shares every refresh.
+
+Each upstream (San Beda, YAHSHUA) has one TokenManager. The token and the
+time it was obtained are loaded from api_config once and then kept in
+memory, so batches and pages no longer read the database for it.
+
+When several requests get a 401 at the same time, the first caller logs in
+and the others wait for that login and share its token (or its error)
+instead of each sending their own. A caller whose rejected token was already
+replaced gets the new token without logging in again. The same applies to
+coroutines on the async engine loop via refresh_async().
+
+If a token lifetime is configured (api_config pull_token_lifetime_minutes /
+push_token_lifetime_minutes), get_token() refreshes the token shortly
+before the lifetime ends instead of waiting for the server to reject it.
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Refresh this long before the configured lifetime ends (at most half the lifetime)
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+
+class TokenManager:
+    """
+    In-memory token for one upstream with single-flight refreshes
+
+    login is the service's real authentication (returns the new token);
+    login_async is its coroutine counterpart on the async engine.
+    """
+
+    def __init__(self, name, database, token_field, created_field, lifetime_field, login, login_async=None):
+        self.name = name
+        self.database = database
+        self.token_field = token_field
+        self.created_field = created_field
+        self.lifetime_field = lifetime_field
+        self.login = login
+        self.login_async = login_async
+
+        self._cond = threading.Condition()
+        self._loaded = False
+        self.token = None
+        self.obtained_at = None
+        self.lifetime_seconds = None
+
+        # Thread refreshes: the current one's generation and the last outcome
+        self._refreshing = False
+        self._generation = 0
+        self._outcome = (None, None)
+
+        # Coroutine refresh in progress (future shared by all waiters)
+        self._async_flight = None
+
+        self.refreshes = 0
+        self.proactive_refreshes = 0
+        self.coalesced_waiters = 0
+
+    def configure(self, config):
+        """Apply the configured token lifetime (api_config row)"""
+        with self._cond:
+            self._loaded = self._loaded or self._load_from(config)
+            self.lifetime_seconds = self._lifetime_from(config)
+
+    def _lifetime_from(self, config):
+        try:
+            minutes = float((config or {}).get(self.lifetime_field) or 0)
+        except (TypeError, ValueError):
+            minutes = 0
+        return minutes * 60 if minutes > 0 else None
+
+    def _load_from(self, config):
+        """Take the stored token and its creation time from an api_config row"""
+        if not config:
+            return False
+        self.token = config.get(self.token_field)
+        self.obtained_at = None
+        if self.token and config.get(self.created_field):
+            try:
+                self.obtained_at = datetime.fromisoformat(str(config[self.created_field]))
+            except ValueError:
+                pass
+        self.lifetime_seconds = self._lifetime_from(config)
+        return True
+
+    def _load(self):
+        # Caller holds self._cond
+        if not self._loaded:
+            self._loaded = self._load_from(self.database.get_api_config())
+
+    def _set(self, token):
+        # Caller holds self._cond
+        self.token = token
+        self.obtained_at = datetime.now()
+        self._loaded = True
+
+    def store(self, token):
+        """Remember a token the service just obtained (called after every login)"""
+        with self._cond:
+            self._set(token)
+
+    def invalidate(self):
+        """Forget the in-memory token (the service clears the stored one)"""
+        with self._cond:
+            self.token = None
+            self.obtained_at = None
+            self._loaded = True
+
+    def get_age_seconds(self):
+        """Seconds since the current token was obtained (None if unknown)"""
+        with self._cond:
+            if self.obtained_at is None:
+                return None
+            return (datetime.now() - self.obtained_at).total_seconds()
+
+    def _refresh_due(self):
+        # Caller holds self._cond
+        if not self.token:
+            return True
+        if not self.lifetime_seconds or self.obtained_at is None:
+            return False
+        margin = min(TOKEN_REFRESH_MARGIN_SECONDS, self.lifetime_seconds / 2)
+        age = (datetime.now() - self.obtained_at).total_seconds()
+        return age >= self.lifetime_seconds - margin
+
+    def get_token(self):
+        """
+        Get the current token, logging in if there is none or it is about to expire
+
+        A failed proactive refresh keeps the current token; the server
+        decides whether it is still accepted.
+
+        Returns:
+            str: Token
+        """
+        with self._cond:
+            self._load()
+            token = self.token
+            due = self._refresh_due()
+        if not due:
+            return token
+        if not token:
+            logger.info(f"No {self.name} token, authenticating...")
+            return self.refresh()
+
+        logger.info(f"{self.name} token is near the end of its lifetime, refreshing")
+        try:
+            with self._cond:
+                self.proactive_refreshes += 1
+            return self.refresh(stale_token=token)
+        except Exception as e:
+            logger.warning(f"Proactive {self.name} token refresh failed, keeping current token: {e}")
+            return token
+
+    def refresh(self, stale_token=None):
+        """
+        Replace a rejected token, sharing one login between concurrent callers
+
+        Args:
+            stale_token: Token the caller saw rejected (None = no token yet)
+
+        Returns:
+            str: New token
+
+        Raises:
+            Exception: The shared login's error
+        """
+        with self._cond:
+            self._load()
+            if self._refreshing:
+                # Another thread is logging in: wait for it and share its outcome
+                generation = self._generation
+                self.coalesced_waiters += 1
+                while self._generation == generation:
+                    self._cond.wait()
+                token, error = self._outcome
+                if error is not None or not token:
+                    raise Exception(str(error or f"{self.name} authentication did not complete"))
+                return token
+
+            if self.token and self.token != stale_token:
+                return self.token
+            self._refreshing = True
+
+        token = None
+        error = None
+        try:
+            token = self.login()
+            return token
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._cond:
+                if token:
+                    self._set(token)
+                    self.refreshes += 1
+                self._refreshing = False
+                self._generation += 1
+                self._outcome = (token, error)
+                self._cond.notify_all()
+
+    async def get_token_async(self):
+        """Coroutine counterpart of get_token() for the async engine"""
+        with self._cond:
+            self._load()
+            token = self.token
+            due = self._refresh_due()
+        if not due:
+            return token
+        if not token:
+            logger.info(f"No {self.name} token, authenticating...")
+            return await self.refresh_async()
+
+        logger.info(f"{self.name} token is near the end of its lifetime, refreshing")
+        try:
+            with self._cond:
+                self.proactive_refreshes += 1
+            return await self.refresh_async(stale_token=token)
+        except Exception as e:
+            logger.warning(f"Proactive {self.name} token refresh failed, keeping current token: {e}")
+            return token
+
+    async def refresh_async(self, stale_token=None):
+        """Coroutine counterpart of refresh(): one login_async shared by all waiting coroutines"""
+        with self._cond:
+            self._load()
+            flight = self._async_flight
+            if flight is None:
+                if self.token and self.token != stale_token:
+                    return self.token
+                flight = self._async_flight = asyncio.get_running_loop().create_future()
+                owner = True
+            else:
+                self.coalesced_waiters += 1
+                owner = False
+
+        if not owner:
+            return await asyncio.shield(flight)
+
+        try:
+            token = await self.login_async()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark the error as retrieved when no other coroutine was waiting
+            flight.exception()
+            raise
+        else:
+            flight.set_result(token)
+            return token
+        finally:
+            with self._cond:
+                if flight.done() and not flight.cancelled() and flight.exception() is None:
+                    self._set(flight.result())
+                    self.refreshes += 1
+                self._async_flight = None
+
+    def snapshot(self):
+        """Current counters, for measuring one run with metrics_since()"""
+        with self._cond:
+            return {
+                'refreshes': self.refreshes,
+                'proactive_refreshes': self.proactive_refreshes,
+                'coalesced_waiters': self.coalesced_waiters
+            }
+
+    def metrics_since(self, snapshot):
+        """Token activity since snapshot, for the sync_logs metadata"""
+        now = self.snapshot()
+        age = self.get_age_seconds()
+        return {
+            'token_refreshes': now['refreshes'] - snapshot['refreshes'],
+            'token_proactive_refreshes': now['proactive_refreshes'] - snapshot['proactive_refreshes'],
+            'token_refresh_waiters': now['coalesced_waiters'] - snapshot['coalesced_waiters'],
+            'token_age_seconds': round(age) if age is not None else None
+        }
@@ -0,0 +1,239 @@
+"""
+San Beda Integration Tool - Shared HTTP Transport
+One set of connection pools for every requests-based service.
+
+Each service keeps its own requests.Session (headers differ: the pull
+session carries the San Beda token), but all sessions mount the same
+transport adapters, so connections to BRMS and YAHSHUA are pooled and kept
+alive across AuthService, PullService and PushService. Requests go through
+the per-host rate limiter (see rate_limit).
+
+Connect and read timeouts are separate: the connect timeout comes from
+api_config.http_connect_timeout, the read timeout from each call site
+unless api_config.http_read_timeout overrides it. Connections opened, TLS
+handshakes and requests are counted per host; the async engine reports
+into the same counters.
+"""
+
+import logging
+import socket
+import threading
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .rate_limit import RateLimitedAdapter
+
+logger = logging.getLogger(__name__)
+
+# Host pools kept by each adapter, and connections kept per host. Sized for
+# the parallel modes: up to MAX_IN_FLIGHT_LIMIT (16) push batches at once.
+POOL_HOSTS = 10
+POOL_CONNECTIONS_PER_HOST = 16
+
+# Default timeouts in seconds (api_config http_connect_timeout / http_read_timeout)
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+# Idle pooled connections are closed after this long (async engine)
+IDLE_CONNECTION_SECONDS = 60
+
+# Idle pooled connections are probed with TCP keep-alives instead of being
+# silently dropped by NAT gateways and firewalls
+KEEPALIVE_IDLE_SECONDS = 30
+KEEPALIVE_INTERVAL_SECONDS = 10
+KEEPALIVE_PROBES = 3
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'San Beda Integration Tool/1.0',
+    'Accept': 'application/json'
+}
+
+_timeouts = {'connect': DEFAULT_CONNECT_TIMEOUT, 'read': None}
+
+
+def get_keepalive_socket_options():
+    """TCP keep-alive socket options supported on this platform"""
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE_SECONDS))
+    elif hasattr(socket, 'TCP_KEEPALIVE'):  # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, KEEPALIVE_IDLE_SECONDS))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL_SECONDS))
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES))
+    return options
+
+
+def configure_timeouts(config):
+    """Apply the configured connect/read timeouts (api_config row) to all sessions"""
+    config = config or {}
+    try:
+        connect = float(config.get('http_connect_timeout') or DEFAULT_CONNECT_TIMEOUT)
+    except (TypeError, ValueError):
+        connect = DEFAULT_CONNECT_TIMEOUT
+    try:
+        read = float(config['http_read_timeout']) if config.get('http_read_timeout') else None
+    except (TypeError, ValueError):
+        read = None
+    _timeouts['connect'] = connect
+    _timeouts['read'] = read
+
+
+def get_timeouts(read_timeout):
+    """
+    Resolve the timeouts for one request
+
+    Args:
+        read_timeout: The call site's read timeout (used unless overridden)
+
+    Returns:
+        tuple: (connect seconds, read seconds)
+    """
+    return _timeouts['connect'], _timeouts['read'] or read_timeout
+
+
+class TransportMetrics:
+    """Thread-safe per-host request and connection counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        return self._hosts.setdefault(host, {'requests': 0, 'connections_opened': 0, 'tls_handshakes': 0})
+
+    def record_request(self, host):
+        with self._lock:
+            self._host(host)['requests'] += 1
+
+    def record_connection(self, host, tls=False):
+        with self._lock:
+            counters = self._host(host)
+            counters['connections_opened'] += 1
+            if tls:
+                counters['tls_handshakes'] += 1
+
+    def snapshot(self, host=None):
+        """
+        Current counters for one host (host[:port]) or all hosts
+
+        Returns:
+            dict: Counters, or {host: counters} when host is None
+        """
+        with self._lock:
+            if host is not None:
+                return dict(self._hosts.get(host, {'requests': 0, 'connections_opened': 0, 'tls_handshakes': 0}))
+            return {name: dict(counters) for name, counters in self._hosts.items()}
+
+    def metrics_since(self, host, snapshot):
+        """Connection activity for one host since snapshot, for the sync_logs metadata"""
+        now = self.snapshot(host)
+        requests_sent = now['requests'] - snapshot['requests']
+        opened = now['connections_opened'] - snapshot['connections_opened']
+        return {
+            'http_requests': requests_sent,
+            'connections_opened': opened,
+            'connections_reused': max(0, requests_sent - opened),
+            'tls_handshakes': now['tls_handshakes'] - snapshot['tls_handshakes']
+        }
+
+
+transport_metrics = TransportMetrics()
+
+
+def host_key(host, port, default_port):
+    return host.lower() if port in (None, default_port) else f"{host.lower()}:{port}"
+
+
+def url_host(url):
+    """Get the metrics key (host, plus port if not the default) of a URL or bare host[:port]"""
+    if '//' not in url:
+        url = f"http://{url}"
+    parsed = requests.utils.urlparse(url)
+    return host_key(parsed.hostname or '', parsed.port, 443 if parsed.scheme == 'https' else 80)
+
+
+class _MeteredHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        transport_metrics.record_connection(host_key(self.host, self.port, 80))
+
+
+class _MeteredHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        transport_metrics.record_connection(host_key(self.host, self.port, 443), tls=True)
+
+
+class _MeteredHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _MeteredHTTPConnection
+
+
+class _MeteredHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _MeteredHTTPSConnection
+
+
+class TransportAdapter(RateLimitedAdapter):
+    """
+    Shared adapter: keep-alive sockets, metered connection pools, split
+    connect/read timeouts and the per-host rate limit
+    """
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault('socket_options', get_keepalive_socket_options())
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _MeteredHTTPConnectionPool,
+            'https': _MeteredHTTPSConnectionPool
+        }
+
+    def send(self, request, timeout=None, **kwargs):
+        if not isinstance(timeout, tuple):
+            timeout = get_timeouts(timeout)
+        transport_metrics.record_request(url_host(request.url))
+        return super().send(request, timeout=timeout, **kwargs)
+
+    def close(self):
+        # Sessions come and go; the shared pools live until close_transport()
+        pass
+
+    def close_pools(self):
+        super().close()
+
+
+_adapter = None
+_adapter_lock = threading.Lock()
+
+
+def get_adapter():
+    """Get the process-wide transport adapter"""
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            _adapter = TransportAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST)
+        return _adapter
+
+
+def create_session(headers=None):
+    """
+    Create a requests.Session that uses the shared connection pools
+
+    Args:
+        headers: Extra default headers for this session
+    """
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers.update(headers or {})
+    adapter = get_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def close_transport():
+    """Close all pooled connections (application shutdown)"""
+    with _adapter_lock:
+        if _adapter is not None:
+            _adapter.close_pools()
@@ -117,6 +117,20 @@ class BridgeService {
     return this.call('getUnsyncedTimesheets', limit)
   }
 
+  async getDeadLetters(limit = 1000, offset = 0) {
+    return this.call('getDeadLetters', limit, offset)
+  }
+
+  // Only the given ids; pass all = true to apply to every dead letter
+  async requeueDeadLetters(ids = [], all = false) {
+    return this.call('requeueDeadLetters', JSON.stringify(ids), all)
+  }
+
+  // Only the given ids; pass all = true to apply to every dead letter
+  async discardDeadLetters(ids = [], all = false) {
+    return this.call('discardDeadLetters', JSON.stringify(ids), all)
+  }
+
   async retryFailedTimesheet(timesheetId) {
     return this.call('retryFailedTimesheet', timesheetId)
   }
@@ -133,14 +147,38 @@ class BridgeService {
 
   // ==================== SYNC METHODS ====================
 
-  async startPullSync(dateFrom, dateTo) {
-    return this.call('startPullSync', dateFrom, dateTo)
+  async startPullSync(dateFrom, dateTo, force = false) {
+    return this.call('startPullSync', dateFrom, dateTo, force)
+  }
+
+  async getResumablePull() {
+    return this.call('getResumablePull')
+  }
+
+  async resumePullSync() {
+    return this.call('resumePullSync')
   }
 
   async startPushSync() {
     return this.call('startPushSync')
   }
 
+  // Running, queued and recent pull/push jobs
+  async getSyncJobs() {
+    return this.call('getSyncJobs')
+  }
+
+  // Status and result of one job, by the id returned when it was started
+  async getSyncJob(jobId) {
+    return this.call('getSyncJob', jobId)
+  }
+
+  // A queued job is dropped, a running one stops after the current step;
+  // poll getSyncJob for its final state
+  async cancelSyncJob(jobId) {
+    return this.call('cancelSyncJob', jobId)
+  }
+
   async getSyncLogs() {
     return this.call('getSyncLogs')
   }
@@ -183,6 +221,16 @@ class BridgeService {
     return this.call('triggerCleanup')
   }
 
+  // Reachability of the San Beda and YAHSHUA hosts as seen by the scheduler
+  async getConnectivityStatus() {
+    return this.call('getConnectivityStatus')
+  }
+
+  // Runs database maintenance now (it gives way to a running sync)
+  async triggerMaintenance() {
+    return this.call('triggerMaintenance')
+  }
+
   // ==================== SYSTEM LOG METHODS ====================
 
   async getSystemLogFiles() {